@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+
+#===- cindex-bench.py - cindex/Python Benchmarks -------------*- python -*--===#
+#
+#                     The LLVM Compiler Infrastructure
+#
+# This file is distributed under the University of Illinois Open Source
+# License. See LICENSE.TXT for details.
+#
+#===------------------------------------------------------------------------===#
+
+"""
+Benchmarks for the cindex bindings.
+
+The inputs are generated in memory by scaling up the kinds of sources used by
+tests/cindex (structs, functions, an include hierarchy with guarded and
+repeated headers, deliberate warnings), in C or C++. Each benchmark is run
+several times and summarized by its median, mean and variance:
+
+  cindex-bench.py --scale 20 --output new.json
+
+Real source files, or directories of them, can be given instead, in which
+case each benchmark is timed over all of them:
+
+  cindex-bench.py --output new.json tests/cindex/INPUTS
+
+Results can be compared to a previous run; benchmarks whose median got
+slower by more than the threshold, and by more than the noise of the
+baseline, are reported as regressions and make the script exit with 1, as are
+benchmarks which worked in the baseline but fail now:
+
+  cindex-bench.py --scale 20 --baseline old.json
+"""
+
+import json
+import math
+import os
+import sys
+import time
+
+# Input generation.
+
+def generate_inputs(scale, lang='c'):
+    """Return (filename, args, unsaved_files, completion position) for a
+    synthetic translation unit with roughly 40 * scale lines per file."""
+    if lang == 'cpp':
+        ext, args = 'cpp', ['-std=c++11']
+    else:
+        ext, args = 'c', []
+    main = 'bench.%s' % ext
+
+    headers = []
+    for h in range(1, 4):
+        lines = ['#ifndef HEADER%d' % h, '#define HEADER%d' % h]
+        if h < 3:
+            lines.append('#include "header3.h"')
+        for i in range(scale):
+            lines.append('struct s%d_%d { int x; int y; char *name; };' %
+                         (h, i))
+            lines.append('int h%d_%d(struct s%d_%d *p);' % (h, i, h, i))
+            lines.append('#define H%d_MACRO_%d(a) ((a) + %d)' % (h, i, i))
+        lines.append('#endif')
+        headers.append(('header%d.h' % h, '\n'.join(lines) + '\n'))
+
+    lines = ['#include "header1.h"', '#include "header2.h"',
+             '#include "header1.h"', '']
+    if lang == 'cpp':
+        lines.append('namespace bench {')
+        for i in range(scale):
+            lines.extend([
+                'template <typename T> class Box%d {' % i,
+                'public:',
+                '  Box%d(T v) : value(v) {}' % i,
+                '  T get() const { return value; }',
+                'private:',
+                '  T value;',
+                '};',
+            ])
+        lines.append('}')
+    for i in range(scale):
+        lines.extend([
+            'typedef int I%d;' % i,
+            'struct point%d { I%d x; I%d y; };' % (i, i, i),
+            'int norm%d(struct point%d p) {' % (i, i),
+            '  int unused%d;' % i,
+            '  if (p.x > p.y)',
+            '    return H1_MACRO_%d(p.x * p.x + p.y * p.y);' % i,
+            '}',
+            'int call%d(struct s1_%d *s) {' % (i, i),
+            '  struct point%d p = { 1, 2 };' % i,
+            '  return norm%d(p) + h1_%d(s);' % (i, i),
+            '}',
+            '',
+        ])
+    lines.append('int main(void) {')
+    lines.append('  struct point0 p;')
+    completion = (len(lines) + 1, 5)
+    lines.append('  p.x = 0;')
+    lines.append('  return 0;')
+    lines.append('}')
+
+    unsaved_files = [(main, '\n'.join(lines) + '\n')] + headers
+    return main, args + ['-Wall'], unsaved_files, completion
+
+# The extensions of the source files benchmarked, and their arguments.
+SOURCE_ARGS = {
+    '.c' : [],
+    '.m' : [],
+    '.cc' : ['-std=c++11'],
+    '.cpp' : ['-std=c++11'],
+    '.cxx' : ['-std=c++11'],
+    '.mm' : ['-std=c++11'],
+}
+
+def find_sources(paths):
+    """Return the source files among paths and in the directories among
+    them, sorted."""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources.extend(os.path.join(path, name)
+                           for name in os.listdir(path)
+                           if os.path.splitext(name)[1] in SOURCE_ARGS)
+        else:
+            sources.append(path)
+    return sorted(sources)
+
+def load_inputs(path):
+    """Return (filename, args, unsaved_files, completion position) for a
+    source file, with the contents of the file as unsaved file and the
+    directory of the file in the include path. Completion is run at the
+    start of the last line."""
+    contents = open(path).read()
+    args = SOURCE_ARGS.get(os.path.splitext(path)[1], [])
+    args = args + ['-I', os.path.dirname(path) or '.', '-Wall']
+    completion = (max(contents.count('\n'), 1), 1)
+    return path, args, [(path, contents)], completion
+
+# Benchmarks.
+#
+# Each benchmark is a function taking the inputs and returning a (setup, run)
+# pair. setup() is called before every timed run() and returns its argument,
+# so that state memoized by the bindings (e.g. cursor attributes) does not
+# carry over from one run to the next.
+
+def _parse(inputs, options=0):
+    from clang.cindex import TranslationUnit
+    filename, args, unsaved_files, _ = inputs
+    return TranslationUnit.from_source(filename, args, unsaved_files, options)
+
+def bench_parse(inputs):
+    return (lambda: None), (lambda _: _parse(inputs))
+
+def bench_reparse(inputs):
+    from clang.cindex import TranslationUnit
+    tu = _parse(inputs, TranslationUnit.PARSE_PRECOMPILED_PREAMBLE)
+    return (lambda: None), (lambda _: tu.reparse(inputs[2]))
+
+def bench_walk(inputs):
+    tu = _parse(inputs)
+    return (lambda: None), (lambda _: list(tu.cursor.walk()))
+
+def bench_attributes(inputs):
+    tu = _parse(inputs)
+    def run(cursors):
+        for cursor in cursors:
+            cursor.kind
+            cursor.spelling
+            cursor.location
+            cursor.extent
+            cursor.type.kind
+    # Skip the translation unit cursor itself.
+    return (lambda: list(tu.cursor.walk())[1:]), run
+
+def bench_diagnostics(inputs):
+    tu = _parse(inputs)
+    def run(_):
+        for diag in tu.diagnostics:
+            diag.severity
+            diag.location
+            diag.spelling
+            diag.option
+    return (lambda: None), run
+
+def bench_includes(inputs):
+    tu = _parse(inputs)
+    def run(_):
+        for include in tu.get_includes():
+            include.source
+            include.include
+            include.location
+    return (lambda: None), run
+
+def bench_completion(inputs):
+    from clang.cindex import TranslationUnit
+    tu = _parse(inputs, TranslationUnit.PARSE_PRECOMPILED_PREAMBLE |
+                        TranslationUnit.PARSE_CACHE_COMPLETION_RESULTS)
+    filename, _, unsaved_files, (line, column) = inputs
+    def run(_):
+        results = tu.codeComplete(filename, line, column, unsaved_files)
+        if results is None:
+            raise Exception('code completion failed')
+        for result in results.results:
+            result.string
+    return (lambda: None), run
+
+# Tokens are not benchmarked: the bindings do not expose clang_tokenize yet.
+BENCHMARKS = [
+    ('parse', bench_parse),
+    ('reparse', bench_reparse),
+    ('walk', bench_walk),
+    ('attributes', bench_attributes),
+    ('diagnostics', bench_diagnostics),
+    ('includes', bench_includes),
+    ('completion', bench_completion),
+]
+
+# Running and summarizing.
+
+def summarize(samples):
+    """Return the summary statistics of a list of timings."""
+    ordered = sorted(samples)
+    n = len(ordered)
+    if n % 2:
+        median = ordered[n // 2]
+    else:
+        median = (ordered[n // 2 - 1] + ordered[n // 2]) / 2.0
+    mean = sum(ordered) / n
+    if n > 1:
+        variance = sum((s - mean) ** 2 for s in ordered) / (n - 1)
+    else:
+        variance = 0.0
+    return {'median' : median,
+            'mean' : mean,
+            'variance' : variance,
+            'min' : ordered[0],
+            'max' : ordered[-1],
+            'samples' : samples}
+
+def run_benchmark(function, inputs_list, repeat, warmup):
+    """Time a benchmark run over all of the inputs at once."""
+    pairs = [function(inputs) for inputs in inputs_list]
+    def setup():
+        return [pair[0]() for pair in pairs]
+    def run(states):
+        for pair, state in zip(pairs, states):
+            pair[1](state)
+    samples = []
+    for i in range(warmup + repeat):
+        state = setup()
+        start = time.time()
+        run(state)
+        elapsed = time.time() - start
+        if i >= warmup:
+            samples.append(elapsed)
+    return summarize(samples)
+
+def run_benchmarks(names, scale, lang, repeat, warmup, sources=None):
+    """Run the benchmarks on generated inputs, or on the given source files
+    if there are any."""
+    if sources:
+        inputs_list = [load_inputs(path) for path in sources]
+    else:
+        inputs_list = [generate_inputs(scale, lang)]
+    results = {}
+    for name, function in BENCHMARKS:
+        if names and name not in names:
+            continue
+        try:
+            results[name] = run_benchmark(function, inputs_list, repeat,
+                                          warmup)
+        except Exception as e:
+            results[name] = {'error' : '%s: %s' % (e.__class__.__name__, e)}
+    if sources:
+        # The generation parameters do not apply.
+        scale = lang = None
+    return {'scale' : scale,
+            'lang' : lang,
+            'files' : sources or None,
+            'repeat' : repeat,
+            'lines' : sum(c.count('\n') for inputs in inputs_list
+                          for _, c in inputs[2]),
+            'benchmarks' : results}
+
+def compare(results, baseline, threshold):
+    """Compare results to a baseline.
+
+    Returns a list of (name, baseline median, median, ratio, regressed)
+    tuples. A benchmark regressed if its median is more than threshold
+    (relative) slower, and slower by more than three standard deviations of
+    the baseline. A benchmark which fails but did not fail in the baseline
+    also regressed, with a median and ratio of None.
+    """
+    comparisons = []
+    for name, result in sorted(results['benchmarks'].items()):
+        base = baseline.get('benchmarks', {}).get(name)
+        if base is None or 'error' in base:
+            continue
+        if 'error' in result:
+            comparisons.append((name, base['median'], None, None, True))
+            continue
+        old, new = base['median'], result['median']
+        if old > 0:
+            ratio = new / old
+        else:
+            ratio = float('inf')
+        noise = 3 * math.sqrt(base['variance'])
+        regressed = new > old * (1 + threshold) and new - old > noise
+        comparisons.append((name, old, new, ratio, regressed))
+    return comparisons
+
+def main():
+    from optparse import OptionParser
+
+    parser = OptionParser("usage: %prog [options] [source or directory...]")
+    parser.add_option("", "--scale", dest="scale",
+                      help="Scale the inputs by N [default=%default]",
+                      metavar="N", type=int, default=10)
+    parser.add_option("", "--lang", dest="lang",
+                      help="Generate inputs in LANG, c or cpp "
+                           "[default=%default]",
+                      metavar="LANG", type="choice", choices=['c', 'cpp'],
+                      default='c')
+    parser.add_option("", "--repeat", dest="repeat",
+                      help="Time each benchmark N times [default=%default]",
+                      metavar="N", type=int, default=5)
+    parser.add_option("", "--warmup", dest="warmup",
+                      help="Untimed runs before timing [default=%default]",
+                      metavar="N", type=int, default=1)
+    parser.add_option("", "--only", dest="only",
+                      help="Only run the given benchmark (may be repeated)",
+                      metavar="NAME", action="append", default=[])
+    parser.add_option("", "--output", dest="output",
+                      help="Write the JSON results to FILE instead of stdout",
+                      metavar="FILE", type=str, default=None)
+    parser.add_option("", "--baseline", dest="baseline",
+                      help="Compare against the JSON results in FILE",
+                      metavar="FILE", type=str, default=None)
+    parser.add_option("", "--threshold", dest="threshold",
+                      help="Relative slowdown reported as a regression "
+                           "[default=%default]",
+                      type=float, default=0.1)
+    (opts, args) = parser.parse_args()
+
+    for path in args:
+        if not os.path.exists(path):
+            parser.error('no such file or directory: %s' % path)
+    sources = find_sources(args)
+    if args and not sources:
+        parser.error('no source files in: %s' % ', '.join(args))
+    if opts.repeat < 1:
+        parser.error('--repeat must be at least 1')
+    known = [name for name, _ in BENCHMARKS]
+    for name in opts.only:
+        if name not in known:
+            parser.error('unknown benchmark %r, expected one of: %s' % (
+                    name, ', '.join(known)))
+
+    results = run_benchmarks(opts.only, opts.scale, opts.lang, opts.repeat,
+                             opts.warmup, sources)
+
+    if opts.output:
+        out = open(opts.output, 'w')
+    else:
+        out = sys.stdout
+    json.dump(results, out, indent=2, sort_keys=True)
+    out.write('\n')
+    if out is not sys.stdout:
+        out.close()
+
+    for name, result in sorted(results['benchmarks'].items()):
+        if 'error' in result:
+            print >>sys.stderr, 'error: %s: %s' % (name, result['error'])
+
+    if opts.baseline:
+        baseline = json.load(open(opts.baseline))
+        for key in ('scale', 'lang', 'files'):
+            if baseline.get(key) != results[key]:
+                print >>sys.stderr, 'warning: baseline %s is %r, not %r' % (
+                    key, baseline.get(key), results[key])
+        regressions = 0
+        print >>sys.stderr, '%-12s %12s %12s %8s' % ('benchmark', 'baseline',
+                                                     'current', 'ratio')
+        for name, old, new, ratio, regressed in compare(results, baseline,
+                                                        opts.threshold):
+            flag = ''
+            if regressed:
+                flag = '  REGRESSION'
+                regressions += 1
+            if new is None:
+                print >>sys.stderr, '%-12s %12.6f %12s %8s%s' % (
+                    name, old, 'error', '', flag)
+                continue
+            print >>sys.stderr, '%-12s %12.6f %12.6f %8.3f%s' % (
+                name, old, new, ratio, flag)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
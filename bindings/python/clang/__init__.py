@@ -15,10 +15,36 @@ This package provides access to the Clang compiler and libraries.
 
 The available modules are:
 
+  astdump
+
+    Compact binary dumps of cursor trees, readable without libclang.
+
   cindex
 
     Bindings for the Clang indexing library.
+
+  macros
+
+    Macro usage aggregated over many translation units.
+
+  outline
+
+    Fast declaration indexing with outline (body-less) parses.
+
+  refgraph
+
+    Call and reference graphs spanning many translation units.
+
+  server
+
+    A long-lived indexing service answering editor queries over JSON-RPC.
+
+  unitset
+
+    The base class of the collections of data extracted from many
+    translation units in worker processes.
 """
 
-__all__ = ['cindex']
+__all__ = ['astdump', 'cindex', 'macros', 'outline', 'refgraph', 'server',
+           'unitset']
 
@@ -0,0 +1,376 @@
+#===- astdump.py - Compact Binary AST Dumps ------------------*- python -*--===#
+#
+#                     The LLVM Compiler Infrastructure
+#
+# This file is distributed under the University of Illinois Open Source
+# License. See LICENSE.TXT for details.
+#
+#===------------------------------------------------------------------------===#
+
+r"""
+Compact Binary AST Dumps
+========================
+
+This module writes the cursor tree of a translation unit to a compact,
+columnar binary file, and reads such files back without needing libclang.
+Dumps can therefore be produced on a machine with the toolchain and analysed
+anywhere.
+
+The file holds one record per cursor, in preorder, stored as parallel
+columns of little-endian 32-bit integers:
+
+  kinds         CursorKind id.
+  parents       Index of the parent cursor, -1 for the root.
+  subtree_ends  One past the index of the last cursor in the subtree.
+  spellings     String id of the spelling, -1 if none.
+  usrs          String id of the USR, -1 if none.
+  files         File id of the location, -1 if none.
+  lines         Line of the location.
+  columns       Column of the location.
+  offsets       File offset of the location.
+  starts        File offset of the start of the extent.
+  ends          File offset of the end of the extent.
+
+Strings (spellings, USRs and file names) are interned in a string table of
+offsets into a UTF-8 blob. The file starts with a fixed header, followed by a
+table giving the offset and length of every section:
+
+  magic         8 bytes, 'CXASTDMP'.
+  version       uint32.
+  counts        uint32 cursors, uint32 strings, uint32 files.
+  sections      (uint64 offset, uint64 length) for each section, in the
+                order of SECTIONS.
+
+ASTDump maps the file into memory and only decodes the columns and strings
+that a query touches.
+
+Writing requires clang.cindex; reading does not import it.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = 'CXASTDMP'
+VERSION = 1
+
+# The columns, in file order.
+COLUMNS = ('kinds', 'parents', 'subtree_ends', 'spellings', 'usrs', 'files',
+           'lines', 'columns', 'offsets', 'starts', 'ends')
+
+# All sections, in file order.
+SECTIONS = COLUMNS + ('string_offsets', 'string_data', 'file_names')
+
+_HEADER = struct.Struct('<8sIIII')
+_SECTION = struct.Struct('<QQ')
+
+def _to_little_endian(column):
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+def write(cursor, filename):
+    """Dump the tree below a cursor (usually TranslationUnit.cursor).
+
+    The whole tree is visited with a single call into libclang.
+    """
+    from clang import cindex
+
+    lib = cindex.lib
+    tu = cursor.translation_unit
+    table = tu.files
+
+    columns = {}
+    for name in COLUMNS:
+        columns[name] = array('i')
+    strings = {}
+    string_list = []
+
+    def intern(s):
+        if not s:
+            return -1
+        string_id = strings.get(s)
+        if string_id is None:
+            string_id = strings[s] = len(string_list)
+            string_list.append(s)
+        return string_id
+
+    # Only ask for spellings and USRs where libclang provides them. Maps a
+    # kind id to a (has spelling, has USR) pair.
+    kind_info = {}
+    def get_kind_info(kind_id):
+        info = kind_info.get(kind_id)
+        if info is None:
+            try:
+                kind = cindex.CursorKind.from_id(kind_id)
+            except ValueError:
+                # A kind unknown to these bindings.
+                info = kind_info[kind_id] = (False, False)
+                return info
+            is_declaration = kind.is_declaration()
+            info = kind_info[kind_id] = (is_declaration or
+                                         kind.is_reference(), is_declaration)
+        return info
+
+    f, l, c, o = cindex.c_object_p(), cindex.c_uint(), cindex.c_uint(), \
+                 cindex.c_uint()
+    fp, lp, cp, op = (cindex.byref(f), cindex.byref(l), cindex.byref(c),
+                      cindex.byref(o))
+    get_location = lib.clang_getInstantiationLocation
+
+    def add(cursor, parent):
+        index = len(columns['kinds'])
+        kind_id = cursor._kind_id
+        columns['kinds'].append(kind_id)
+        columns['parents'].append(parent)
+        columns['subtree_ends'].append(index + 1)
+
+        has_spelling, has_usr = get_kind_info(kind_id)
+        if has_spelling:
+            spelling = intern(lib.clang_getCursorSpelling(cursor))
+        else:
+            spelling = -1
+        if has_usr:
+            usr = intern(lib.clang_getCursorUSR(cursor))
+        else:
+            usr = -1
+        columns['spellings'].append(spelling)
+        columns['usrs'].append(usr)
+
+        get_location(lib.clang_getCursorLocation(cursor), fp, lp, cp, op)
+        if f:
+            columns['files'].append(table.file_id(table.from_pointer(f)))
+        else:
+            columns['files'].append(-1)
+        columns['lines'].append(l.value)
+        columns['columns'].append(c.value)
+        columns['offsets'].append(o.value)
+
+        extent = lib.clang_getCursorExtent(cursor)
+        get_location(lib.clang_getRangeStart(extent), None, None, None, op)
+        columns['starts'].append(o.value)
+        get_location(lib.clang_getRangeEnd(extent), None, None, None, op)
+        columns['ends'].append(o.value)
+
+    for child, parent in cursor.walk(parents=True):
+        add(child, parent)
+
+    # In preorder, the descendants of a cursor follow it: a subtree ends
+    # where the subtree of its last child ends.
+    subtree_ends = columns['subtree_ends']
+    parents = columns['parents']
+    for index in xrange(len(parents) - 1, 0, -1):
+        parent = parents[index]
+        if subtree_ends[index] > subtree_ends[parent]:
+            subtree_ends[parent] = subtree_ends[index]
+
+    file_names = array('i', [intern(table[i].name)
+                             for i in range(len(table))])
+    string_offsets = array('I', [0])
+    for s in string_list:
+        string_offsets.append(string_offsets[-1] + len(s))
+
+    sections = [_to_little_endian(columns[name]).tostring()
+                for name in COLUMNS]
+    sections.append(_to_little_endian(string_offsets).tostring())
+    sections.append(''.join(string_list))
+    sections.append(_to_little_endian(file_names).tostring())
+
+    out = open(filename, 'wb')
+    try:
+        out.write(_HEADER.pack(MAGIC, VERSION, len(columns['kinds']),
+                               len(string_list), len(file_names)))
+        position = _HEADER.size + _SECTION.size * len(sections)
+        for data in sections:
+            out.write(_SECTION.pack(position, len(data)))
+            position += len(data)
+        for data in sections:
+            out.write(data)
+    finally:
+        out.close()
+
+class ASTDump(object):
+    """
+    A read-only view of a file written by write().
+
+    Cursors are identified by their preorder index; the root is 0. Columns
+    are decoded on first use and strings are decoded on demand.
+    """
+
+    def __init__(self, filename):
+        """Map the dump in the given file into memory."""
+        self._fd = open(filename, 'rb')
+        self._map = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.num_cursors, self.num_strings, self.num_files = \
+            _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not an AST dump' % filename)
+        if version != VERSION:
+            raise ValueError('Unsupported AST dump version %d in %s' %
+                             (version, filename))
+
+        self._sections = {}
+        for i, name in enumerate(SECTIONS):
+            self._sections[name] = _SECTION.unpack_from(
+                self._map, _HEADER.size + i * _SECTION.size)
+
+        self._columns = {}
+        self._string_ids = None
+
+    def close(self):
+        """Release the mapping."""
+        self._map.close()
+        self._fd.close()
+
+    def __len__(self):
+        return self.num_cursors
+
+    def column(self, name):
+        """Return a column of COLUMNS, or the string_offsets or file_names
+        section, as an array."""
+        result = self._columns.get(name)
+        if result is None:
+            if name == 'string_offsets':
+                typecode = 'I'
+            else:
+                typecode = 'i'
+            offset, length = self._sections[name]
+            result = array(typecode)
+            result.fromstring(self._map[offset:offset + length])
+            result = _to_little_endian(result)
+            self._columns[name] = result
+        return result
+
+    def string(self, string_id):
+        """Return the string with the given id, or None for -1."""
+        if string_id < 0:
+            return None
+        offsets = self.column('string_offsets')
+        base = self._sections['string_data'][0]
+        return self._map[base + offsets[string_id]:
+                         base + offsets[string_id + 1]]
+
+    def string_id(self, s):
+        """Return the id of a string, or -1 if it does not occur."""
+        if self._string_ids is None:
+            self._string_ids = {}
+            for i in xrange(self.num_strings):
+                self._string_ids[self.string(i)] = i
+        return self._string_ids.get(s, -1)
+
+    # Per-cursor accessors.
+
+    def kind(self, cursor):
+        """Return the CursorKind id of a cursor."""
+        return self.column('kinds')[cursor]
+
+    def parent(self, cursor):
+        """Return the parent of a cursor, or None for the root."""
+        parent = self.column('parents')[cursor]
+        if parent < 0:
+            return None
+        return parent
+
+    def children(self, cursor):
+        """Return the children of a cursor."""
+        ends = self.column('subtree_ends')
+        result = []
+        child = cursor + 1
+        while child < ends[cursor]:
+            result.append(child)
+            child = ends[child]
+        return result
+
+    def spelling(self, cursor):
+        return self.string(self.column('spellings')[cursor])
+
+    def usr(self, cursor):
+        return self.string(self.column('usrs')[cursor])
+
+    def filename(self, cursor):
+        """Return the name of the file the cursor is located in, or None."""
+        file_id = self.column('files')[cursor]
+        if file_id < 0:
+            return None
+        return self.string(self.column('file_names')[file_id])
+
+    def location(self, cursor):
+        """Return the (filename, line, column, offset) of a cursor."""
+        return (self.filename(cursor), self.column('lines')[cursor],
+                self.column('columns')[cursor], self.column('offsets')[cursor])
+
+    def extent(self, cursor):
+        """Return the (start offset, end offset) of a cursor."""
+        return (self.column('starts')[cursor], self.column('ends')[cursor])
+
+    # Queries.
+
+    def find(self, kind=None, spelling=None, usr=None, filename=None):
+        """Return the cursors matching all of the given criteria.
+
+        kind is a CursorKind id; the other criteria are strings.
+        """
+        tests = []
+        if kind is not None:
+            tests.append((self.column('kinds'), kind))
+        for value, name in ((spelling, 'spellings'), (usr, 'usrs')):
+            if value is not None:
+                string_id = self.string_id(value)
+                if string_id < 0:
+                    return []
+                tests.append((self.column(name), string_id))
+        if filename is not None:
+            file_names = self.column('file_names')
+            for file_id in range(self.num_files):
+                if self.string(file_names[file_id]) == filename:
+                    tests.append((self.column('files'), file_id))
+                    break
+            else:
+                return []
+
+        result = []
+        for cursor in xrange(self.num_cursors):
+            for column, value in tests:
+                if column[cursor] != value:
+                    break
+            else:
+                result.append(cursor)
+        return result
+
+def main():
+    from optparse import OptionParser
+
+    parser = OptionParser("usage: %prog [options] {dump-file}")
+    parser.add_option("", "--kind", dest="kind",
+                      help="Only list cursors of kind id N",
+                      metavar="N", type=int, default=None)
+    parser.add_option("", "--spelling", dest="spelling",
+                      help="Only list cursors spelled S",
+                      metavar="S", type=str, default=None)
+    parser.add_option("", "--usr", dest="usr",
+                      help="Only list cursors with the given USR",
+                      type=str, default=None)
+    (opts, args) = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error('invalid number arguments')
+
+    dump = ASTDump(args[0])
+    try:
+        for cursor in dump.find(opts.kind, opts.spelling, opts.usr):
+            print '%d\t%d\t%s\t%s:%d:%d' % ((cursor, dump.kind(cursor),
+                                            dump.spelling(cursor)) +
+                                           dump.location(cursor)[:3])
+    finally:
+        dump.close()
+
+__all__ = [
+    'ASTDump',
+    'write',
+]
+
+if __name__ == '__main__':
+    main()
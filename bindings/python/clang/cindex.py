@@ -62,8 +62,16 @@ call is efficient.
 #
 # o implement additional SourceLocation, SourceRange, and File methods.
 
+from array import array
 from ctypes import *
+import Queue
+import bisect
 import collections
+import os
+import sys
+import threading
+import time
+import weakref
 
 def get_cindex_library():
     # FIXME: It's probably not the case that the library is actually found in
@@ -99,6 +107,14 @@ class TranslationUnitLoadError(Exception):
     """
     pass
 
+class AsyncCancelledError(Exception):
+    """Raised when waiting on an AsyncResult whose operation was cancelled."""
+    pass
+
+class AsyncTimeoutError(Exception):
+    """Raised when an AsyncResult is not done within the given timeout."""
+    pass
+
 class TranslationUnitSaveError(Exception):
     """Represents an error that occurred when saving a TranslationUnit.
 
@@ -237,7 +253,10 @@ class SourceRange(Structure):
         Return a SourceLocation representing the first character within a
         source range.
         """
-        return lib.clang_getRangeStart(self)
+        if not hasattr(self, '_start'):
+            self._start = lib.clang_getRangeStart(self)
+
+        return self._start
 
     @property
     def end(self):
@@ -245,7 +264,10 @@ class SourceRange(Structure):
         Return a SourceLocation representing the last character within a
         source range.
         """
-        return lib.clang_getRangeEnd(self)
+        if not hasattr(self, '_end'):
+            self._end = lib.clang_getRangeEnd(self)
+
+        return self._end
 
     def __eq__(self, other):
         return lib.clang_equalRanges(self, other)
@@ -256,6 +278,110 @@ class SourceRange(Structure):
     def __repr__(self):
         return "<SourceRange start %r, end %r>" % (self.start, self.end)
 
+class DecodedLocations(object):
+    """
+    A batch of decoded source locations, stored as parallel arrays.
+
+    Entry i of file_ids, lines, columns and offsets describes the i-th location
+    handed to decode_locations(). A SourceRange contributes two consecutive
+    entries: its start followed by its end.
+
+    File handles are interned: file_ids holds an index into files, or -1 for
+    locations that do not refer to a file (e.g. builtins).
+    """
+
+    def __init__(self):
+        self.files = []
+        self.file_ids = array('i')
+        self.lines = array('I')
+        self.columns = array('I')
+        self.offsets = array('I')
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __getitem__(self, key):
+        """Return the (file, line, column, offset) tuple for an entry."""
+        file_id = self.file_ids[key]
+        if file_id < 0:
+            f = None
+        else:
+            f = self.files[file_id]
+        return (f, self.lines[key], self.columns[key], self.offsets[key])
+
+def decode_locations(locations, file_table=None):
+    """Decode many SourceLocation and SourceRange instances in one pass.
+
+    This is equivalent to reading file, line, column and offset from every
+    location, but reuses a single set of out parameters for all of the
+    clang_getInstantiationLocation calls and creates one File per distinct
+    file rather than one per location. The decoded values are also stored on
+    each SourceLocation, so later attribute access does not call into libclang
+    again.
+
+    If file_table (a TranslationUnit's FileTable) is given, files are interned
+    through it and the returned file ids are the ids assigned by that table.
+
+    Returns a DecodedLocations instance.
+    """
+    result = DecodedLocations()
+    file_ids = {}
+
+    if file_table is not None:
+        result.files = file_table.files
+
+    f, l, c, o = c_object_p(), c_uint(), c_uint(), c_uint()
+    fp, lp, cp, op = byref(f), byref(l), byref(c), byref(o)
+    get_location = lib.clang_getInstantiationLocation
+
+    def intern(key, fobj):
+        if file_table is not None:
+            if fobj is None:
+                fobj = file_table.from_pointer(f)
+            return file_table.file_id(fobj)
+
+        file_id = file_ids.get(key)
+        if file_id is None:
+            if fobj is None:
+                fobj = File(c_object_p.from_buffer_copy(f))
+            file_id = file_ids[key] = len(result.files)
+            result.files.append(fobj)
+        return file_id
+
+    def decode(location):
+        data = location._data
+        if data is None:
+            get_location(location, fp, lp, cp, op)
+            if f:
+                file_id = intern(cast(f, c_void_p).value, None)
+                fobj = result.files[file_id]
+            else:
+                file_id = -1
+                fobj = None
+            data = (fobj, int(l.value), int(c.value), int(o.value))
+            location._data = data
+        elif data[0] is None:
+            file_id = -1
+        else:
+            file_id = intern(cast(data[0].obj, c_void_p).value, data[0])
+
+        result.file_ids.append(file_id)
+        result.lines.append(data[1])
+        result.columns.append(data[2])
+        result.offsets.append(data[3])
+
+    for location in locations:
+        if isinstance(location, SourceRange):
+            decode(location.start)
+            decode(location.end)
+        elif isinstance(location, SourceLocation):
+            decode(location)
+        else:
+            raise TypeError('Expected SourceLocation or SourceRange, got %r' %
+                            (location,))
+
+    return result
+
 class Diagnostic(object):
     """
     A Diagnostic is a single instance of a Clang diagnostic. It includes the
@@ -933,6 +1059,11 @@ CursorKind.INCLUSION_DIRECTIVE = CursorKind(503)
 
 ### Cursors ###
 
+def _cursor_key(cursor):
+    """Return a hashable value identifying a cursor within a single visit."""
+    return (cursor._kind_id, cursor.xdata, cursor.data[0], cursor.data[1],
+            cursor.data[2])
+
 class Cursor(Structure):
     """
     The Cursor class represents a reference to an element within the AST. It
@@ -978,6 +1109,13 @@ class Cursor(Structure):
         # declaration prior to issuing the lookup.
         return lib.clang_getCursorDefinition(self)
 
+    def get_included_file(self):
+        """Return the File included by an inclusion directive cursor, or
+        None if the file could not be found."""
+        assert self.kind == CursorKind.INCLUSION_DIRECTIVE
+
+        return lib.clang_getIncludedFile(self)
+
     def get_usr(self):
         """Return the Unified Symbol Resultion (USR) for the entity referenced
         by the given cursor (or None).
@@ -987,7 +1125,10 @@ class Cursor(Structure):
         program. USRs can be compared across translation units to determine,
         e.g., when references in one translation refer to an entity defined in
         another translation unit."""
-        return lib.clang_getCursorUSR(self)
+        if not hasattr(self, '_usr'):
+            self._usr = lib.clang_getCursorUSR(self)
+
+        return self._usr
 
     @property
     def kind(self):
@@ -997,7 +1138,8 @@ class Cursor(Structure):
     @property
     def spelling(self):
         """Return the spelling of the entity pointed at by the cursor."""
-        if not self.kind.is_declaration():
+        kind = self.kind
+        if not (kind.is_declaration() or kind.is_preprocessing()):
             # FIXME: clang_getCursorSpelling should be fixed to not assert on
             # this, for consistency with clang_getCursorUSR.
             return None
@@ -1156,6 +1298,17 @@ class Cursor(Structure):
 
         return self._lexical_parent
 
+    @property
+    def referenced(self):
+        """
+        For a cursor that is a reference, return a cursor representing the
+        entity that it references (or None).
+        """
+        if not hasattr(self, '_referenced'):
+            self._referenced = lib.clang_getCursorReferenced(self)
+
+        return self._referenced
+
     @property
     def translation_unit(self):
         """Returns the TranslationUnit to which this Cursor belongs."""
@@ -1181,6 +1334,196 @@ class Cursor(Structure):
             children)
         return iter(children)
 
+    def walk(self, files=None, main_file_only=False, parents=False):
+        """Return an iterator over this cursor and all of its descendants.
+
+        Cursors are produced in preorder. Unlike recursing through
+        get_children(), the whole subtree is visited with a single call into
+        libclang.
+
+        The walk can be restricted to cursors located in certain files by
+        passing an iterable of file names or File instances as files, or by
+        setting main_file_only to only visit the main file of the translation
+        unit. A cursor outside of those files is skipped together with its
+        entire subtree. The check compares the raw file pointer of the
+        cursor's location, so skipped cursors get no translation unit
+        bookkeeping, no SourceLocation decoding and no File object. (ctypes
+        still builds the Cursor structures passed to the visitor.) The
+        starting cursor itself is always produced.
+
+        If parents is true, (cursor, parent) pairs are produced instead, where
+        parent is the position of the parent cursor in the produced sequence,
+        or -1 for the starting cursor. ValueError is raised if libclang
+        visits a cursor whose parent is not among its ancestors.
+        """
+        tu = self._tu
+
+        allowed = None
+        if main_file_only:
+            files = list(files or []) + [tu.spelling]
+        if files is not None:
+            allowed = set()
+            for f in files:
+                if isinstance(f, File):
+                    ptr = f.obj
+                else:
+                    ptr = lib.clang_getFile(tu, f)
+                if ptr:
+                    allowed.add(cast(ptr, c_void_p).value)
+
+        location_file = c_object_p()
+        location_file_value = c_void_p.from_buffer(location_file)
+        location_file_p = byref(location_file)
+        get_location = lib.clang_getInstantiationLocation
+        get_cursor_location = lib.clang_getCursorLocation
+
+        def visitor(child, parent, cursors):
+            if allowed is not None:
+                get_location(get_cursor_location(child), location_file_p,
+                             None, None, None)
+                if location_file_value.value not in allowed:
+                    return 1 # continue
+
+            # Create reference to TU so it isn't GC'd before Cursor.
+            child._tu = tu
+            if stack is not None:
+                # Children are visited right after their parent's subtree
+                # was entered, so the parent is on the stack of ancestors.
+                parent_key = _cursor_key(parent)
+                top = len(stack) - 1
+                while top >= 0 and stack[top][0] != parent_key:
+                    top -= 1
+                if top < 0:
+                    # Raising here would only print the exception; stop
+                    # and raise once the visit returns.
+                    orphans.append(child)
+                    return 0 # break
+                del stack[top + 1:]
+                parent_indices.append(stack[-1][1])
+                stack.append((_cursor_key(child), len(cursors)))
+            cursors.append(child)
+            return 2 # recurse
+        cursors = [self]
+        stack = parent_indices = None
+        # The cursors whose parent is not among their visited ancestors.
+        orphans = []
+        if parents:
+            stack = [(_cursor_key(self), 0)]
+            parent_indices = [-1]
+        lib.clang_visitChildren(self, callbacks['cursor_visit'](visitor),
+            cursors)
+        if orphans:
+            raise ValueError('The parent of cursor %s was not visited' %
+                             orphans[0].kind)
+        if parents:
+            return iter(zip(cursors, parent_indices))
+        return iter(cursors)
+
+    def find(self, **criteria):
+        """Return the cursors at or below this cursor matching criteria.
+
+        The criteria are the arguments of CursorQuery, e.g.
+
+          cursor.find(kind=CursorKind.CALL_EXPR, spelling='malloc',
+                      within=CursorKind.FUNCTION_DECL)
+
+        Cursors are returned in preorder.
+        """
+        return self.find_all([CursorQuery(**criteria)])[0]
+
+    def find_all(self, queries):
+        """Match many CursorQuery instances against this cursor and all of its
+        descendants in a single walk.
+
+        Returns one list of matching cursors, in preorder, per query. Each
+        cursor is only tested against the queries interested in its kind,
+        and the criteria of a query are tested from the cheapest (kind, file,
+        within) to the most expensive (spelling, type, USR, predicate).
+        """
+        tu = self._tu
+
+        # The queries to evaluate, including the queries used for within
+        # tests, which come before the queries using them.
+        order = []
+        def add(query):
+            if query.within is not None:
+                add(query.within)
+            for other in order:
+                if other is query:
+                    return
+            order.append(query)
+        for query in queries:
+            add(query)
+        position = dict((id(query), j) for j, query in enumerate(order))
+        within = dict((j, position[id(query.within)])
+                      for j, query in enumerate(order)
+                      if query.within is not None)
+
+        # For queries used for within tests, whether the current cursor or
+        # one of its ancestors matched, by cursor position.
+        covered = dict((j, bytearray()) for j in set(within.values()))
+
+        # The pointer values of the files queries are restricted to. The
+        # queries for a file which is not part of the translation unit match
+        # nothing; they must not match the cursors without a file.
+        file_values = {}
+        unresolved = set()
+        for j, query in enumerate(order):
+            if query.file is not None:
+                ptr = lib.clang_getFile(tu, query.file)
+                if ptr:
+                    file_values[j] = cast(ptr, c_void_p).value
+                else:
+                    unresolved.add(j)
+
+        location_file = c_object_p()
+        location_file_value = c_void_p.from_buffer(location_file)
+        location_file_p = byref(location_file)
+        get_location = lib.clang_getInstantiationLocation
+        get_cursor_location = lib.clang_getCursorLocation
+
+        # Maps a kind id to the positions of the queries interested in it.
+        candidates_by_kind = {}
+        def get_candidates(kind_id):
+            candidates = candidates_by_kind.get(kind_id)
+            if candidates is None:
+                candidates = candidates_by_kind[kind_id] = [
+                    j for j, query in enumerate(order)
+                    if j not in unresolved and
+                       (query.kind_ids is None or kind_id in query.kind_ids)]
+            return candidates
+
+        if within:
+            cursors = self.walk(parents=True)
+        else:
+            cursors = ((cursor, -1) for cursor in self.walk())
+
+        results = [[] for query in order]
+        for cursor, parent in cursors:
+            file_value = None
+            matched = set()
+            for j in get_candidates(cursor._kind_id):
+                query = order[j]
+                if j in within:
+                    if parent < 0 or not covered[within[j]][parent]:
+                        continue
+                if j in file_values:
+                    if file_value is None:
+                        get_location(get_cursor_location(cursor),
+                                     location_file_p, None, None, None)
+                        file_value = location_file_value.value
+                    if file_value != file_values[j]:
+                        continue
+                if query._matches(cursor):
+                    results[j].append(cursor)
+                    matched.add(j)
+
+            for j, flags in covered.iteritems():
+                flags.append(j in matched or
+                             (parent >= 0 and flags[parent]))
+
+        return [results[position[id(query)]] for query in queries]
+
     @staticmethod
     def from_result(res, fn, args):
         assert isinstance(res, Cursor)
@@ -1214,6 +1557,147 @@ class Cursor(Structure):
         res._tu = args[0]._tu
         return res
 
+class CursorQuery(object):
+    """
+    A set of criteria that cursors must all satisfy, compiled once and usable
+    with Cursor.find_all() and TranslationUnit.find_all() against any number
+    of cursors.
+
+    The criteria are:
+
+      kind       A CursorKind, or an iterable of them.
+      file       The name of the file the cursor is located in.
+      within     A CursorKind (or an iterable of them), or a CursorQuery,
+                 that one of the ancestors of the cursor must match.
+      spelling   The spelling of the cursor, or a compiled regular expression
+                 its spelling must match. Unlike Cursor.spelling, this also
+                 applies to expressions; e.g. the spelling of a call is the
+                 name of the called function.
+      type_kind  A TypeKind, or an iterable of them.
+      usr        The USR of the cursor.
+      predicate  A function taking a Cursor and returning whether it matches.
+    """
+
+    def __init__(self, kind=None, spelling=None, usr=None, type_kind=None,
+                 file=None, within=None, predicate=None):
+        self.kind_ids = CursorQuery._ids(kind)
+        self.type_kind_ids = CursorQuery._ids(type_kind)
+        self.spelling = spelling
+        self.usr = usr
+        self.file = file
+        if within is not None and not isinstance(within, CursorQuery):
+            within = CursorQuery(kind=within)
+        self.within = within
+        self.predicate = predicate
+
+        # The tests of the expensive criteria, in order of cost.
+        tests = []
+        if spelling is not None:
+            if hasattr(spelling, 'match'):
+                tests.append(lambda c: spelling.match(
+                    lib.clang_getCursorSpelling(c)) is not None)
+            else:
+                tests.append(lambda c: lib.clang_getCursorSpelling(c) ==
+                                       spelling)
+        if self.type_kind_ids is not None:
+            type_kind_ids = self.type_kind_ids
+            tests.append(lambda c: c.type._kind_id in type_kind_ids)
+        if usr is not None:
+            tests.append(lambda c: lib.clang_getCursorUSR(c) == usr)
+        if predicate is not None:
+            tests.append(predicate)
+        self._tests = tests
+
+    @staticmethod
+    def _ids(kinds):
+        if kinds is None:
+            return None
+        if hasattr(kinds, 'value'):
+            return frozenset([kinds.value])
+        return frozenset(kind.value for kind in kinds)
+
+    def _matches(self, cursor):
+        """Test the criteria other than kind, file and within."""
+        for test in self._tests:
+            if not test(cursor):
+                return False
+        return True
+
+class CursorVisitor(object):
+    """
+    Runs many independent checks over a cursor tree in a single walk.
+
+    Handlers subscribe to cursor kinds with register(). visit() walks the
+    tree once and passes every cursor to the handlers subscribed to its kind
+    (in order of registration), looked up in a table keyed by kind id;
+    cursors no handler is interested in cost nothing beyond the walk.
+
+    All handlers receive the same Cursor instance, so a property computed
+    by one handler (spelling, location, type, USR, ...) is cached on the
+    cursor and shared with the following handlers.
+
+    A check may also be an object with visit_<KIND> methods, named after
+    CursorKind names (e.g. visit_CALL_EXPR), registered with add_check(),
+    in the style of ast.NodeVisitor.
+    """
+
+    def __init__(self):
+        # Pairs of (kind ids or None for all kinds, handler).
+        self._registrations = []
+        # Maps a kind id to the handlers interested in it.
+        self._table = {}
+
+    def register(self, handler, kinds=None):
+        """Call handler(cursor, parent) for cursors of the given CursorKind
+        (or iterable of them), or for all cursors if kinds is None.
+
+        parent is the parent Cursor, or None for the cursor the visit started
+        at.
+        """
+        self._registrations.append((CursorQuery._ids(kinds), handler))
+        self._table.clear()
+
+    def add_check(self, check):
+        """Register every visit_<KIND> method of check for its kind."""
+        for name in dir(check):
+            if not name.startswith('visit_'):
+                continue
+            kind = getattr(CursorKind, name[len('visit_'):], None)
+            if not isinstance(kind, CursorKind):
+                raise ValueError('Unknown cursor kind in %s' % name)
+            self.register(getattr(check, name), kind)
+
+    def _handlers(self, kind_id):
+        handlers = self._table.get(kind_id)
+        if handlers is None:
+            handlers = self._table[kind_id] = [
+                handler for kind_ids, handler in self._registrations
+                if kind_ids is None or kind_id in kind_ids]
+        return handlers
+
+    def visit(self, cursor, files=None, main_file_only=False):
+        """Walk cursor and its descendants once, dispatching to the handlers.
+
+        files and main_file_only restrict the walk as in Cursor.walk().
+        Returns the number of cursors visited.
+        """
+        if isinstance(cursor, TranslationUnit):
+            cursor = cursor.cursor
+
+        items = list(cursor.walk(files, main_file_only, parents=True))
+        for child, parent in items:
+            handlers = self._handlers(child._kind_id)
+            if not handlers:
+                continue
+            if parent < 0:
+                parent = None
+            else:
+                parent = items[parent][0]
+            for handler in handlers:
+                handler(child, parent)
+
+        return len(items)
+
 ### Type Kinds ###
 
 class TypeKind(object):
@@ -1861,6 +2345,7 @@ class TranslationUnit(ClangObject):
         assert isinstance(index, Index)
 
         ClangObject.__init__(self, ptr)
+        self._files = None
 
     def __del__(self):
         lib.clang_disposeTranslationUnit(self)
@@ -1895,10 +2380,75 @@ class TranslationUnit(ClangObject):
 
         return iter(includes)
 
+    def preprocessing_records(self, kinds=None):
+        """
+        Return an iterator over the preprocessing cursors (macro definitions,
+        macro instantiations and inclusion directives) of this translation
+        unit.
+
+        Only the top level of the translation unit is visited, so no time is
+        spent below declarations. Cursors are produced in file order: grouped
+        by file, in the order files are first encountered by this visit, and
+        by offset within each file. Cursors without a file (e.g. builtin
+        macro definitions) come first. kinds may be an iterable of CursorKind
+        to restrict the cursors produced.
+
+        Macro definitions and instantiations are only recorded when the
+        translation unit was parsed with PARSE_DETAILED_PROCESSING_RECORD.
+        """
+        preprocessing = set(k.value for k in (
+                CursorKind.PREPROCESSING_DIRECTIVE,
+                CursorKind.MACRO_DEFINITION, CursorKind.MACRO_INSTANTIATION,
+                CursorKind.INCLUSION_DIRECTIVE))
+        if kinds is None:
+            wanted = preprocessing
+        else:
+            wanted = set(k.value for k in kinds)
+        located = preprocessing | wanted
+
+        f, o = c_object_p(), c_uint()
+        f_value = c_void_p.from_buffer(f)
+        fp, op = byref(f), byref(o)
+        get_location = lib.clang_getInstantiationLocation
+        get_cursor_location = lib.clang_getCursorLocation
+        # Maps a file pointer value to the order of its first cursor. All
+        # preprocessing cursors count, so that the order of the files does
+        # not depend on kinds.
+        file_order = {}
+
+        def visitor(child, parent, records):
+            kind_id = child._kind_id
+            if kind_id in located:
+                get_location(get_cursor_location(child), fp, None, None, op)
+                if f:
+                    file_id = file_order.setdefault(f_value.value,
+                                                    len(file_order))
+                else:
+                    file_id = -1
+            if kind_id in wanted:
+                # Create reference to TU so it isn't GC'd before Cursor.
+                child._tu = self
+                records.append((file_id, o.value, len(records), child))
+            return 1 # continue
+        records = []
+        lib.clang_visitChildren(self.cursor,
+                                callbacks['cursor_visit'](visitor), records)
+        records.sort()
+
+        return iter([record[3] for record in records])
+
+    @property
+    def files(self):
+        """The FileTable interning the File handles of this translation unit."""
+        if self._files is None:
+            self._files = FileTable(self)
+
+        return self._files
+
     def get_file(self, filename):
         """Obtain a File from this translation unit."""
 
-        return File.from_name(self, filename)
+        return self.files.get(filename)
 
     def get_location(self, filename, position):
         """Obtain a SourceLocation for a file in this translation unit.
@@ -1916,6 +2466,54 @@ class TranslationUnit(ClangObject):
 
         return SourceLocation.from_position(self, f, position[0], position[1])
 
+    def cursors_at(self, filename, positions):
+        """Obtain the cursors at many positions within one file.
+
+        This is the batch form of Cursor.from_location(tu, tu.get_location(
+        filename, position)). The file is resolved once and every position is
+        translated and looked up in turn. Each position is given in any of the
+        forms accepted by get_location().
+
+        Returns a list with one Cursor per position, or None where no cursor
+        exists at that position.
+        """
+        f = self.get_file(filename)
+        from_offset = lib.clang_getLocationForOffset
+        from_position = lib.clang_getLocation
+        get_cursor = lib.clang_getCursor
+        null_cursor = lib.clang_getNullCursor()
+
+        cursors = []
+        for position in positions:
+            if isinstance(position, int):
+                location = from_offset(self, f, position)
+            else:
+                location = from_position(self, f, position[0], position[1])
+
+            cursor = get_cursor(self, location)
+            if cursor == null_cursor:
+                cursor = None
+            else:
+                cursor._tu = self
+            cursors.append(cursor)
+
+        return cursors
+
+    def find(self, **criteria):
+        """Return the cursors of this translation unit matching criteria.
+
+        This is TranslationUnit.cursor.find(), see Cursor.find().
+        """
+        return self.cursor.find(**criteria)
+
+    def find_all(self, queries):
+        """Match many CursorQuery instances in a single walk of this
+        translation unit.
+
+        This is TranslationUnit.cursor.find_all(), see Cursor.find_all().
+        """
+        return self.cursor.find_all(queries)
+
     def get_extent(self, filename, locations):
         """Obtain a SourceRange from this translation unit.
 
@@ -2005,6 +2603,9 @@ class TranslationUnit(ClangObject):
         ptr = lib.clang_reparseTranslationUnit(self, len(unsaved_files),
                 unsaved_files_array, options)
 
+        # File handles are not guaranteed to survive a reparse.
+        self._files = None
+
     def save(self, filename):
         """Saves the TranslationUnit to a file.
 
@@ -2072,12 +2673,18 @@ class File(ClangObject):
     @property
     def name(self):
         """Return the complete file and path name of the file."""
-        return lib.clang_getCString(lib.clang_getFileName(self))
+        if not hasattr(self, '_name'):
+            self._name = lib.clang_getCString(lib.clang_getFileName(self))
+
+        return self._name
 
     @property
     def time(self):
         """Return the last modification time of the file."""
-        return lib.clang_getFileTime(self)
+        if not hasattr(self, '_time'):
+            self._time = lib.clang_getFileTime(self)
+
+        return self._time
 
     def __str__(self):
         return self.name
@@ -2087,12 +2694,87 @@ class File(ClangObject):
 
     @staticmethod
     def from_cursor_result(res, fn, args):
-        assert isinstance(res, File)
+        assert isinstance(res, c_object_p)
+        if not res:
+            return None
 
+        res = File(res)
         # Copy a reference to the TranslationUnit to prevent premature GC.
         res._tu = args[0]._tu
         return res
 
+class FileTable(object):
+    """
+    The FileTable interns the File handles of a single translation unit.
+
+    Each distinct file is represented by exactly one File instance, which is
+    found either by name or by its underlying CXFile pointer, and is assigned a
+    small integer id in order of first use. Since File caches its name and
+    modification time, repeated lookups against the same file do not call into
+    libclang again.
+
+    The table for a translation unit is available as TranslationUnit.files and
+    is discarded when the translation unit is reparsed.
+    """
+
+    def __init__(self, translation_unit):
+        # Only keep a weak reference; the translation unit owns the table.
+        self._tu = weakref.ref(translation_unit)
+        self._by_name = {}
+        self._by_pointer = {}
+        self.files = []
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __getitem__(self, file_id):
+        """Return the File with the given id."""
+        return self.files[file_id]
+
+    def get(self, filename):
+        """Return the File for the given file name.
+
+        clang_getFile is only called the first time a name is looked up.
+        """
+        f = self._by_name.get(filename)
+        if f is None:
+            tu = self._tu()
+            assert tu is not None
+            f = self._intern(File.from_name(tu, filename))
+            self._by_name[filename] = f
+
+        return f
+
+    def from_pointer(self, ptr):
+        """Return the File for a CXFile pointer (a c_object_p)."""
+        file_id = self._by_pointer.get(cast(ptr, c_void_p).value)
+        if file_id is None:
+            return self._intern(File(c_object_p.from_buffer_copy(ptr)))
+
+        return self.files[file_id]
+
+    def file_id(self, f):
+        """Return the id of a File, interning it if it is not yet known."""
+        file_id = self._by_pointer.get(cast(f.obj, c_void_p).value)
+        if file_id is None:
+            self._intern(f)
+            file_id = len(self.files) - 1
+
+        return file_id
+
+    def _intern(self, f):
+        key = cast(f.obj, c_void_p).value
+        file_id = self._by_pointer.get(key)
+        if file_id is not None:
+            return self.files[file_id]
+
+        self._by_pointer[key] = len(self.files)
+        self.files.append(f)
+        return f
+
 class FileInclusion(object):
     """
     The FileInclusion class represents the inclusion of one source file by
@@ -2113,6 +2795,628 @@ class FileInclusion(object):
         """True if the included file is the input file."""
         return self.depth == 0
 
+class ExtentIndex(object):
+    """
+    An index of cursor extents supporting point and range queries.
+
+    The index is built with a single traversal of a translation unit and
+    stores the extent of every cursor in sorted arrays keyed by file and
+    offset. Each entry additionally records the innermost entry containing
+    it, which lets point, range and enclosing queries run in O(log n) plus
+    the nesting depth at the queried position.
+
+    Entries are identified by integers. The query methods return entry
+    numbers; cursor(), kind(), extent() and lines() retrieve the details of an
+    entry. An index can be saved next to a saved AST file and loaded back
+    without the translation unit, in which case everything but cursor() is
+    available.
+
+    Extents are half-open: an entry covers offsets [start, end). Cursors that
+    do not have a file (e.g. builtins) are not indexed, and an extent that
+    ends in a different file than it starts (e.g. through a macro) is reduced
+    to its start location.
+    """
+
+    # Bumped whenever the on-disk layout changes.
+    _FORMAT_VERSION = 1
+    _SAVED_FIELDS = ('filenames', 'file_ids', 'starts', 'ends', 'start_lines',
+                     'end_lines', 'kinds', 'parents', '_file_ranges')
+
+    def __init__(self):
+        """Create an empty ExtentIndex.
+
+        Use one of the from_* functions to build a populated index.
+        """
+        self.filenames = []
+        self.file_ids = array('i')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.start_lines = array('I')
+        self.end_lines = array('I')
+        self.kinds = array('i')
+        self.parents = array('i')
+        self._file_ranges = []
+        self._file_ids = {}
+        self._cursors = None
+
+    @staticmethod
+    def from_cursor(cursor, keep_cursors=True):
+        """Build an index over all cursors below the given cursor.
+
+        If keep_cursors is true, the visited cursors are retained so that
+        cursor() can return them.
+        """
+        tu = cursor.translation_unit
+        table = tu.files
+
+        seen = []
+        entries = []
+        f, l, c, o = c_object_p(), c_uint(), c_uint(), c_uint()
+        fp, lp, cp, op = byref(f), byref(l), byref(c), byref(o)
+        get_location = lib.clang_getInstantiationLocation
+        get_extent = lib.clang_getCursorExtent
+        get_start = lib.clang_getRangeStart
+        get_end = lib.clang_getRangeEnd
+
+        def visitor(child, parent, data):
+            extent = get_extent(child)
+            get_location(get_start(extent), fp, lp, cp, op)
+            if not f:
+                return 2 # recurse
+            file_id = table.file_id(table.from_pointer(f))
+            start, start_line = int(o.value), int(l.value)
+
+            get_location(get_end(extent), fp, lp, cp, op)
+            if f and table.file_id(table.from_pointer(f)) == file_id:
+                end, end_line = int(o.value), int(l.value)
+            else:
+                end, end_line = start, start_line
+
+            entries.append((file_id, start, -end, len(entries), end_line,
+                            start_line, child._kind_id))
+            if keep_cursors:
+                child._tu = tu
+                seen.append(child)
+            return 2 # recurse
+
+        lib.clang_visitChildren(cursor, callbacks['cursor_visit'](visitor),
+                                None)
+        entries.sort()
+
+        index = ExtentIndex()
+        index.filenames = [table[i].name for i in range(len(table))]
+        index._file_ranges = [None] * len(index.filenames)
+        if keep_cursors:
+            index._cursors = []
+
+        for file_id, start, end, seq, end_line, start_line, kind in entries:
+            index.file_ids.append(file_id)
+            index.starts.append(start)
+            index.ends.append(-end)
+            index.start_lines.append(start_line)
+            index.end_lines.append(end_line)
+            index.kinds.append(kind)
+            if keep_cursors:
+                index._cursors.append(seen[seq])
+
+            n = len(index.starts) - 1
+            if index._file_ranges[file_id] is None:
+                index._file_ranges[file_id] = [n, n + 1]
+            else:
+                index._file_ranges[file_id][1] = n + 1
+
+        index._compute_parents()
+        index._build_file_map()
+        return index
+
+    @staticmethod
+    def from_translation_unit(translation_unit, keep_cursors=True):
+        """Build an index over all cursors in a translation unit."""
+        return ExtentIndex.from_cursor(translation_unit.cursor, keep_cursors)
+
+    @staticmethod
+    def from_file(filename):
+        """Load an index previously written with save()."""
+        import cPickle
+
+        fd = open(filename, 'rb')
+        try:
+            state = cPickle.load(fd)
+        finally:
+            fd.close()
+
+        if state.get('version') != ExtentIndex._FORMAT_VERSION:
+            raise ValueError('Unsupported extent index format in %s' %
+                             filename)
+
+        index = ExtentIndex()
+        for name in ExtentIndex._SAVED_FIELDS:
+            setattr(index, name, state[name])
+        index._build_file_map()
+        return index
+
+    def save(self, filename):
+        """Write the index to a file.
+
+        A natural place is next to the AST file written by
+        TranslationUnit.save(), e.g. 'foo.ast' and 'foo.ast.extents'.
+        Cursors are not saved.
+        """
+        import cPickle
+
+        state = {'version' : ExtentIndex._FORMAT_VERSION}
+        for name in ExtentIndex._SAVED_FIELDS:
+            state[name] = getattr(self, name)
+
+        fd = open(filename, 'wb')
+        try:
+            cPickle.dump(state, fd, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            fd.close()
+
+    def _build_file_map(self):
+        self._file_ids = {}
+        for file_id, name in enumerate(self.filenames):
+            if self._file_ranges[file_id] is not None:
+                self._file_ids[name] = file_id
+
+    def _compute_parents(self):
+        # Entries are sorted by (file, start, -end), so a parent always
+        # precedes the entries it contains.
+        self.parents = array('i', [-1] * len(self.starts))
+        for file_range in self._file_ranges:
+            if file_range is None:
+                continue
+            stack = []
+            for i in xrange(file_range[0], file_range[1]):
+                start, end = self.starts[i], self.ends[i]
+                while stack and not (self.starts[stack[-1]] <= start and
+                                     end <= self.ends[stack[-1]]):
+                    stack.pop()
+                if stack:
+                    self.parents[i] = stack[-1]
+                stack.append(i)
+
+    def _range(self, filename):
+        file_id = self._file_ids.get(filename)
+        if file_id is None:
+            return (0, 0)
+        return self._file_ranges[file_id]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def cursor(self, entry):
+        """Return the Cursor for an entry.
+
+        This is only available for indexes built with keep_cursors.
+        """
+        if self._cursors is None:
+            raise ValueError('ExtentIndex does not hold cursors')
+        return self._cursors[entry]
+
+    def kind(self, entry):
+        """Return the CursorKind of an entry."""
+        return CursorKind.from_id(self.kinds[entry])
+
+    def extent(self, entry):
+        """Return the (filename, start offset, end offset) of an entry."""
+        return (self.filenames[self.file_ids[entry]], self.starts[entry],
+                self.ends[entry])
+
+    def lines(self, entry):
+        """Return the (first line, last line) of an entry."""
+        return (self.start_lines[entry], self.end_lines[entry])
+
+    def _last_at_or_before(self, keys, value, lo, hi):
+        # The last entry in [lo, hi) whose key is <= value, or -1.
+        i = bisect.bisect_right(keys, value, lo, hi) - 1
+        if i < lo:
+            return -1
+        return i
+
+    def enclosing(self, filename, offset):
+        """Return the entries containing offset, innermost first."""
+        lo, hi = self._range(filename)
+        result = []
+        i = self._last_at_or_before(self.starts, offset, lo, hi)
+        while i >= 0:
+            if self.starts[i] <= offset < self.ends[i]:
+                result.append(i)
+            i = self.parents[i]
+        return result
+
+    def innermost(self, filename, offset):
+        """Return the innermost entry containing offset, or None."""
+        lo, hi = self._range(filename)
+        i = self._last_at_or_before(self.starts, offset, lo, hi)
+        while i >= 0:
+            if self.starts[i] <= offset < self.ends[i]:
+                return i
+            i = self.parents[i]
+        return None
+
+    def overlapping(self, filename, start, end):
+        """Return the entries overlapping offsets [start, end), in file order.
+
+        Entries that begin before start are included if they extend past it.
+        """
+        lo, hi = self._range(filename)
+        first = bisect.bisect_left(self.starts, start, lo, hi)
+        last = bisect.bisect_left(self.starts, end, lo, hi)
+
+        # Everything beginning before start that overlaps the range contains
+        # start, so it is an ancestor of the last entry beginning before it.
+        before = []
+        i = first - 1
+        if i < lo:
+            i = -1
+        while i >= 0:
+            if self.ends[i] > start:
+                before.append(i)
+            i = self.parents[i]
+        before.reverse()
+
+        return before + range(first, last)
+
+    def overlapping_lines(self, filename, first_line, last_line):
+        """Return the entries touching lines [first_line, last_line].
+
+        Both bounds are inclusive, and the result is in file order.
+        """
+        lo, hi = self._range(filename)
+        first = bisect.bisect_left(self.start_lines, first_line, lo, hi)
+        last = bisect.bisect_right(self.start_lines, last_line, lo, hi)
+
+        before = []
+        i = first - 1
+        if i < lo:
+            i = -1
+        while i >= 0:
+            if self.end_lines[i] >= first_line:
+                before.append(i)
+            i = self.parents[i]
+        before.reverse()
+
+        return before + range(first, last)
+
+    def cursors_at(self, filename, offsets):
+        """Return the innermost cursor at each offset, or None.
+
+        This answers the same question as TranslationUnit.cursors_at() without
+        calling into libclang. It requires an index built with keep_cursors.
+        """
+        result = []
+        for offset in offsets:
+            entry = self.innermost(filename, offset)
+            if entry is None:
+                result.append(None)
+            else:
+                result.append(self.cursor(entry))
+        return result
+
+class AsyncResult(object):
+    """
+    The pending result of an operation submitted to an AsyncIndex.
+
+    Callers can block on result(), poll done(), or register a callback with
+    add_done_callback() to hand the result over to their own event loop.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._state = 'pending'
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def cancel(self):
+        """Cancel the operation if it has not started running yet.
+
+        Returns True if the operation was cancelled.
+        """
+        self._condition.acquire()
+        try:
+            if self._state != 'pending':
+                return self._state == 'cancelled'
+            self._state = 'cancelled'
+            self._condition.notify_all()
+        finally:
+            self._condition.release()
+
+        self._run_callbacks()
+        return True
+
+    def cancelled(self):
+        """True if the operation was cancelled."""
+        return self._state == 'cancelled'
+
+    def done(self):
+        """True if the operation finished, failed or was cancelled."""
+        return self._state in ('finished', 'cancelled')
+
+    def result(self, timeout=None):
+        """Wait for and return the result of the operation.
+
+        If the operation raised, the exception is re-raised here. If it was
+        cancelled, AsyncCancelledError is raised.
+        """
+        self._wait(timeout)
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """Wait for the operation and return its exception, or None."""
+        self._wait(timeout)
+        return self._exception
+
+    def add_done_callback(self, fn):
+        """Call fn(result) once the operation is done.
+
+        If the operation is already done, fn is called immediately. Otherwise
+        it is called from the worker thread that completed the operation.
+        """
+        self._condition.acquire()
+        try:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        finally:
+            self._condition.release()
+        fn(self)
+
+    def _start(self):
+        self._condition.acquire()
+        try:
+            if self._state != 'pending':
+                return False
+            self._state = 'running'
+            return True
+        finally:
+            self._condition.release()
+
+    def _finish(self, result, exception):
+        self._condition.acquire()
+        try:
+            self._result = result
+            self._exception = exception
+            self._state = 'finished'
+            self._condition.notify_all()
+        finally:
+            self._condition.release()
+        self._run_callbacks()
+
+    def _wait(self, timeout):
+        if timeout is not None:
+            deadline = time.time() + timeout
+        self._condition.acquire()
+        try:
+            while not self.done():
+                if timeout is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            if self._state == 'cancelled':
+                raise AsyncCancelledError()
+            if not self.done():
+                raise AsyncTimeoutError()
+        finally:
+            self._condition.release()
+
+    def _run_callbacks(self):
+        callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+class _AsyncJob(object):
+    """A unit of work queued on an AsyncIndex."""
+
+    def __init__(self, kind, key, fn, args):
+        self.kind = kind
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.result = AsyncResult()
+        self.submitted = time.time()
+
+class AsyncIndex(object):
+    """
+    A non-blocking front-end for parsing, reparsing and code completion.
+
+    Operations are executed by a fixed-size pool of worker threads and each
+    returns an AsyncResult. libclang does not hold the Python interpreter lock
+    while it works, so independent translation units are processed in
+    parallel.
+
+    Operations on the same TranslationUnit are serialized: they run one at a
+    time, in submission order. A new completion request for a translation
+    unit cancels any completion request for it that has not started yet.
+
+    metrics() reports the queue depth and per-operation latencies.
+    """
+
+    def __init__(self, workers=2):
+        """Create an AsyncIndex and start its worker threads."""
+        assert workers > 0
+
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue()
+        # Jobs waiting behind a running job for the same translation unit,
+        # keyed by id(translation_unit).
+        self._serialized = {}
+        self._pending_completions = {}
+        self._running = 0
+        self._stats = {}
+        self._closed = False
+
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work,
+                                      name='AsyncIndex-%d' % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def parse(self, path, args=None, unsaved_files=None, options=0):
+        """Parse a translation unit.
+
+        The arguments are those of TranslationUnit.from_source(). Each parse
+        uses its own Index. The result is the TranslationUnit.
+        """
+        return self._submit('parse', None, TranslationUnit.from_source,
+                            (path, args, unsaved_files, options))
+
+    def reparse(self, translation_unit, unsaved_files=None, options=0):
+        """Reparse a translation unit. The result is the TranslationUnit."""
+        def reparse():
+            translation_unit.reparse(unsaved_files, options)
+            return translation_unit
+
+        return self._submit('reparse', id(translation_unit), reparse, ())
+
+    def complete(self, translation_unit, path, line, column,
+                 unsaved_files=None, options=0):
+        """Run code completion in a translation unit.
+
+        The arguments are those of TranslationUnit.codeComplete(), and so is
+        the result. Any earlier completion request for the same translation
+        unit which has not started running is cancelled.
+        """
+        key = id(translation_unit)
+        job = _AsyncJob('complete', key, translation_unit.codeComplete,
+                        (path, line, column, unsaved_files, options))
+
+        self._lock.acquire()
+        try:
+            stale = self._pending_completions.get(key)
+            self._pending_completions[key] = job.result
+        finally:
+            self._lock.release()
+
+        if stale is not None:
+            stale.cancel()
+
+        return self._enqueue(job)
+
+    def metrics(self):
+        """Return a dict describing the current load and past latencies.
+
+        'queued' is the number of operations waiting to run, 'running' the
+        number being executed. 'operations' maps each operation kind to a
+        dict of 'count', 'cancelled', 'total_time', 'max_time' and
+        'total_wait' (time spent queued), all times in seconds.
+        """
+        self._lock.acquire()
+        try:
+            queued = self._queue.qsize()
+            for waiting in self._serialized.values():
+                queued += len(waiting)
+            operations = {}
+            for kind, stats in self._stats.items():
+                operations[kind] = dict(stats)
+            return {'queued' : queued,
+                    'running' : self._running,
+                    'operations' : operations}
+        finally:
+            self._lock.release()
+
+    def close(self, wait=True):
+        """Stop the worker threads once all submitted work is done."""
+        self._lock.acquire()
+        try:
+            self._closed = True
+        finally:
+            self._lock.release()
+
+        for thread in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _submit(self, kind, key, fn, args):
+        return self._enqueue(_AsyncJob(kind, key, fn, args))
+
+    def _enqueue(self, job):
+        self._lock.acquire()
+        try:
+            if self._closed:
+                raise ValueError('AsyncIndex is closed')
+            if job.key is not None:
+                waiting = self._serialized.get(job.key)
+                if waiting is not None:
+                    waiting.append(job)
+                    return job.result
+                self._serialized[job.key] = collections.deque()
+        finally:
+            self._lock.release()
+
+        self._queue.put(job)
+        return job.result
+
+    def _record(self, kind, cancelled, wait, elapsed):
+        stats = self._stats.get(kind)
+        if stats is None:
+            stats = self._stats[kind] = {'count' : 0, 'cancelled' : 0,
+                                         'total_time' : 0.0, 'max_time' : 0.0,
+                                         'total_wait' : 0.0}
+        if cancelled:
+            stats['cancelled'] += 1
+            return
+        stats['count'] += 1
+        stats['total_time'] += elapsed
+        stats['max_time'] = max(stats['max_time'], elapsed)
+        stats['total_wait'] += wait
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+
+            started = job.result._start()
+            begin = time.time()
+            if started:
+                self._lock.acquire()
+                self._running += 1
+                self._lock.release()
+
+                result = exception = None
+                try:
+                    result = job.fn(*job.args)
+                except Exception as e:
+                    exception = e
+            end = time.time()
+
+            self._lock.acquire()
+            try:
+                if started:
+                    self._running -= 1
+                self._record(job.kind, not started, begin - job.submitted,
+                             end - begin)
+                if self._pending_completions.get(job.key) is job.result:
+                    del self._pending_completions[job.key]
+
+                # Hand the translation unit to the next job waiting on it.
+                next_job = None
+                if job.key is not None:
+                    waiting = self._serialized[job.key]
+                    if waiting:
+                        next_job = waiting.popleft()
+                    else:
+                        del self._serialized[job.key]
+            finally:
+                self._lock.release()
+
+            if next_job is not None:
+                self._queue.put(next_job)
+            if started:
+                job.result._finish(result, exception)
+
 class CompilationDatabaseError(Exception):
     """Represents an error that occurred when working with a CompilationDatabase
 
@@ -2226,6 +3530,235 @@ class CompilationDatabase(ClangObject):
         """
         return lib.clang_CompilationDatabase_getCompileCommands(self, filename)
 
+class LibraryProfiler(object):
+    """
+    Counts the calls to, and measures the time spent in, every libclang
+    function called through the bindings.
+
+    While started, each clang_* function of the library is replaced by a
+    wrapper which records its number of calls, its total time (including
+    any nested libclang calls and Python callbacks, e.g. from
+    clang_visitChildren) and its self time, which excludes both. The time
+    of a call includes the ctypes conversion of its arguments and result.
+    The callbacks passed to a function are wrapped too, and their time
+    outside of libclang calls is recorded in the folded stacks as a
+    'python' frame below the function.
+
+    If sample_every is N > 0, the size of the arguments of every Nth call of
+    each function is measured: the length of strings and sequences and the
+    size of ctypes arrays.
+
+    If python_frames is N > 0, the outermost libclang calls are attributed
+    to the N innermost Python frames calling them in the folded stacks.
+
+    Nothing is wrapped until start() is called, and stop() restores the
+    original functions, so there is no overhead while the profiler is not
+    running. Profiling can also be enabled for a whole script by setting
+    the LIBCLANG_PROFILE environment variable, see register_functions().
+    """
+
+    # The report columns, and the keys report() can sort by.
+    SORT_KEYS = ('name', 'calls', 'total', 'self', 'size')
+
+    def __init__(self, library=None, sample_every=0, python_frames=0):
+        if library is None:
+            library = lib
+        self.library = library
+        self.sample_every = sample_every
+        self.python_frames = python_frames
+        self._originals = {}
+        self._local = threading.local()
+
+        # Maps a function name to [calls, total time, self time, sampled
+        # calls, total sampled size, largest sampled size].
+        self.stats = {}
+        # Maps a tuple of frame names to self time.
+        self.stacks = collections.defaultdict(float)
+
+    @property
+    def running(self):
+        """Whether the library functions are currently wrapped."""
+        return bool(self._originals)
+
+    def reset(self):
+        """Discard the statistics gathered so far."""
+        # The lists are shared with the wrappers, so reset them in place.
+        for stats in self.stats.values():
+            stats[:] = [0, 0.0, 0.0, 0, 0, 0]
+        self.stacks.clear()
+
+    def start(self):
+        """Wrap the libclang functions of the library."""
+        if self.running:
+            return
+        for name, function in self.library.__dict__.items():
+            if name.startswith('clang_') and callable(function):
+                self._originals[name] = function
+                setattr(self.library, name, self._wrap(name, function))
+
+    def stop(self):
+        """Restore the original functions."""
+        for name, function in self._originals.items():
+            setattr(self.library, name, function)
+        self._originals.clear()
+
+    def _wrap(self, name, function):
+        stats = self.stats.setdefault(name, [0, 0.0, 0.0, 0, 0, 0])
+        stacks = self.stacks
+        local = self._local
+        timer = time.time
+        profiler = self
+        callback_types = tuple(callbacks.values())
+
+        def wrapper(*args):
+            calls = stats[0] = stats[0] + 1
+            if profiler.sample_every and calls % profiler.sample_every == 0:
+                size = _argument_size(args)
+                stats[3] += 1
+                stats[4] += size
+                stats[5] = max(stats[5], size)
+
+            stack = getattr(local, 'stack', None)
+            if stack is None:
+                stack = local.stack = []
+            if stack:
+                path = stack[-1][1] + (name,)
+            else:
+                path = profiler._python_path() + (name,)
+            # The time spent in nested calls and callbacks, and the frame
+            # names.
+            entry = [0.0, path]
+            stack.append(entry)
+
+            if [arg for arg in args if isinstance(arg, callback_types)]:
+                args = [profiler._wrap_callback(arg, entry)
+                        if isinstance(arg, callback_types) else arg
+                        for arg in args]
+
+            start = timer()
+            try:
+                return function(*args)
+            finally:
+                elapsed = timer() - start
+                stack.pop()
+                stats[1] += elapsed
+                stats[2] += elapsed - entry[0]
+                stacks[path] += elapsed - entry[0]
+                if stack:
+                    stack[-1][0] += elapsed
+
+        wrapper.__name__ = name
+        return wrapper
+
+    def _wrap_callback(self, callback, entry):
+        """Return a callback of the same type as callback, calling it and
+        adding its time to the nested time of the call frame entry."""
+        stack = self._local.stack
+        stacks = self.stacks
+        timer = time.time
+        path = entry[1] + ('python',)
+
+        def timed(*args):
+            # The libclang calls made by the callback are nested in a frame
+            # of their own, so that they are not counted twice.
+            callback_entry = [0.0, entry[1]]
+            stack.append(callback_entry)
+            start = timer()
+            try:
+                return callback(*args)
+            finally:
+                elapsed = timer() - start
+                stack.pop()
+                entry[0] += elapsed
+                stacks[path] += elapsed - callback_entry[0]
+
+        return type(callback)(timed)
+
+    def _python_path(self):
+        if not self.python_frames:
+            return ()
+        names = []
+        # Skip this method and the wrapper.
+        frame = sys._getframe(2)
+        while frame is not None and len(names) < self.python_frames:
+            code = frame.f_code
+            names.append('%s:%s' % (os.path.basename(code.co_filename),
+                                    code.co_name))
+            frame = frame.f_back
+        names.reverse()
+        return tuple(names)
+
+    def report(self, sort='self', limit=None):
+        """Return the statistics as a table, one line per called function.
+
+        Functions are sorted by decreasing value of the given SORT_KEYS
+        column, or by name.
+        """
+        if sort not in self.SORT_KEYS:
+            raise ValueError('Unknown sort key: %s' % sort)
+
+        rows = []
+        for name, (calls, total, self_time, sampled, size, largest) in \
+                self.stats.items():
+            if not calls:
+                continue
+            if sampled:
+                average = size / sampled
+            else:
+                average = 0
+            rows.append((name, calls, total, self_time, average, largest))
+
+        column = self.SORT_KEYS.index(sort)
+        rows.sort(key=lambda row: row[column], reverse=sort != 'name')
+        if limit is not None:
+            rows = rows[:limit]
+
+        lines = ['%-44s %10s %10s %10s %8s %8s' % (
+                    'function', 'calls', 'total (s)', 'self (s)', 'us/call',
+                    'size')]
+        for name, calls, total, self_time, average, largest in rows:
+            size = ''
+            if self.sample_every:
+                size = '%d/%d' % (average, largest)
+            lines.append(('%-44s %10d %10.4f %10.4f %8.2f %8s' % (
+                    name, calls, total, self_time, 1e6 * total / calls,
+                    size)).rstrip())
+        return '\n'.join(lines) + '\n'
+
+    def write_folded(self, fd):
+        """Write the self time of every call stack, in microseconds, in the
+        folded format read by flame graph tools (e.g. flamegraph.pl)."""
+        for path, elapsed in sorted(self.stacks.items()):
+            fd.write('%s %d\n' % (';'.join(path), int(elapsed * 1e6)))
+
+    def save(self, filename):
+        """Write report() to a file, or write_folded() if the file name ends
+        with '.folded'. The name '-' stands for stderr."""
+        if filename == '-':
+            fd = sys.stderr
+        else:
+            fd = open(filename, 'w')
+        try:
+            if filename.endswith('.folded'):
+                self.write_folded(fd)
+            else:
+                fd.write(self.report())
+        finally:
+            if fd is not sys.stderr:
+                fd.close()
+
+def _argument_size(args):
+    """Return the size of the data passed to a library function."""
+    size = 0
+    for arg in args:
+        if isinstance(arg, basestring):
+            size += len(arg)
+        elif isinstance(arg, Array):
+            size += sizeof(arg)
+        elif isinstance(arg, (list, tuple)):
+            size += len(arg)
+    return size
+
 # Now comes the plumbing to hook up the C library.
 
 # Register callback types in common container.
@@ -2483,7 +4016,7 @@ def register_functions(lib):
     lib.clang_getIBOutletCollectionType.errcheck = Type.from_result
 
     lib.clang_getIncludedFile.argtypes = [Cursor]
-    lib.clang_getIncludedFile.restype = File
+    lib.clang_getIncludedFile.restype = c_object_p
     lib.clang_getIncludedFile.errcheck = File.from_cursor_result
 
     lib.clang_getInclusions.argtypes = [TranslationUnit,
@@ -2653,23 +4186,44 @@ def register_functions(lib):
         py_object]
     lib.clang_visitChildren.restype = c_uint
 
+    # Opt-in instrumentation: LIBCLANG_PROFILE=FILE profiles every call into
+    # the library and saves the statistics to FILE (see
+    # LibraryProfiler.save()) when the interpreter exits.
+    filename = os.environ.get('LIBCLANG_PROFILE')
+    if filename:
+        import atexit
+        profiler = LibraryProfiler(lib)
+        profiler.start()
+        atexit.register(profiler.save, filename)
+
 register_functions(lib)
 
 __all__ = [
+    'AsyncCancelledError',
+    'AsyncIndex',
+    'AsyncResult',
+    'AsyncTimeoutError',
     'CodeCompletionResults',
     'CompilationDatabase',
     'CompileCommands',
     'CompileCommand',
     'CursorKind',
     'Cursor',
+    'CursorQuery',
+    'CursorVisitor',
+    'DecodedLocations',
     'Diagnostic',
+    'ExtentIndex',
     'File',
+    'FileTable',
     'FixIt',
     'Index',
+    'LibraryProfiler',
     'SourceLocation',
     'SourceRange',
     'TranslationUnitLoadError',
     'TranslationUnit',
     'TypeKind',
     'Type',
+    'decode_locations',
 ]
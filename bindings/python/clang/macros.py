@@ -0,0 +1,210 @@
+#===- macros.py - Macro Usage Across Translation Units -------*- python -*--===#
+#
+#                     The LLVM Compiler Infrastructure
+#
+# This file is distributed under the University of Illinois Open Source
+# License. See LICENSE.TXT for details.
+#
+#===------------------------------------------------------------------------===#
+
+r"""
+Macro Usage Across Translation Units
+====================================
+
+This module collects the macro definitions, macro expansions and inclusion
+directives of many translation units, using only the preprocessing record
+(TranslationUnit.preprocessing_records()) rather than walking the AST.
+
+  usage = MacroUsage()
+  usage.update([('foo.c', ['-DFOO']), ('bar.c', [])], workers=4)
+  usage.most_expanded(10)
+  usage.unused()
+
+Locations are (filename, line, column) tuples. A header included by several
+translation units is seen by each of them; queries report every distinct
+location once, while units_using() tells which translation units see a
+macro expanded.
+
+Records are kept per translation unit, so a changed file can be re-extracted
+with update() without touching the others.
+"""
+
+import collections
+
+from clang.unitset import TranslationUnitSet
+
+def extract_macros(translation_unit):
+    """Extract the preprocessing records of a translation unit.
+
+    The translation unit should have been parsed with
+    TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD.
+
+    Returns a (definitions, expansions, inclusions) tuple of lists:
+
+      definitions  (name, location) of each macro definition.
+      expansions   (name, location, definition location) of each macro
+                   expansion. The definition location is None for builtin
+                   macros.
+      inclusions   (included filename, location) of each inclusion directive.
+
+    Definitions of builtin and command line macros, which have no location
+    in a file, are skipped.
+    """
+    from clang import cindex
+
+    lib = cindex.lib
+    kinds = cindex.CursorKind
+    definition_kind = kinds.MACRO_DEFINITION.value
+    expansion_kind = kinds.MACRO_INSTANTIATION.value
+    inclusion_kind = kinds.INCLUSION_DIRECTIVE.value
+
+    table = translation_unit.files
+    f, l, c = cindex.c_object_p(), cindex.c_uint(), cindex.c_uint()
+    fp, lp, cp = cindex.byref(f), cindex.byref(l), cindex.byref(c)
+    get_location = lib.clang_getInstantiationLocation
+
+    def location(cursor):
+        get_location(lib.clang_getCursorLocation(cursor), fp, lp, cp, None)
+        if not f:
+            return None
+        return (table.from_pointer(f).name, l.value, c.value)
+
+    definitions = []
+    expansions = []
+    inclusions = []
+    records = translation_unit.preprocessing_records(
+        [kinds.MACRO_DEFINITION, kinds.MACRO_INSTANTIATION,
+         kinds.INCLUSION_DIRECTIVE])
+    for cursor in records:
+        kind_id = cursor._kind_id
+        where = location(cursor)
+        if where is None:
+            continue
+        if kind_id == definition_kind:
+            definitions.append((cursor.spelling, where))
+        elif kind_id == expansion_kind:
+            definition = cursor.referenced
+            if definition is not None:
+                definition = location(definition)
+            expansions.append((cursor.spelling, where, definition))
+        elif kind_id == inclusion_kind:
+            included = cursor.get_included_file()
+            if included is not None:
+                included = included.name
+            inclusions.append((included, where))
+
+    return definitions, expansions, inclusions
+
+class MacroUsage(TranslationUnitSet):
+    """
+    Aggregates the macro usage of a set of translation units.
+
+    Translation units are identified by the name they were parsed from.
+    """
+
+    def __init__(self):
+        # The records of each translation unit are the result of
+        # extract_macros().
+        TranslationUnitSet.__init__(self)
+
+        self._aggregate = None
+
+    # Updates.
+
+    def _invalidate(self):
+        self._aggregate = None
+
+    def update(self, units, workers=None, options=0):
+        """Parse translation units and set their records.
+
+        units is an iterable of (name, args) or (name, args, unsaved_files)
+        tuples. Units are parsed with the given TranslationUnit options, to
+        which PARSE_DETAILED_PROCESSING_RECORD is added, by a pool of worker
+        processes (by default one per CPU), or in this process if workers is
+        0. Units which fail to parse or to extract are removed and recorded
+        in errors.
+
+        Returns the number of units that were updated.
+        """
+        from clang import cindex
+
+        options |= cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
+        return self._update(units, extract_macros, (), workers, options)
+
+    # Aggregation.
+
+    def _get_aggregate(self):
+        if self._aggregate is not None:
+            return self._aggregate
+
+        # Each maps a macro name to a set.
+        definitions = collections.defaultdict(set)
+        expansions = collections.defaultdict(set)
+        expanding_units = collections.defaultdict(set)
+        # Maps an included file name to the set of including locations.
+        inclusions = collections.defaultdict(set)
+
+        for unit, (unit_definitions, unit_expansions, unit_inclusions) in \
+                self._units.iteritems():
+            for name, where in unit_definitions:
+                definitions[name].add(where)
+            for name, where, definition in unit_expansions:
+                expansions[name].add(where)
+                expanding_units[name].add(unit)
+            for included, where in unit_inclusions:
+                inclusions[included].add(where)
+
+        self._aggregate = (definitions, expansions, expanding_units,
+                           inclusions)
+        return self._aggregate
+
+    # Queries.
+
+    def macros(self):
+        """Return the sorted names of all macros defined in a file."""
+        return sorted(self._get_aggregate()[0])
+
+    def definitions(self, name):
+        """Return the sorted locations of the definitions of a macro."""
+        return sorted(self._get_aggregate()[0].get(name, ()))
+
+    def expansions(self, name):
+        """Return the sorted locations at which a macro is expanded."""
+        return sorted(self._get_aggregate()[1].get(name, ()))
+
+    def expansion_counts(self):
+        """Return a Counter of the number of expansion locations per macro."""
+        return collections.Counter(dict(
+            (name, len(where))
+            for name, where in self._get_aggregate()[1].iteritems()))
+
+    def most_expanded(self, n=None):
+        """Return the n most expanded macros as (name, count) pairs."""
+        return self.expansion_counts().most_common(n)
+
+    def unused(self):
+        """Return the sorted names of macros which are defined but never
+        expanded."""
+        definitions, expansions = self._get_aggregate()[:2]
+        return sorted(name for name in definitions if name not in expansions)
+
+    def redefined(self):
+        """Return the sorted names of macros with more than one definition
+        location."""
+        return sorted(name for name, where in
+                      self._get_aggregate()[0].iteritems() if len(where) > 1)
+
+    def units_using(self, name):
+        """Return the sorted names of the translation units in which a macro
+        is expanded."""
+        return sorted(self._get_aggregate()[2].get(name, ()))
+
+    def inclusions(self, filename):
+        """Return the sorted locations of the inclusion directives which
+        include a file."""
+        return sorted(self._get_aggregate()[3].get(filename, ()))
+
+__all__ = [
+    'MacroUsage',
+    'extract_macros',
+]
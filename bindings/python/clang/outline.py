@@ -0,0 +1,272 @@
+#===- outline.py - Declaration Outline Indexing --------------*- python -*--===#
+#
+#                     The LLVM Compiler Infrastructure
+#
+# This file is distributed under the University of Illinois Open Source
+# License. See LICENSE.TXT for details.
+#
+#===------------------------------------------------------------------------===#
+
+r"""
+Declaration Outline Indexing
+============================
+
+Finding declarations does not require function bodies. This module indexes
+files in "outline" mode: translation units are parsed with
+TranslationUnit.PARSE_SKIP_FUNCTION_BODIES (and PARSE_INCOMPLETE for
+headers), and only declaration-level cursors are extracted, which is
+considerably faster than full parsing.
+
+  index = OutlineIndex()
+  index.add('foo.c', ['-DFOO'])
+  index.find(spelling='foo')
+
+When body-level information is needed, translation_unit(name, full=True)
+and definition() upgrade the file to a full parse, once. report() gives the
+time spent in both kinds of parses and the speedup of outline parsing, for
+the files parsed both ways.
+
+Run as a script, the module indexes the given files and reports the speedup
+against full parses:
+
+  python -m clang.outline [--compare] file... [-- clang-args*]
+"""
+
+from clang.cindex import CursorKind
+from clang.cindex import Index
+from clang.cindex import TranslationUnit
+
+import collections
+import time
+
+# The parse options of outline mode.
+OUTLINE_OPTIONS = TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+
+# File name extensions of headers, which are parsed with PARSE_INCOMPLETE.
+HEADER_EXTENSIONS = ('.h', '.hh', '.hpp', '.hxx', '.h++', '.inc')
+
+# Declaration kinds which are not extracted: parameters are part of the
+# declaration they belong to.
+_PARAMETER_KINDS = frozenset(k.value for k in (
+    CursorKind.PARM_DECL, CursorKind.TEMPLATE_TYPE_PARAMETER,
+    CursorKind.TEMPLATE_NON_TYPE_PARAMETER,
+    CursorKind.TEMPLATE_TEMPLATE_PARAMTER))
+
+# A declaration-level cursor, extracted from an outline parse.
+Declaration = collections.namedtuple('Declaration',
+    'kind spelling usr filename line column')
+
+def is_header(filename):
+    """Return whether a file name looks like that of a header."""
+    return filename.lower().endswith(HEADER_EXTENSIONS)
+
+def outline_options(filename):
+    """Return the parse options for a file in outline mode."""
+    if is_header(filename):
+        return OUTLINE_OPTIONS | TranslationUnit.PARSE_INCOMPLETE
+    return OUTLINE_OPTIONS
+
+def extract_declarations(translation_unit, main_file_only=True):
+    """Return the Declarations of a translation unit, in preorder.
+
+    By default, only declarations located in the main file are returned.
+    """
+    declaration_kinds = {}
+    def is_declaration(kind_id):
+        result = declaration_kinds.get(kind_id)
+        if result is None:
+            try:
+                result = (kind_id not in _PARAMETER_KINDS and
+                          CursorKind.from_id(kind_id).is_declaration())
+            except ValueError:
+                # A kind unknown to these bindings.
+                result = False
+            declaration_kinds[kind_id] = result
+        return result
+
+    result = []
+    for cursor in translation_unit.cursor.walk(main_file_only=main_file_only):
+        if not is_declaration(cursor._kind_id):
+            continue
+        location = cursor.location
+        if location.file is None:
+            continue
+        result.append(Declaration(cursor.kind, cursor.spelling,
+                                  cursor.get_usr(), location.file.name,
+                                  location.line, location.column))
+    return result
+
+class _Entry(object):
+    """The state of one indexed file."""
+
+    def __init__(self, args, unsaved_files):
+        self.args = args
+        self.unsaved_files = unsaved_files
+        self.outline = None
+        self.outline_time = None
+        self.full = None
+        self.full_time = None
+        self.declarations = []
+
+class OutlineIndex(object):
+    """
+    An index of the declarations of a set of files, built from outline
+    parses.
+    """
+
+    def __init__(self, index=None):
+        if index is None:
+            index = Index.create()
+        self.index = index
+        self._entries = collections.OrderedDict()
+
+    @property
+    def files(self):
+        """The names of the indexed files, in order of addition."""
+        return list(self._entries)
+
+    def add(self, filename, args=None, unsaved_files=None):
+        """Index a file in outline mode, replacing any previous entry.
+
+        Returns the Declarations found in the file.
+        """
+        entry = _Entry(args, unsaved_files)
+        start = time.time()
+        entry.outline = TranslationUnit.from_source(
+            filename, args, unsaved_files, outline_options(filename),
+            self.index)
+        entry.outline_time = time.time() - start
+        entry.declarations = extract_declarations(entry.outline)
+        self._entries[filename] = entry
+        return entry.declarations
+
+    def remove(self, filename):
+        """Remove a file and its translation units from the index."""
+        del self._entries[filename]
+
+    def declarations(self, filename):
+        """Return the Declarations of an indexed file."""
+        return self._entries[filename].declarations
+
+    def find(self, spelling=None, kind=None, usr=None):
+        """Return the Declarations matching all the given criteria, in order
+        of file addition and position."""
+        result = []
+        for entry in self._entries.itervalues():
+            for declaration in entry.declarations:
+                if spelling is not None and declaration.spelling != spelling:
+                    continue
+                if kind is not None and declaration.kind != kind:
+                    continue
+                if usr is not None and declaration.usr != usr:
+                    continue
+                result.append(declaration)
+        return result
+
+    def translation_unit(self, filename, full=False):
+        """Return the TranslationUnit of an indexed file.
+
+        The outline translation unit has no function bodies. If full is true,
+        the file is parsed fully instead, the first time this is asked for.
+        """
+        entry = self._entries[filename]
+        if not full:
+            return entry.outline
+
+        if entry.full is None:
+            options = 0
+            if is_header(filename):
+                options = TranslationUnit.PARSE_INCOMPLETE
+            start = time.time()
+            entry.full = TranslationUnit.from_source(
+                filename, entry.args, entry.unsaved_files, options, self.index)
+            entry.full_time = time.time() - start
+        return entry.full
+
+    def definition(self, usr):
+        """Return the Cursor of the definition of an entity, with its body.
+
+        The file declaring the entity is upgraded to a full parse. Returns
+        None if the definition is not found in an indexed file.
+        """
+        for filename, entry in self._entries.iteritems():
+            if not [d for d in entry.declarations if d.usr == usr]:
+                continue
+            tu = self.translation_unit(filename, full=True)
+            for cursor in tu.find(usr=usr):
+                definition = cursor.get_definition()
+                if definition is not None:
+                    return definition
+        return None
+
+    def report(self):
+        """Return a dict of timing statistics.
+
+        The speedup is the ratio of full to outline parsing time, over the
+        files which were parsed both ways, or None if there are none.
+        """
+        outline_time = sum(e.outline_time for e in self._entries.values())
+        compared = [e for e in self._entries.values() if e.full is not None]
+        speedup = None
+        if compared:
+            outline = sum(e.outline_time for e in compared)
+            full = sum(e.full_time for e in compared)
+            if outline > 0:
+                speedup = full / outline
+        return {'files' : len(self._entries),
+                'declarations' : sum(len(e.declarations)
+                                     for e in self._entries.values()),
+                'outline_seconds' : outline_time,
+                'full_files' : len(compared),
+                'full_seconds' : sum(e.full_time for e in compared),
+                'speedup' : speedup}
+
+def main():
+    import sys
+    from optparse import OptionParser
+
+    parser = OptionParser("usage: %prog [options] {filename}+ "
+                          "[-- clang-args*]")
+    parser.add_option("", "--compare", dest="compare",
+                      help="Also parse every file fully, to report the "
+                           "speedup", action="store_true", default=False)
+    parser.add_option("", "--list", dest="list",
+                      help="List the declarations found",
+                      action="store_true", default=False)
+    argv = sys.argv[1:]
+    clang_args = []
+    if '--' in argv:
+        clang_args = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    (opts, filenames) = parser.parse_args(argv)
+
+    if not filenames:
+        parser.error('invalid number arguments')
+
+    index = OutlineIndex()
+    for filename in filenames:
+        declarations = index.add(filename, clang_args)
+        if opts.compare:
+            index.translation_unit(filename, full=True)
+        if opts.list:
+            for d in declarations:
+                print '%s:%d:%d: %s %s' % (d.filename, d.line, d.column,
+                                           d.kind.name, d.spelling)
+
+    report = index.report()
+    print 'indexed %(files)d files, %(declarations)d declarations, ' \
+          'in %(outline_seconds).3fs' % report
+    if report['speedup'] is not None:
+        print 'full parses took %(full_seconds).3fs, ' \
+              'speedup %(speedup).2fx' % report
+
+__all__ = [
+    'Declaration',
+    'OutlineIndex',
+    'extract_declarations',
+    'is_header',
+    'outline_options',
+]
+
+if __name__ == '__main__':
+    main()
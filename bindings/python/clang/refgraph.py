@@ -0,0 +1,406 @@
+#===- refgraph.py - Cross Translation Unit Reference Graphs --*- python -*--===#
+#
+#                     The LLVM Compiler Infrastructure
+#
+# This file is distributed under the University of Illinois Open Source
+# License. See LICENSE.TXT for details.
+#
+#===------------------------------------------------------------------------===#
+
+r"""
+Cross Translation Unit Reference Graphs
+=======================================
+
+This module builds a call and reference graph spanning many translation
+units. Entities are identified by their USR, which is the same for every
+declaration and the definition of an entity in every translation unit, so
+edges found in different translation units connect up without needing to
+resolve declarations to definitions.
+
+An edge goes from the entity containing a reference (the caller: the
+enclosing function, or the enclosing top-level declaration for references
+outside of functions) to the referenced entity (the callee). Each edge is
+either a CALL, for call expressions, or a REFERENCE, for any other reference
+to a declaration. References to parameters and local variables are not
+recorded.
+
+Translation units are parsed and their edges extracted in parallel worker
+processes:
+
+  graph = ReferenceGraph()
+  graph.update([('foo.c', ['-DFOO']), ('bar.c', [])], workers=4)
+  graph.callers('c:@F@malloc')
+
+Edges are kept per translation unit, so a changed file can be re-extracted
+with update() without touching the rest of the graph. USRs are interned in a
+string table and the adjacency is stored as integer arrays, which are
+rebuilt on the first query after a change.
+"""
+
+from array import array
+
+import collections
+
+from clang.unitset import TranslationUnitSet
+
+# Edge kinds.
+CALL = 0
+REFERENCE = 1
+
+# The number of integers stored per edge: caller, callee, kind, file, line,
+# column.
+_EDGE_SIZE = 6
+
+_FORMAT_VERSION = 1
+
+def extract_edges(translation_unit, main_file_only=False):
+    """Extract the edges of a translation unit.
+
+    Returns a (usrs, filenames, edges) tuple: two string tables and an
+    array of _EDGE_SIZE integers per edge, which refer to the string tables
+    by position. If main_file_only is true, only references located in the
+    main file are extracted.
+    """
+    from clang import cindex
+
+    lib = cindex.lib
+    kinds = cindex.CursorKind
+    function_kinds = frozenset(k.value for k in (
+        kinds.FUNCTION_DECL, kinds.CXX_METHOD, kinds.CONSTRUCTOR,
+        kinds.DESTRUCTOR, kinds.CONVERSION_FUNCTION, kinds.FUNCTION_TEMPLATE,
+        kinds.OBJC_INSTANCE_METHOD_DECL, kinds.OBJC_CLASS_METHOD_DECL))
+    reference_kinds = frozenset(k.value for k in (
+        kinds.CALL_EXPR, kinds.OBJC_MESSAGE_EXPR, kinds.DECL_REF_EXPR,
+        kinds.MEMBER_REF_EXPR, kinds.TYPE_REF, kinds.TEMPLATE_REF,
+        kinds.NAMESPACE_REF, kinds.MEMBER_REF))
+    call_kinds = frozenset((kinds.CALL_EXPR.value,
+                            kinds.OBJC_MESSAGE_EXPR.value))
+    declaration_kinds = {}
+
+    def is_declaration(kind_id):
+        result = declaration_kinds.get(kind_id)
+        if result is None:
+            try:
+                result = kinds.from_id(kind_id).is_declaration()
+            except ValueError:
+                # A kind unknown to these bindings.
+                result = False
+            declaration_kinds[kind_id] = result
+        return result
+
+    def is_local(cursor):
+        kind_id = cursor._kind_id
+        if kind_id == kinds.PARM_DECL.value:
+            return True
+        if kind_id == kinds.VAR_DECL.value:
+            parent = cursor.semantic_parent
+            return parent is not None and parent._kind_id in function_kinds
+        return False
+
+    usrs = []
+    usr_ids = {}
+    def intern_usr(usr):
+        usr_id = usr_ids.get(usr)
+        if usr_id is None:
+            usr_id = usr_ids[usr] = len(usrs)
+            usrs.append(usr)
+        return usr_id
+
+    table = translation_unit.files
+    f, l, c = cindex.c_object_p(), cindex.c_uint(), cindex.c_uint()
+    fp, lp, cp = cindex.byref(f), cindex.byref(l), cindex.byref(c)
+    get_location = lib.clang_getInstantiationLocation
+
+    edges = array('i')
+    seen = set()
+    # For each visited cursor, the position of the cursor owning the
+    # references below it, or -1. Owners are kept by position, and their
+    # USRs are only computed once they own a reference.
+    owners = []
+    owner_cursors = {}
+    owner_usrs = {}
+
+    cursors = translation_unit.cursor.walk(main_file_only=main_file_only,
+                                           parents=True)
+    for index, (cursor, parent) in enumerate(cursors):
+        kind_id = cursor._kind_id
+        if parent < 0:
+            owners.append(-1)
+            continue
+
+        owner = owners[parent]
+        if kind_id in function_kinds or (owner < 0 and
+                                         is_declaration(kind_id)):
+            owner = index
+            owner_cursors[index] = cursor
+        owners.append(owner)
+
+        if kind_id not in reference_kinds or owner < 0 or owner == index:
+            continue
+
+        target = cursor.referenced
+        if target is None or is_local(target):
+            continue
+        usr = lib.clang_getCursorUSR(target)
+        if not usr:
+            continue
+
+        get_location(lib.clang_getCursorLocation(cursor), fp, lp, cp, None)
+        if not f:
+            continue
+        file_id = table.file_id(table.from_pointer(f))
+
+        # A call expression and the reference to the callee below it share a
+        # location; only record the call.
+        key = (usr, file_id, l.value, c.value)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        caller = owner_usrs.get(owner)
+        if caller is None:
+            caller = owner_usrs[owner] = intern_usr(
+                lib.clang_getCursorUSR(owner_cursors[owner]))
+        if kind_id in call_kinds:
+            edge_kind = CALL
+        else:
+            edge_kind = REFERENCE
+        edges.extend((caller, intern_usr(usr), edge_kind, file_id,
+                      l.value, c.value))
+
+    filenames = [table[i].name for i in range(len(table))]
+    return usrs, filenames, edges
+
+class ReferenceGraph(TranslationUnitSet):
+    """
+    A call and reference graph over a set of translation units.
+
+    Translation units are identified by the name they were parsed from.
+    """
+
+    def __init__(self):
+        TranslationUnitSet.__init__(self)
+
+        # String tables. The edges of each translation unit are stored as
+        # an array referring to them by id.
+        self.usrs = []
+        self.filenames = []
+        self._usr_ids = {}
+        self._file_ids = {}
+
+        self._adjacency = None
+
+    def __len__(self):
+        """Return the number of edges, counting each translation unit."""
+        return sum(len(edges) for edges in self._units.values()) // _EDGE_SIZE
+
+    def usr_id(self, usr):
+        """Return the id of a USR, or -1 if it does not occur."""
+        return self._usr_ids.get(usr, -1)
+
+    def _intern(self, value, table, ids):
+        result = ids.get(value)
+        if result is None:
+            result = ids[value] = len(table)
+            table.append(value)
+        return result
+
+    # Updates.
+
+    def _store(self, extracted):
+        # extracted is the result of extract_edges(); move its edges to the
+        # string tables of the graph.
+        usrs, filenames, edges = extracted
+        usr_map = [self._intern(u, self.usrs, self._usr_ids) for u in usrs]
+        file_map = [self._intern(f, self.filenames, self._file_ids)
+                    for f in filenames]
+
+        remapped = array('i', edges)
+        for i in xrange(0, len(remapped), _EDGE_SIZE):
+            remapped[i] = usr_map[remapped[i]]
+            remapped[i + 1] = usr_map[remapped[i + 1]]
+            remapped[i + 3] = file_map[remapped[i + 3]]
+        return remapped
+
+    def _invalidate(self):
+        self._adjacency = None
+
+    def update(self, units, workers=None, options=0, main_file_only=False):
+        """Parse translation units and set their edges.
+
+        units is an iterable of (name, args) or (name, args, unsaved_files)
+        tuples. Units are parsed with the given TranslationUnit options by
+        a pool of worker processes (by default one per CPU), or in this
+        process if workers is 0. Units which fail to parse or to extract are
+        removed from the graph and recorded in errors. If main_file_only is
+        true, only references located in the main file are extracted.
+
+        Returns the number of units that were updated.
+        """
+        return self._update(units, extract_edges, (main_file_only,),
+                            workers, options)
+
+    # Adjacency.
+
+    def _build_adjacency(self):
+        # Maps (caller, callee) to a bit mask of edge kinds.
+        pairs = collections.defaultdict(int)
+        # Maps a callee to the set of units referencing it.
+        callee_units = collections.defaultdict(set)
+        for name, edges in self._units.iteritems():
+            for i in xrange(0, len(edges), _EDGE_SIZE):
+                callee = edges[i + 1]
+                pairs[edges[i], callee] |= 1 << edges[i + 2]
+                callee_units[callee].add(name)
+
+        def compressed(items):
+            # Compressed sparse rows: the targets of node n are
+            # targets[offsets[n]:offsets[n + 1]].
+            offsets = array('i', [0] * (len(self.usrs) + 1))
+            targets = array('i')
+            masks = array('b')
+            for source, target, mask in sorted(items):
+                offsets[source + 1] += 1
+                targets.append(target)
+                masks.append(mask)
+            for n in xrange(len(self.usrs)):
+                offsets[n + 1] += offsets[n]
+            return offsets, targets, masks
+
+        forward = compressed((s, t, m) for (s, t), m in pairs.iteritems())
+        reverse = compressed((t, s, m) for (s, t), m in pairs.iteritems())
+        self._adjacency = (forward, reverse, dict(callee_units))
+
+    def _neighbours(self, usr, direction, kind):
+        if self._adjacency is None:
+            self._build_adjacency()
+        node = self.usr_id(usr)
+        if node < 0:
+            return []
+        offsets, targets, masks = self._adjacency[direction]
+        result = []
+        for i in xrange(offsets[node], offsets[node + 1]):
+            if kind is None or masks[i] & (1 << kind):
+                result.append(targets[i])
+        return result
+
+    # Queries.
+
+    def callees(self, usr, kind=None):
+        """Return the USRs referenced from an entity.
+
+        If kind is CALL or REFERENCE, only edges of that kind are followed.
+        """
+        return [self.usrs[n] for n in self._neighbours(usr, 0, kind)]
+
+    def callers(self, usr, kind=None):
+        """Return the USRs of the entities referencing an entity."""
+        return [self.usrs[n] for n in self._neighbours(usr, 1, kind)]
+
+    def dependents(self, usr, kind=None):
+        """Return the USRs of all entities which directly or transitively
+        reference an entity, in breadth-first order.
+
+        This answers "what is affected if this entity changes?".
+        """
+        if self._adjacency is None:
+            self._build_adjacency()
+        start = self.usr_id(usr)
+        if start < 0:
+            return []
+        offsets, targets, masks = self._adjacency[1]
+        visited = set([start])
+        queue = collections.deque([start])
+        result = []
+        while queue:
+            node = queue.popleft()
+            for i in xrange(offsets[node], offsets[node + 1]):
+                target = targets[i]
+                if target in visited:
+                    continue
+                if kind is not None and not masks[i] & (1 << kind):
+                    continue
+                visited.add(target)
+                queue.append(target)
+                result.append(self.usrs[target])
+        return result
+
+    def dependent_units(self, usr, kind=None):
+        """Return the sorted names of the translation units that reference an
+        entity, or an entity which transitively references it."""
+        if self._adjacency is None:
+            self._build_adjacency()
+        callee_units = self._adjacency[2]
+        result = set()
+        for dependency in [usr] + self.dependents(usr, kind):
+            result.update(callee_units.get(self.usr_id(dependency), ()))
+        return sorted(result)
+
+    def references(self, usr):
+        """Return the references to an entity.
+
+        Each reference is a (unit, caller USR, kind, filename, line, column)
+        tuple. A reference from a header is reported once per translation
+        unit including it.
+        """
+        callee = self.usr_id(usr)
+        if callee < 0:
+            return []
+        result = []
+        for name in self.units:
+            edges = self._units[name]
+            for i in xrange(0, len(edges), _EDGE_SIZE):
+                if edges[i + 1] == callee:
+                    result.append((name, self.usrs[edges[i]], edges[i + 2],
+                                   self.filenames[edges[i + 3]],
+                                   edges[i + 4], edges[i + 5]))
+        return result
+
+    # Persistence.
+
+    @staticmethod
+    def from_file(filename):
+        """Load a graph previously written with save()."""
+        import cPickle
+
+        fd = open(filename, 'rb')
+        try:
+            state = cPickle.load(fd)
+        finally:
+            fd.close()
+
+        if state.get('version') != _FORMAT_VERSION:
+            raise ValueError('Unsupported reference graph format in %s' %
+                             filename)
+
+        graph = ReferenceGraph()
+        graph.usrs = state['usrs']
+        graph.filenames = state['filenames']
+        graph._units = state['units']
+        graph.errors = state['errors']
+        graph._usr_ids = dict((u, i) for i, u in enumerate(graph.usrs))
+        graph._file_ids = dict((f, i) for i, f in enumerate(graph.filenames))
+        return graph
+
+    def save(self, filename):
+        """Write the graph to a file, so that it can be updated later."""
+        import cPickle
+
+        state = {'version' : _FORMAT_VERSION,
+                 'usrs' : self.usrs,
+                 'filenames' : self.filenames,
+                 'units' : self._units,
+                 'errors' : self.errors}
+
+        fd = open(filename, 'wb')
+        try:
+            cPickle.dump(state, fd, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            fd.close()
+
+__all__ = [
+    'CALL',
+    'REFERENCE',
+    'ReferenceGraph',
+    'extract_edges',
+]
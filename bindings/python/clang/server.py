@@ -0,0 +1,426 @@
+#===- server.py - Clang Indexing Service ---------------------*- python -*--===#
+#
+#                     The LLVM Compiler Infrastructure
+#
+# This file is distributed under the University of Illinois Open Source
+# License. See LICENSE.TXT for details.
+#
+#===------------------------------------------------------------------------===#
+
+r"""
+Clang Indexing Service
+======================
+
+This module implements a long-lived process which keeps parsed translation
+units warm and answers editor queries about them, so that editors do not each
+pay the full parsing cost.
+
+Requests and responses are JSON-RPC 2.0 messages, one JSON document per line,
+exchanged either over stdin/stdout or over a Unix domain socket:
+
+  python -m clang.server [--socket PATH] [--capacity N]
+
+Every request names the file it is about and, optionally, the compiler
+arguments and the current (unsaved) contents of the file:
+
+  {"jsonrpc": "2.0", "id": 1, "method": "diagnostics",
+   "params": {"file": "foo.c", "args": ["-DFOO"], "contents": "..."}}
+
+The supported methods are:
+
+  diagnostics
+
+    The diagnostics of the translation unit.
+
+  complete
+
+    Code completion at params "line" and "column".
+
+  definition
+
+    The definition of the entity referenced at params "line" and "column".
+
+  references
+
+    All references within the translation unit to the entity at params
+    "line" and "column".
+
+  stats
+
+    Cache statistics.
+
+  shutdown
+
+    Stop serving requests.
+
+Translation units are parsed with a precompiled preamble and kept in an LRU
+cache keyed by file name and arguments. When a request provides new contents
+for a cached file, the translation unit is reparsed, which reuses the
+preamble.
+"""
+
+from clang.cindex import Index
+from clang.cindex import TranslationUnit
+
+import collections
+import json
+import sys
+import threading
+
+# JSON-RPC 2.0 error codes.
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+class RequestError(Exception):
+    """Represents a request that could not be served.
+
+    The JSON-RPC error code is available under e.code.
+    """
+
+    def __init__(self, code, message):
+        self.code = code
+        Exception.__init__(self, message)
+
+class TranslationUnitCache(object):
+    """
+    An LRU cache of parsed translation units, keyed by file name and compiler
+    arguments.
+    """
+
+    # Parse options used for cached translation units.
+    DEFAULT_OPTIONS = (TranslationUnit.PARSE_PRECOMPILED_PREAMBLE |
+                       TranslationUnit.PARSE_CACHE_COMPLETION_RESULTS)
+
+    def __init__(self, capacity=16, options=DEFAULT_OPTIONS):
+        assert capacity > 0
+
+        self.capacity = capacity
+        self.options = options
+        self.index = Index.create()
+        self.hits = 0
+        self.misses = 0
+        self.reparses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, filename, args=None, contents=None):
+        """Return the translation unit for a file, parsing it if needed.
+
+        If contents is given it is used as the unsaved content of the file. A
+        cached translation unit is reparsed when its contents change.
+        """
+        if args is None:
+            args = []
+        key = (filename, tuple(args))
+
+        unsaved_files = None
+        if contents is not None:
+            unsaved_files = [(filename, contents)]
+
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            tu = TranslationUnit.from_source(filename, args, unsaved_files,
+                                             self.options, self.index)
+            entry = [tu, contents]
+        else:
+            self.hits += 1
+            if contents is not None and contents != entry[1]:
+                self.reparses += 1
+                entry[0].reparse(unsaved_files)
+                entry[1] = contents
+
+        self._entries[key] = entry
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+        return entry[0]
+
+    def unsaved_files(self, filename, args=None):
+        """Return the unsaved files last used for a cached file."""
+        entry = self._entries.get((filename, tuple(args or [])))
+        if entry is None or entry[1] is None:
+            return None
+        return [(filename, entry[1])]
+
+def location_info(location):
+    """Return a JSON-friendly description of a SourceLocation."""
+    if location.file is None:
+        filename = None
+    else:
+        filename = location.file.name
+    return {'file' : filename,
+            'line' : location.line,
+            'column' : location.column,
+            'offset' : location.offset}
+
+class Server(object):
+    """
+    Dispatches JSON-RPC requests to a TranslationUnitCache.
+
+    A single Server may be shared by several connections; requests are
+    processed one at a time.
+    """
+
+    def __init__(self, capacity=16):
+        self.cache = TranslationUnitCache(capacity)
+        self.running = True
+        self._lock = threading.Lock()
+        self._methods = {
+            'complete' : self.complete,
+            'definition' : self.definition,
+            'diagnostics' : self.diagnostics,
+            'references' : self.references,
+            'shutdown' : self.shutdown,
+            'stats' : self.stats,
+        }
+
+    # Request handlers.
+
+    def _tu(self, params):
+        if 'file' not in params:
+            raise RequestError(INVALID_PARAMS, 'Missing parameter: file')
+
+        # JSON strings decode to unicode, but libclang wants UTF-8 bytes.
+        for name in ('file', 'contents'):
+            if isinstance(params.get(name), unicode):
+                params[name] = params[name].encode('utf-8')
+        if params.get('args') is not None:
+            params['args'] = [a.encode('utf-8') for a in params['args']]
+
+        return self.cache.get(params['file'], params.get('args'),
+                              params.get('contents'))
+
+    def _cursor(self, tu, params):
+        try:
+            position = (int(params['line']), int(params['column']))
+        except (KeyError, TypeError, ValueError):
+            raise RequestError(INVALID_PARAMS,
+                               'Expected integer parameters: line, column')
+        return tu.cursors_at(params['file'], [position])[0]
+
+    def diagnostics(self, params):
+        tu = self._tu(params)
+        result = []
+        for diag in tu.diagnostics:
+            info = location_info(diag.location)
+            info['severity'] = diag.severity
+            info['spelling'] = diag.spelling
+            info['option'] = diag.option
+            result.append(info)
+        return result
+
+    def complete(self, params):
+        tu = self._tu(params)
+        try:
+            line, column = int(params['line']), int(params['column'])
+        except (KeyError, TypeError, ValueError):
+            raise RequestError(INVALID_PARAMS,
+                               'Expected integer parameters: line, column')
+
+        unsaved_files = self.cache.unsaved_files(params['file'],
+                                                 params.get('args'))
+        results = tu.codeComplete(params['file'], line, column,
+                                  unsaved_files)
+        if results is None:
+            return []
+
+        completions = []
+        for result in results.results:
+            string = result.string
+            typed_text = None
+            text = []
+            for chunk in string:
+                spelling = chunk.spelling
+                if chunk.isKindTypedText():
+                    typed_text = spelling
+                if spelling is not None and not chunk.isKindInformative():
+                    text.append(spelling)
+            completions.append({'typed_text' : typed_text,
+                                'text' : ''.join(text),
+                                'kind' : result.kind.name,
+                                'priority' : string.priority})
+        completions.sort(key=lambda c: (c['priority'], c['typed_text']))
+        return completions
+
+    def definition(self, params):
+        tu = self._tu(params)
+        cursor = self._cursor(tu, params)
+        if cursor is None:
+            return None
+
+        definition = cursor.get_definition()
+        if definition is None:
+            definition = cursor.referenced
+        if definition is None:
+            return None
+
+        info = location_info(definition.location)
+        info['kind'] = definition.kind.name
+        info['spelling'] = definition.spelling
+        return info
+
+    def references(self, params):
+        tu = self._tu(params)
+        cursor = self._cursor(tu, params)
+        if cursor is None:
+            return []
+
+        target = cursor.referenced
+        if target is None:
+            return []
+        usr = target.get_usr()
+        if not usr:
+            return []
+
+        # Implicit expressions (e.g. casts) wrapping a reference share its
+        # location; report each location once.
+        result = []
+        seen = set()
+        for c in tu.cursor.walk():
+            referenced = c.referenced
+            if referenced is None or referenced.get_usr() != usr:
+                continue
+            info = location_info(c.location)
+            key = (info['file'], info['offset'])
+            if key in seen:
+                continue
+            seen.add(key)
+            info['kind'] = c.kind.name
+            result.append(info)
+        return result
+
+    def stats(self, params):
+        return {'cached' : len(self.cache),
+                'capacity' : self.cache.capacity,
+                'hits' : self.cache.hits,
+                'misses' : self.cache.misses,
+                'reparses' : self.cache.reparses}
+
+    def shutdown(self, params):
+        self.running = False
+        return None
+
+    # Protocol handling.
+
+    def handle(self, message):
+        """Handle a single JSON-RPC request string.
+
+        Returns the response string, or None for notifications.
+        """
+        request_id = None
+        try:
+            try:
+                request = json.loads(message)
+            except ValueError:
+                raise RequestError(PARSE_ERROR, 'Invalid JSON')
+            if not isinstance(request, dict) or 'method' not in request:
+                raise RequestError(INVALID_REQUEST, 'Invalid request')
+
+            request_id = request.get('id')
+            method = self._methods.get(request['method'])
+            if method is None:
+                raise RequestError(METHOD_NOT_FOUND,
+                                   'Unknown method: %s' % request['method'])
+
+            params = request.get('params', {})
+            if not isinstance(params, dict):
+                raise RequestError(INVALID_PARAMS, 'Expected named params')
+
+            self._lock.acquire()
+            try:
+                result = method(params)
+            finally:
+                self._lock.release()
+
+            if 'id' not in request:
+                return None
+            response = {'jsonrpc' : '2.0', 'id' : request_id,
+                        'result' : result}
+        except RequestError as e:
+            response = {'jsonrpc' : '2.0', 'id' : request_id,
+                        'error' : {'code' : e.code, 'message' : str(e)}}
+        except Exception as e:
+            response = {'jsonrpc' : '2.0', 'id' : request_id,
+                        'error' : {'code' : INTERNAL_ERROR,
+                                   'message' : '%s: %s' % (
+                                       e.__class__.__name__, e)}}
+
+        return json.dumps(response)
+
+    def serve_stream(self, rfile, wfile):
+        """Serve line-delimited requests from rfile, answering on wfile.
+
+        Returns when rfile is exhausted or a shutdown request was handled.
+        """
+        while self.running:
+            line = rfile.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            response = self.handle(line)
+            if response is not None:
+                wfile.write(response + '\n')
+                wfile.flush()
+
+    def serve_unix_socket(self, path):
+        """Accept connections on a Unix domain socket until shut down.
+
+        Each connection is served on its own thread.
+        """
+        import SocketServer
+
+        server = self
+
+        class Handler(SocketServer.StreamRequestHandler):
+            def handle(self):
+                server.serve_stream(self.rfile, self.wfile)
+                if not server.running:
+                    threading.Thread(target=listener.shutdown).start()
+
+        class Listener(SocketServer.ThreadingMixIn,
+                       SocketServer.UnixStreamServer):
+            daemon_threads = True
+
+        listener = Listener(path, Handler)
+        try:
+            listener.serve_forever()
+        finally:
+            listener.server_close()
+
+def main():
+    from optparse import OptionParser
+
+    parser = OptionParser("usage: %prog [options]")
+    parser.add_option("", "--socket", dest="socket",
+                      help="Listen on the Unix domain socket PATH instead of "
+                           "using stdin/stdout",
+                      metavar="PATH", type=str, default=None)
+    parser.add_option("", "--capacity", dest="capacity",
+                      help="Keep at most N translation units [default=16]",
+                      metavar="N", type=int, default=16)
+    (opts, args) = parser.parse_args()
+
+    if args:
+        parser.error('invalid number of arguments')
+
+    server = Server(opts.capacity)
+    if opts.socket:
+        server.serve_unix_socket(opts.socket)
+    else:
+        server.serve_stream(sys.stdin, sys.stdout)
+
+__all__ = [
+    'RequestError',
+    'Server',
+    'TranslationUnitCache',
+]
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#===- unitset.py - Data Extracted From Many Translation Units -*- python -*-===#
+#
+#                     The LLVM Compiler Infrastructure
+#
+# This file is distributed under the University of Illinois Open Source
+# License. See LICENSE.TXT for details.
+#
+#===------------------------------------------------------------------------===#
+
+r"""
+Data Extracted From Many Translation Units
+==========================================
+
+This module provides TranslationUnitSet, the base class of the collections
+which parse many translation units in worker processes and keep the data
+extracted from each of them, such as refgraph.ReferenceGraph and
+macros.MacroUsage.
+
+Data is kept per translation unit, so a changed file can be re-extracted
+without touching the others. Subclasses call _update() with a module level
+extraction function, which is run on each parsed translation unit in the
+worker processes, and may override _store() to convert its result and
+_invalidate() to drop state derived from the data.
+"""
+
+# Per-process state of worker processes.
+_worker_index = None
+
+def _extract_job(job):
+    """Parse and extract a (name, args, unsaved_files, options, extract,
+    extract_args) job.
+
+    Returns (name, extracted, error) where extracted is the result of
+    extract(translation_unit, *extract_args) or None if the translation unit
+    could not be parsed or extract() raised an exception.
+    """
+    from clang import cindex
+
+    global _worker_index
+    if _worker_index is None:
+        _worker_index = cindex.Index.create()
+
+    name, args, unsaved_files, options, extract, extract_args = job
+    try:
+        tu = _worker_index.parse(name, args, unsaved_files, options)
+    except cindex.TranslationUnitLoadError as e:
+        return name, None, str(e)
+    # An exception would abort the whole update, in the pool.
+    try:
+        return name, extract(tu, *extract_args), None
+    except Exception as e:
+        return name, None, '%s: %s' % (e.__class__.__name__, e)
+
+class TranslationUnitSet(object):
+    """
+    The data extracted from a set of translation units.
+
+    Translation units are identified by the name they were parsed from.
+    """
+
+    def __init__(self):
+        # Maps a translation unit name to its stored data.
+        self._units = {}
+
+        # Maps the name of a translation unit which failed to parse or to
+        # extract to the error message.
+        self.errors = {}
+
+    @property
+    def units(self):
+        """The sorted names of the translation units."""
+        return sorted(self._units)
+
+    def _store(self, extracted):
+        """Return the data to keep for the result of the extraction."""
+        return extracted
+
+    def _invalidate(self):
+        """Called whenever the data of a translation unit changes."""
+        pass
+
+    # Updates.
+
+    def add(self, name, extracted):
+        """Set the data of a translation unit.
+
+        extracted is the result of the extraction function of the set. Data
+        previously added for the same name is replaced.
+        """
+        self._units[name] = self._store(extracted)
+        self.errors.pop(name, None)
+        self._invalidate()
+
+    def remove(self, name):
+        """Remove the data of a translation unit."""
+        self._units.pop(name, None)
+        self.errors.pop(name, None)
+        self._invalidate()
+
+    def _update(self, units, extract, extract_args=(), workers=None,
+                options=0):
+        """Parse translation units and add the result of extract() on them.
+
+        units is an iterable of (name, args) or (name, args, unsaved_files)
+        tuples. Units are parsed with the given TranslationUnit options by
+        a pool of worker processes (by default one per CPU), or in this
+        process if workers is 0. Units which fail to parse or to extract are
+        removed and recorded in errors.
+
+        Returns the number of units that were updated.
+        """
+        jobs = []
+        for unit in units:
+            name, args = unit[:2]
+            unsaved_files = None
+            if len(unit) > 2:
+                unsaved_files = unit[2]
+            jobs.append((name, args, unsaved_files, options, extract,
+                         extract_args))
+
+        if workers == 0 or len(jobs) <= 1:
+            results = map(_extract_job, jobs)
+            pool = None
+        else:
+            import multiprocessing
+            pool = multiprocessing.Pool(workers)
+            # Results are added in submission order, so that the stored data
+            # does not depend on scheduling.
+            results = pool.imap(_extract_job, jobs)
+
+        count = 0
+        try:
+            for name, extracted, error in results:
+                if extracted is None:
+                    self.remove(name)
+                    self.errors[name] = error
+                else:
+                    self.add(name, extracted)
+                    count += 1
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return count
+
+__all__ = [
+    'TranslationUnitSet',
+]
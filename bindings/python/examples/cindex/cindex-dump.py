@@ -68,6 +68,10 @@ def main():
     parser.add_option("", "--max-depth", dest="maxDepth",
                       help="Limit cursor expansion to depth N",
                       metavar="N", type=int, default=None)
+    parser.add_option("", "--binary-output", dest="binaryOutput",
+                      help="Write a compact binary dump to FILE instead of "
+                           "printing (see clang.astdump)",
+                      metavar="FILE", type=str, default=None)
     parser.disable_interspersed_args()
     (opts, args) = parser.parse_args()
 
@@ -79,6 +83,11 @@ def main():
     if not tu:
         parser.error("unable to load input")
 
+    if opts.binaryOutput:
+        from clang import astdump
+        astdump.write(tu.cursor, opts.binaryOutput)
+        return
+
     pprint(('diags', map(get_diag_info, tu.diagnostics)))
     pprint(('nodes', get_info(tu.cursor)))
 
@@ -0,0 +1,64 @@
+import os
+import tempfile
+
+from clang import astdump
+from clang.cindex import CursorKind
+from .util import get_cursor
+from .util import get_tu
+
+kInput = """\
+struct point { int x; int y; };
+int norm(struct point p) {
+  return p.x * p.x + p.y * p.y;
+}
+"""
+
+def dump_and_load(tu):
+    fd, path = tempfile.mkstemp(suffix='.astdump')
+    os.close(fd)
+    astdump.write(tu.cursor, path)
+    dump = astdump.ASTDump(path)
+    os.unlink(path)
+    return dump
+
+def test_structure():
+    tu = get_tu(kInput)
+    dump = dump_and_load(tu)
+    try:
+        cursors = list(tu.cursor.walk())
+        assert len(dump) == len(cursors)
+        assert dump.parent(0) is None
+
+        # The tree shape matches get_children().
+        def check(cursor, index):
+            children = list(cursor.get_children())
+            dumped = dump.children(index)
+            assert len(children) == len(dumped)
+            for child, child_index in zip(children, dumped):
+                assert dump.parent(child_index) == index
+                assert dump.kind(child_index) == child.kind.value
+                assert dump.extent(child_index) == \
+                       (child.extent.start.offset, child.extent.end.offset)
+                check(child, child_index)
+        check(tu.cursor, 0)
+    finally:
+        dump.close()
+
+def test_find():
+    tu = get_tu(kInput)
+    norm = get_cursor(tu, 'norm')
+    dump = dump_and_load(tu)
+    try:
+        found = dump.find(kind=CursorKind.FUNCTION_DECL.value)
+        assert len(found) == 1
+        assert dump.spelling(found[0]) == 'norm'
+        assert dump.usr(found[0]) == norm.get_usr()
+        assert dump.location(found[0]) == ('t.c', 2, 5, norm.location.offset)
+
+        fields = dump.find(kind=CursorKind.FIELD_DECL.value, filename='t.c')
+        assert [dump.spelling(f) for f in fields] == ['x', 'y']
+        assert len(dump.find(spelling='x')) == 1
+        assert dump.find(spelling='nothing') == []
+        assert dump.find(filename='other.c') == []
+    finally:
+        dump.close()
@@ -0,0 +1,76 @@
+import threading
+
+from clang.cindex import AsyncCancelledError
+from clang.cindex import AsyncIndex
+from clang.cindex import AsyncResult
+from clang.cindex import TranslationUnit
+from .util import get_cursor
+
+kInput = 'int one;\nint two;\n'
+
+def test_parse():
+    index = AsyncIndex(workers=2)
+    try:
+        pending = [index.parse('t%d.c' % i,
+                               unsaved_files=[('t%d.c' % i, kInput)])
+                   for i in range(4)]
+        for p in pending:
+            tu = p.result(timeout=60)
+            assert isinstance(tu, TranslationUnit)
+            assert get_cursor(tu, 'two') is not None
+
+        metrics = index.metrics()
+        assert metrics['queued'] == 0
+        assert metrics['running'] == 0
+        assert metrics['operations']['parse']['count'] == 4
+    finally:
+        index.close()
+
+def test_reparse():
+    index = AsyncIndex()
+    try:
+        tu = index.parse('t.c', unsaved_files=[('t.c', kInput)]).result(60)
+        reparsed = index.reparse(tu, unsaved_files=[('t.c', 'int three;\n')])
+        assert reparsed.result(timeout=60) is tu
+        assert get_cursor(tu, 'three') is not None
+        assert index.metrics()['operations']['reparse']['count'] == 1
+    finally:
+        index.close()
+
+def test_serialized_and_cancelled():
+    index = AsyncIndex(workers=4)
+    try:
+        tu = index.parse('t.c', unsaved_files=[('t.c', kInput)]).result(60)
+
+        # Block the translation unit so that following requests queue up.
+        gate = threading.Event()
+        blocker = index._submit('block', id(tu), gate.wait, ())
+        first = index.complete(tu, 't.c', 1, 1)
+        second = index.reparse(tu)
+        third = index.complete(tu, 't.c', 2, 1)
+        assert index.metrics()['queued'] >= 3
+
+        gate.set()
+        blocker.result(60)
+        assert second.result(60) is tu
+        third.exception(60)
+        assert first.cancelled()
+        try:
+            first.result()
+        except AsyncCancelledError:
+            pass
+        else:
+            assert False
+        assert index.metrics()['operations']['complete']['cancelled'] == 1
+    finally:
+        index.close()
+
+def test_result_callbacks():
+    result = AsyncResult()
+    seen = []
+    result.add_done_callback(seen.append)
+    assert result._start()
+    result._finish(42, None)
+    assert seen == [result]
+    assert result.result() == 42
+    assert not result.cancel()
@@ -1,6 +1,7 @@
 import gc
 
 from clang.cindex import CursorKind
+from clang.cindex import CursorQuery
 from clang.cindex import TranslationUnit
 from clang.cindex import TypeKind
 from .util import get_cursor
@@ -231,3 +232,203 @@ def test_result_type():
     assert foo is not None
     t = foo.result_type
     assert t.kind == TypeKind.INT
+
+def test_walk():
+    tu = get_tu(kInput)
+    cursors = list(tu.cursor.walk())
+    assert cursors[0] == tu.cursor
+
+    def descendants(cursor):
+        result = []
+        for child in cursor.get_children():
+            result.append(child)
+            result.extend(descendants(child))
+        return result
+
+    # Statement cursors reached through a single walk remember their
+    # enclosing declaration, so compare kinds and positions rather than
+    # using cursor equality.
+    def describe(cursor):
+        return (cursor.kind, cursor.extent.start.offset,
+                cursor.extent.end.offset)
+
+    expected = descendants(tu.cursor)
+    assert map(describe, cursors[1:]) == map(describe, expected)
+    for cursor in cursors:
+        assert cursor.translation_unit is tu
+
+def test_referenced():
+    tu = get_tu('void f(void);\nvoid g(void) { f(); }\n')
+    f = get_cursor(tu, 'f')
+    g = get_cursor(tu, 'g')
+    calls = [c for c in g.walk() if c.kind == CursorKind.CALL_EXPR]
+    assert len(calls) == 1
+    assert calls[0].referenced == f
+
+def test_walk_files():
+    import os
+    from clang.cindex import TranslationUnit
+
+    inputs = os.path.join(os.path.dirname(__file__), 'INPUTS')
+    src = os.path.join(inputs, 'include.cpp')
+    header = os.path.join(inputs, 'header3.h')
+    tu = TranslationUnit.from_source(src)
+
+    def names(cursors):
+        return [c.spelling for c in cursors
+                if c.kind == CursorKind.FUNCTION_DECL]
+
+    everything = list(tu.cursor.walk())
+    assert names(everything[1:]) == ['f', 'f', 'main']
+
+    main_only = list(tu.cursor.walk(main_file_only=True))
+    assert names(main_only[1:]) == ['main']
+    for cursor in main_only[1:]:
+        assert cursor.location.file.name == src
+
+    headers = list(tu.cursor.walk(files=[header]))
+    assert names(headers[1:]) == ['f', 'f']
+
+    both = list(tu.cursor.walk(files=[tu.get_file(header)],
+                               main_file_only=True))
+    assert len(both) == len(everything)
+
+    assert len(list(tu.cursor.walk(files=['not-in-tu.h']))) == 1
+
+def test_walk_parents():
+    tu = get_tu(kInput)
+    cursors = list(tu.cursor.walk())
+    pairs = list(tu.cursor.walk(parents=True))
+    assert [c for c, _ in pairs] == cursors
+    assert pairs[0][1] == -1
+
+    # Every cursor is among the children of its parent.
+    def key(c):
+        return (c.kind, c.extent.start.offset, c.extent.end.offset)
+    for cursor, parent in pairs[1:]:
+        assert 0 <= parent < len(cursors)
+        siblings = cursors[parent].get_children()
+        assert key(cursor) in [key(s) for s in siblings]
+
+def test_preprocessing_spelling():
+    """Ensure preprocessing cursors have a spelling."""
+    tu = TranslationUnit.from_source('t.c', unsaved_files=[('t.c', """\
+#include "t.h"
+#define ONE 1
+int x = ONE;
+"""), ('t.h', '')], options=TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD)
+
+    spellings = dict((c.kind, c.spelling)
+                     for c in tu.preprocessing_records()
+                     if c.location.file is not None)
+    assert spellings == {CursorKind.INCLUSION_DIRECTIVE : 't.h',
+                         CursorKind.MACRO_DEFINITION : 'ONE',
+                         CursorKind.MACRO_INSTANTIATION : 'ONE'}
+
+kFindInput = """\
+void *malloc(unsigned long size);
+void *p = 0;
+void f(void) { p = malloc(1); }
+void g(int n) { while (n--) { p = malloc(2); } }
+"""
+
+def test_find():
+    import re
+
+    tu = get_tu(kFindInput)
+    calls = tu.find(kind=CursorKind.CALL_EXPR, spelling='malloc')
+    assert [c.location.line for c in calls] == [3, 4]
+    for call in calls:
+        assert call.translation_unit is tu
+
+    # Cursors are tested against the criteria of all given kinds.
+    found = tu.find(kind=[CursorKind.FUNCTION_DECL, CursorKind.VAR_DECL],
+                    spelling=re.compile('[pf]$'))
+    assert [c.spelling for c in found] == ['p', 'f']
+
+    g = get_cursor(tu, 'g')
+    assert [c.location.line for c in g.find(kind=CursorKind.CALL_EXPR)] == [4]
+    assert tu.find(kind=CursorKind.CALL_EXPR, file='other.c') == []
+    assert len(tu.find(kind=CursorKind.CALL_EXPR, file='t.c')) == 2
+    # Cursors without a file, like the translation unit, are not in a file
+    # unknown to the translation unit.
+    assert tu.find(file='nope.h') == []
+    in_nope = CursorQuery(kind=CursorKind.FUNCTION_DECL, file='nope.h')
+    assert tu.find(kind=CursorKind.CALL_EXPR, within=in_nope) == []
+    assert tu.find(usr=g.get_usr()) == [g]
+    assert [c.spelling for c in tu.find(kind=CursorKind.PARM_DECL,
+                                        type_kind=TypeKind.INT)] == ['n']
+
+def test_find_within():
+    tu = get_tu(kFindInput)
+    in_functions = tu.find(kind=CursorKind.CALL_EXPR,
+                           within=CursorKind.FUNCTION_DECL)
+    assert len(in_functions) == 2
+    in_loops = tu.find(kind=CursorKind.CALL_EXPR,
+                       within=CursorKind.WHILE_STMT)
+    assert [c.location.line for c in in_loops] == [4]
+
+    # within may itself be a query.
+    in_f = CursorQuery(kind=CursorKind.FUNCTION_DECL, spelling='f')
+    assert [c.location.line for c in tu.find(kind=CursorKind.CALL_EXPR,
+                                             within=in_f)] == [3]
+
+    # A cursor is not within itself.
+    assert tu.find(kind=CursorKind.FUNCTION_DECL,
+                   within=CursorKind.FUNCTION_DECL) == []
+
+def test_find_all():
+    tu = get_tu(kFindInput)
+    functions = CursorQuery(kind=CursorKind.FUNCTION_DECL)
+    calls = CursorQuery(kind=CursorKind.CALL_EXPR, within=functions)
+    literals = CursorQuery(kind=CursorKind.INTEGER_LITERAL,
+                           predicate=lambda c: c.location.line > 3)
+    results = tu.find_all([calls, functions, literals, functions])
+    assert len(results) == 4
+    assert len(results[0]) == 2
+    assert [c.spelling for c in results[1]] == ['malloc', 'f', 'g']
+    assert [c.location.line for c in results[2]] == [4]
+    assert results[3] == results[1]
+
+def test_visitor():
+    from clang.cindex import CursorVisitor
+
+    tu = get_tu(kFindInput)
+    visitor = CursorVisitor()
+
+    calls = []
+    visitor.register(lambda c, p: calls.append((c.location.line, p.kind)),
+                     CursorKind.CALL_EXPR)
+    decls = []
+    visitor.register(lambda c, p: decls.append(c.spelling),
+                     [CursorKind.FUNCTION_DECL, CursorKind.VAR_DECL])
+    seen = []
+    visitor.register(lambda c, p: seen.append(c))
+
+    class Check(object):
+        def __init__(self):
+            self.loops = 0
+            self.usrs = []
+        def visit_WHILE_STMT(self, cursor, parent):
+            self.loops += 1
+        def visit_FUNCTION_DECL(self, cursor, parent):
+            self.usrs.append(cursor.get_usr())
+    check = Check()
+    visitor.add_check(check)
+
+    count = visitor.visit(tu)
+    assert count == len(seen) == len(list(tu.cursor.walk()))
+    assert calls == [(3, CursorKind.BINARY_OPERATOR),
+                     (4, CursorKind.BINARY_OPERATOR)]
+    assert decls == ['malloc', 'p', 'f', 'g']
+    assert check.loops == 1
+    assert check.usrs == ['c:@F@malloc', 'c:@F@f', 'c:@F@g']
+
+    class BadCheck(object):
+        def visit_NOT_A_KIND(self, cursor, parent):
+            pass
+    try:
+        visitor.add_check(BadCheck())
+        assert False
+    except ValueError:
+        pass
@@ -0,0 +1,82 @@
+import os
+import tempfile
+
+from clang.cindex import CursorKind
+from clang.cindex import ExtentIndex
+from .util import get_cursor
+from .util import get_tu
+
+kInput = """\
+int a;
+int f(int x) {
+  int y = x;
+  return y;
+}
+int g(void) { return 1; }
+"""
+
+def test_innermost():
+    tu = get_tu(kInput)
+    index = ExtentIndex.from_translation_unit(tu)
+    assert len(index) > 0
+
+    # Offset of 'x' in 'int y = x;'.
+    offset = kInput.index('= x') + 2
+    entry = index.innermost('t.c', offset)
+    assert entry is not None
+    assert index.extent(entry)[0] == 't.c'
+
+    f = get_cursor(tu, 'f')
+    kinds = [index.kind(e) for e in index.enclosing('t.c', offset)]
+    assert kinds[-1] == CursorKind.FUNCTION_DECL
+    assert CursorKind.VAR_DECL in kinds
+    assert index.cursor(index.enclosing('t.c', offset)[-1]) == f
+
+    assert index.innermost('t.c', len(kInput) + 10) is None
+    assert index.innermost('missing.c', 0) is None
+
+def test_overlapping():
+    tu = get_tu(kInput)
+    index = ExtentIndex.from_translation_unit(tu)
+
+    def decls(entries):
+        return [index.cursor(e).spelling for e in entries
+                if index.kind(e) == CursorKind.FUNCTION_DECL]
+
+    assert decls(index.overlapping_lines('t.c', 3, 4)) == ['f']
+    assert decls(index.overlapping_lines('t.c', 4, 6)) == ['f', 'g']
+    assert decls(index.overlapping_lines('t.c', 1, 1)) == []
+
+    start = kInput.index('return y')
+    assert decls(index.overlapping('t.c', start, start + 1)) == ['f']
+    assert decls(index.overlapping('t.c', 0, len(kInput))) == ['f', 'g']
+
+def test_cursors_at():
+    tu = get_tu(kInput)
+    index = ExtentIndex.from_translation_unit(tu)
+    offsets = [kInput.index('int a') + 4, kInput.index('int g') + 4]
+    assert index.cursors_at('t.c', offsets) == tu.cursors_at('t.c', offsets)
+
+def test_save_load():
+    tu = get_tu(kInput)
+    index = ExtentIndex.from_translation_unit(tu)
+
+    fd, path = tempfile.mkstemp(suffix='.extents')
+    os.close(fd)
+    try:
+        index.save(path)
+        loaded = ExtentIndex.from_file(path)
+    finally:
+        os.unlink(path)
+
+    assert len(loaded) == len(index)
+    offset = kInput.index('= x') + 2
+    assert loaded.enclosing('t.c', offset) == index.enclosing('t.c', offset)
+    assert loaded.overlapping_lines('t.c', 2, 6) == \
+           index.overlapping_lines('t.c', 2, 6)
+    try:
+        loaded.cursor(0)
+    except ValueError:
+        pass
+    else:
+        assert False
@@ -7,3 +7,27 @@ def test_file():
   assert str(file) == "t.c"
   assert file.name == "t.c"
   assert repr(file) == "<File: t.c>"
+
+def test_file_table():
+  index = Index.create()
+  tu = index.parse('t.c', unsaved_files = [('t.c', "int x;")])
+  table = tu.files
+  f = tu.get_file('t.c')
+  assert tu.get_file('t.c') is f
+  assert table.file_id(f) == 0
+  assert table[0] is f
+  assert len(table) == 1
+
+  # Files obtained from locations are interned by their CXFile pointer.
+  loc = tu.get_location('t.c', 4)
+  assert table.from_pointer(loc.file.obj) is f
+  assert table.file_id(loc.file) == 0
+  assert len(table) == 1
+
+  # Names and times are cached on the File.
+  assert f.name == 't.c'
+  assert f._name == 't.c'
+  assert f.time == f.time
+
+  tu.reparse()
+  assert tu.files is not table
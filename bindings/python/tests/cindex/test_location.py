@@ -2,6 +2,7 @@ from clang.cindex import Cursor
 from clang.cindex import File
 from clang.cindex import SourceLocation
 from clang.cindex import SourceRange
+from clang.cindex import decode_locations
 from .util import get_cursor
 from .util import get_tu
 
@@ -93,3 +94,43 @@ def test_extent():
     location3 = SourceLocation.from_position(tu, file, 1, 6)
     range3 = SourceRange.from_locations(location1, location3)
     assert range1 != range3
+
+def test_decode_locations():
+    tu = get_tu(baseInput)
+    one = get_cursor(tu, 'one')
+    two = get_cursor(tu, 'two')
+
+    decoded = decode_locations([one.location, two.extent])
+    assert len(decoded) == 3
+    assert len(decoded.files) == 1
+    assert decoded.files[0].name == 't.c'
+    assert list(decoded.file_ids) == [0, 0, 0]
+    assert list(decoded.lines) == [1, 2, 2]
+    assert list(decoded.columns) == [5, 1, 8]
+    assert list(decoded.offsets) == [4, 9, 16]
+
+    f, line, column, offset = decoded[2]
+    assert f is decoded.files[0]
+    assert (line, column, offset) == (2, 8, 16)
+
+    # Decoded values are cached on the locations themselves.
+    assert two.extent.start.file is decoded.files[0]
+    assert_location(two.extent.end, line=2, column=8, offset=16)
+
+def test_decode_locations_invalid():
+    try:
+        decode_locations([1])
+    except TypeError:
+        pass
+    else:
+        assert False
+
+def test_decode_locations_file_table():
+    tu = get_tu(baseInput)
+    f = tu.get_file('t.c')
+    one = get_cursor(tu, 'one')
+
+    decoded = decode_locations([one.extent], file_table=tu.files)
+    assert decoded.files is tu.files.files
+    assert list(decoded.file_ids) == [0, 0]
+    assert decoded[0][0] is f
@@ -0,0 +1,64 @@
+from clang import macros
+from .util import get_units
+
+kHeader = """\
+#define ONE 1
+#define UNUSED 0
+#define TWICE(x) ((x) * 2)
+"""
+
+kFirst = """\
+#include "shared.h"
+int first = TWICE(ONE);
+"""
+
+kSecond = """\
+#include "shared.h"
+#define TWICE(x) ((x) + (x))
+int second = TWICE(2) + ONE;
+"""
+
+def units():
+    return get_units([('first.c', kFirst), ('second.c', kSecond)], kHeader,
+                     ['-I.'], './shared.h')
+
+def test_extract_macros():
+    from clang.cindex import Index
+    from clang.cindex import TranslationUnit
+
+    tu = Index.create().parse('first.c', ['-I.'], units()[0][2],
+        TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD)
+    definitions, expansions, inclusions = macros.extract_macros(tu)
+
+    assert definitions == [('ONE', ('./shared.h', 1, 9)),
+                           ('UNUSED', ('./shared.h', 2, 9)),
+                           ('TWICE', ('./shared.h', 3, 9))]
+    assert expansions == [('TWICE', ('first.c', 2, 13), ('./shared.h', 3, 9)),
+                          ('ONE', ('first.c', 2, 19), ('./shared.h', 1, 9))]
+    assert inclusions == [('./shared.h', ('first.c', 1, 1))]
+
+def test_usage():
+    usage = macros.MacroUsage()
+    assert usage.update(units(), workers=2) == 2
+    assert usage.units == ['first.c', 'second.c']
+
+    assert usage.macros() == ['ONE', 'TWICE', 'UNUSED']
+    assert usage.unused() == ['UNUSED']
+    assert usage.redefined() == ['TWICE']
+    assert usage.definitions('TWICE') == [('./shared.h', 3, 9),
+                                          ('second.c', 2, 9)]
+    assert usage.expansions('ONE') == [('first.c', 2, 19),
+                                       ('second.c', 3, 25)]
+    assert usage.units_using('ONE') == ['first.c', 'second.c']
+    assert usage.most_expanded(1)[0][1] == 2
+    assert usage.inclusions('./shared.h') == [('first.c', 1, 1),
+                                              ('second.c', 1, 1)]
+
+    # Only re-extract the changed file.
+    changed = units()[1][:2] + ([('second.c', 'int second;\n')],)
+    usage.update([changed], workers=0)
+    assert usage.units_using('ONE') == ['first.c']
+    assert usage.redefined() == []
+
+    usage.remove('first.c')
+    assert usage.macros() == []
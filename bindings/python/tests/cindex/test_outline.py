@@ -0,0 +1,82 @@
+from clang import outline
+from clang.cindex import CursorKind
+from clang.cindex import TranslationUnit
+
+kHeader = """\
+struct point { int x; int y; };
+int norm(struct point p);
+"""
+
+kSource = """\
+#include "point.h"
+static int square(int v) { return v * v; }
+int norm(struct point p) {
+  int result = square(p.x) + square(p.y);
+  return result;
+}
+"""
+
+def make_index():
+    index = outline.OutlineIndex()
+    unsaved_files = [('point.c', kSource), ('point.h', kHeader)]
+    index.add('point.h', unsaved_files=unsaved_files)
+    index.add('point.c', unsaved_files=unsaved_files)
+    return index
+
+def test_options():
+    assert outline.is_header('a/b.h')
+    assert outline.is_header('B.HPP')
+    assert not outline.is_header('b.c')
+    assert outline.outline_options('b.c') == \
+        TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+    assert outline.outline_options('b.h') == \
+        (TranslationUnit.PARSE_SKIP_FUNCTION_BODIES |
+         TranslationUnit.PARSE_INCOMPLETE)
+
+def test_declarations():
+    index = make_index()
+    assert index.files == ['point.h', 'point.c']
+
+    header = index.declarations('point.h')
+    assert [(d.kind, d.spelling) for d in header] == [
+        (CursorKind.STRUCT_DECL, 'point'),
+        (CursorKind.FIELD_DECL, 'x'),
+        (CursorKind.FIELD_DECL, 'y'),
+        (CursorKind.FUNCTION_DECL, 'norm')]
+    assert header[0].filename == 'point.h'
+    assert (header[0].line, header[0].column) == (1, 8)
+
+    # Only declaration-level cursors are extracted: no parameters, and no
+    # local variables since bodies are skipped.
+    source = index.declarations('point.c')
+    assert [d.spelling for d in source] == ['square', 'norm']
+
+    norms = index.find(spelling='norm')
+    assert [d.filename for d in norms] == ['point.h', 'point.c']
+    assert norms[0].usr == norms[1].usr
+    assert index.find(kind=CursorKind.FIELD_DECL, spelling='y') == \
+        [header[2]]
+    assert index.find(usr='c:@F@nothing') == []
+
+def test_full_parse_on_demand():
+    index = make_index()
+    assert index.report()['full_files'] == 0
+    assert index.report()['speedup'] is None
+
+    outline_tu = index.translation_unit('point.c')
+    assert not outline_tu.find(kind=CursorKind.VAR_DECL, spelling='result')
+    assert index.report()['full_files'] == 0
+
+    norm = index.find(spelling='norm')[0]
+    definition = index.definition(norm.usr)
+    assert definition.location.line == 3
+    assert definition.location.file.name == 'point.c'
+    assert definition.find(kind=CursorKind.VAR_DECL, spelling='result')
+
+    # Only the files needed were parsed fully, and only once.
+    full_tu = index.translation_unit('point.c', full=True)
+    assert full_tu is definition.translation_unit
+    report = index.report()
+    assert report['files'] == 2
+    assert report['full_files'] >= 1
+    assert report['speedup'] > 0
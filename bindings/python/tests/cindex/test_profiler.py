@@ -0,0 +1,95 @@
+import StringIO
+
+from clang.cindex import LibraryProfiler
+from clang.cindex import lib
+from .util import get_tu
+
+kInput = """\
+int f(int x) { return x + 1; }
+int g(void) { return f(2); }
+"""
+
+def profile(**kwargs):
+    profiler = LibraryProfiler(**kwargs)
+    original = lib.clang_visitChildren
+    profiler.start()
+    try:
+        assert profiler.running
+        assert lib.clang_visitChildren is not original
+        tu = get_tu(kInput)
+        for cursor in tu.cursor.walk(files=['t.c']):
+            cursor.location
+    finally:
+        profiler.stop()
+    assert not profiler.running
+    assert lib.clang_visitChildren is original
+    return profiler
+
+def test_stats():
+    profiler = profile()
+
+    calls, total, self_time = profiler.stats['clang_visitChildren'][:3]
+    assert calls == 1
+    assert 0 <= self_time <= total
+    walked = profiler.stats['clang_getCursorLocation'][0]
+    assert walked > 1
+    assert profiler.stats['clang_parseTranslationUnit'][0] == 1
+
+    report = profiler.report(sort='calls').splitlines()
+    assert report[0].split()[0] == 'function'
+    assert report[1].split()[0] == 'clang_getCursorLocation'
+    assert len(profiler.report(limit=2).splitlines()) == 3
+
+    profiler.reset()
+    assert profiler.stats['clang_visitChildren'][0] == 0
+    assert profiler.report().splitlines()[1:] == []
+
+def test_sizes():
+    profiler = profile(sample_every=1)
+    calls, _, _, sampled, size, largest = \
+        profiler.stats['clang_parseTranslationUnit']
+    assert sampled == calls == 1
+    # The file name is passed as an argument.
+    assert size >= len('t.c')
+    assert largest == size
+
+def test_folded():
+    profiler = profile(python_frames=1)
+    fd = StringIO.StringIO()
+    profiler.write_folded(fd)
+    stacks = {}
+    for line in fd.getvalue().splitlines():
+        path, value = line.rsplit(' ', 1)
+        stacks[tuple(path.split(';'))] = int(value)
+
+    # Calls made from the visitor are nested below clang_visitChildren.
+    assert ('cindex.py:walk', 'clang_visitChildren') in stacks
+    assert ('cindex.py:walk', 'clang_visitChildren',
+            'clang_getCursorLocation') in stacks
+    assert ('cindex.py:location', 'clang_getCursorLocation') in stacks
+
+def test_callback_time():
+    import time
+
+    from clang.cindex import callbacks
+
+    tu = get_tu(kInput)
+    def visitor(child, parent, data):
+        time.sleep(0.01)
+        return 1 # continue
+    profiler = LibraryProfiler(python_frames=1)
+    profiler.start()
+    try:
+        lib.clang_visitChildren(tu.cursor, callbacks['cursor_visit'](visitor),
+                                None)
+    finally:
+        profiler.stop()
+
+    # The time spent in the visitor is not libclang time.
+    calls, total, self_time = profiler.stats['clang_visitChildren'][:3]
+    assert calls == 1
+    assert total >= 0.02
+    assert self_time < 0.01
+    python = [v for path, v in profiler.stacks.items()
+              if path[-2:] == ('clang_visitChildren', 'python')]
+    assert python and python[0] >= 0.02
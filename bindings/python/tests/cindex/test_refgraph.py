@@ -0,0 +1,109 @@
+import os
+import tempfile
+
+from clang import refgraph
+from .util import get_cursor
+from .util import get_tu
+from .util import get_units
+
+kHeader = """\
+int helper(int x);
+"""
+
+kMain = """\
+#include "shared.h"
+int counter;
+int twice(int y) { return helper(y) + helper(y); }
+int main() { counter = twice(1); return 0; }
+"""
+
+kOther = """\
+#include "shared.h"
+int helper(int x) { return x + 1; }
+"""
+
+# kMain with the header inlined, for single-file translation units.
+kInlined = kMain.replace('#include "shared.h"\n', kHeader)
+
+def units(main=kMain):
+    return get_units([('main.c', main), ('other.c', kOther)], kHeader)
+
+def usr(source, spelling):
+    return get_cursor(get_tu(source), spelling).get_usr()
+
+def test_extract_edges():
+    tu = get_tu(kInlined)
+    usrs, filenames, edges = refgraph.extract_edges(tu)
+    assert filenames == ['t.c']
+
+    found = []
+    for i in range(0, len(edges), 6):
+        found.append((usrs[edges[i]], usrs[edges[i + 1]], edges[i + 2],
+                      edges[i + 4], edges[i + 5]))
+
+    helper, twice, main, counter = [usr(kInlined, s) for s in
+                                    ('helper', 'twice', 'main', 'counter')]
+    # References to the parameter y are not recorded, and each call is
+    # recorded once.
+    assert sorted(found) == sorted([
+        (twice, helper, refgraph.CALL, 3, 27),
+        (twice, helper, refgraph.CALL, 3, 39),
+        (main, counter, refgraph.REFERENCE, 4, 14),
+        (main, twice, refgraph.CALL, 4, 24),
+    ])
+
+def test_graph():
+    graph = refgraph.ReferenceGraph()
+    assert graph.update(units(), workers=2) == 2
+    assert graph.units == ['main.c', 'other.c']
+    assert graph.errors == {}
+
+    helper = usr(kOther, 'helper')
+    twice = usr(kInlined, 'twice')
+    main = usr(kInlined, 'main')
+    counter = usr(kInlined, 'counter')
+
+    assert graph.callers(helper) == [twice]
+    assert sorted(graph.callees(main)) == sorted([counter, twice])
+    assert graph.callees(main, refgraph.CALL) == [twice]
+    assert graph.dependents(helper) == [twice, main]
+    assert graph.dependent_units(helper) == ['main.c']
+    assert graph.callers('c:@F@nothing') == []
+
+    refs = graph.references(helper)
+    assert [(r[0], r[3], r[4]) for r in refs] == [('main.c', 'main.c', 3),
+                                                  ('main.c', 'main.c', 3)]
+
+def test_incremental_update():
+    graph = refgraph.ReferenceGraph()
+    graph.update(units(), workers=0)
+    helper = usr(kOther, 'helper')
+    main = usr(kInlined, 'main')
+    assert len(graph.callers(helper)) == 1
+
+    # Make main call helper directly, and only re-extract main.c.
+    changed = kMain.replace('twice(1)', 'helper(1)')
+    graph.update(units(changed)[:1], workers=0)
+    assert sorted(graph.callers(helper)) == sorted([
+        usr(kInlined, 'twice'), main])
+
+    graph.remove('main.c')
+    assert graph.callers(helper) == []
+    assert graph.units == ['other.c']
+
+def test_save_load():
+    graph = refgraph.ReferenceGraph()
+    graph.update(units(), workers=0)
+
+    fd, path = tempfile.mkstemp(suffix='.refgraph')
+    os.close(fd)
+    try:
+        graph.save(path)
+        loaded = refgraph.ReferenceGraph.from_file(path)
+    finally:
+        os.unlink(path)
+
+    helper = usr(kOther, 'helper')
+    assert loaded.units == graph.units
+    assert len(loaded) == len(graph)
+    assert loaded.callers(helper) == graph.callers(helper)
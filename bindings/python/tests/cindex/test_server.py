@@ -0,0 +1,112 @@
+import json
+import socket
+import threading
+
+from clang.server import INVALID_PARAMS
+from clang.server import METHOD_NOT_FOUND
+from clang.server import Server
+from clang.server import TranslationUnitCache
+
+kInput = """\
+int counter;
+int bump(int by) {
+  counter += by;
+  return counter;
+}
+int use(void) { return bump(1) + counter; }
+"""
+
+class Client(object):
+    """A stand-in editor talking to a Server over a socket pair."""
+
+    def __init__(self, server):
+        self.sock, theirs = socket.socketpair()
+        self.rfile = self.sock.makefile('rb')
+        self.wfile = self.sock.makefile('wb')
+        self.thread = threading.Thread(target=self._serve,
+                                       args=(server, theirs))
+        self.thread.start()
+        self.next_id = 0
+
+    def _serve(self, server, sock):
+        rfile = sock.makefile('rb')
+        wfile = sock.makefile('wb')
+        server.serve_stream(rfile, wfile)
+        wfile.close()
+        sock.close()
+
+    def call(self, method, **params):
+        self.next_id += 1
+        request = {'jsonrpc' : '2.0', 'id' : self.next_id,
+                   'method' : method, 'params' : params}
+        self.wfile.write(json.dumps(request) + '\n')
+        self.wfile.flush()
+        response = json.loads(self.rfile.readline())
+        assert response['id'] == self.next_id
+        return response
+
+    def close(self):
+        self.call('shutdown')
+        self.thread.join()
+        self.sock.close()
+
+def test_cache():
+    cache = TranslationUnitCache(capacity=2)
+    tu = cache.get('t.c', contents=kInput)
+    assert cache.get('t.c', contents=kInput) is tu
+    assert (cache.hits, cache.misses, cache.reparses) == (1, 1, 0)
+
+    cache.get('u.c', contents='int u;')
+    cache.get('v.c', contents='int v;')
+    assert len(cache) == 2
+    assert cache.get('t.c', contents=kInput) is not tu
+    assert cache.misses == 4
+
+def test_requests():
+    server = Server()
+    client = Client(server)
+    try:
+        response = client.call('diagnostics', file='t.c', contents=kInput)
+        assert response['result'] == []
+
+        response = client.call('diagnostics', file='t.c',
+                               contents=kInput + 'int x = ;\n')
+        diags = response['result']
+        assert len(diags) == 1
+        assert diags[0]['file'] == 't.c'
+        assert diags[0]['line'] == 7
+
+        response = client.call('diagnostics', file='t.c', contents=kInput)
+        assert response['result'] == []
+
+        # 'bump' in the body of use().
+        response = client.call('definition', file='t.c', line=6, column=24)
+        assert response['result']['spelling'] == 'bump'
+        assert response['result']['line'] == 2
+
+        # 'counter' in the body of bump().
+        response = client.call('references', file='t.c', line=3, column=3)
+        lines = sorted(r['line'] for r in response['result'])
+        assert lines == [1, 3, 4, 6]
+
+        response = client.call('stats')
+        assert response['result']['cached'] == 1
+        assert response['result']['misses'] == 1
+    finally:
+        client.close()
+
+def test_errors():
+    server = Server()
+    client = Client(server)
+    try:
+        response = client.call('frobnicate')
+        assert response['error']['code'] == METHOD_NOT_FOUND
+
+        response = client.call('definition', file='t.c', contents=kInput)
+        assert response['error']['code'] == INVALID_PARAMS
+
+        assert server.handle('{"jsonrpc": "2.0", "method": "stats"}') is None
+        response = json.loads(server.handle('not json'))
+        assert response['error']['code'] == -32700
+    finally:
+        client.close()
@@ -217,3 +217,57 @@ def test_get_source_range():
     assert r.end.offset == 5
     assert r.start.file.name == 't.c'
     assert r.end.file.name == 't.c'
+
+def test_cursors_at():
+    """Ensure tu.cursors_at() resolves many positions at once."""
+
+    tu = get_tu('int one;\nint two;\n')
+
+    cursors = tu.cursors_at('t.c', [4, (2, 5), (1, 5)])
+    assert len(cursors) == 3
+    assert cursors[0].spelling == 'one'
+    assert cursors[1].spelling == 'two'
+    assert cursors[0] == cursors[2]
+    for cursor in cursors:
+        assert cursor.translation_unit is tu
+
+    location = tu.get_location('t.c', (2, 5))
+    assert cursors[1] == Cursor.from_location(tu, location)
+
+def test_preprocessing_records():
+    """Ensure tu.preprocessing_records() lists the preprocessing cursors."""
+
+    tu = TranslationUnit.from_source('fake.c', ['-I./'], unsaved_files=[
+            ('fake.c', """\
+#include "fake.h"
+#define TWICE(x) ((x) * 2)
+int x = TWICE(ONE);
+"""),
+            ('./fake.h', """\
+#define ONE 1
+""")],
+            options=TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD)
+
+    # Interning a header first does not change the order of the files.
+    tu.get_file('./fake.h')
+    records = [(r.kind, r.spelling, r.location.file.name, r.location.line)
+               for r in tu.preprocessing_records()
+               if r.location.file is not None]
+    assert records == [
+        (CursorKind.INCLUSION_DIRECTIVE, 'fake.h', 'fake.c', 1),
+        (CursorKind.MACRO_DEFINITION, 'TWICE', 'fake.c', 2),
+        (CursorKind.MACRO_INSTANTIATION, 'TWICE', 'fake.c', 3),
+        (CursorKind.MACRO_INSTANTIATION, 'ONE', 'fake.c', 3),
+        (CursorKind.MACRO_DEFINITION, 'ONE', './fake.h', 1),
+    ]
+
+    inclusion = tu.preprocessing_records(
+        [CursorKind.INCLUSION_DIRECTIVE]).next()
+    assert inclusion.get_included_file().name == './fake.h'
+
+    definitions = list(tu.preprocessing_records([CursorKind.MACRO_DEFINITION]))
+    assert [d.spelling for d in definitions
+            if d.location.file is not None] == ['TWICE', 'ONE']
+    for record in definitions:
+        assert record.kind.is_preprocessing()
+        assert record.translation_unit is tu
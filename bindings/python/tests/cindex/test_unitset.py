@@ -0,0 +1,17 @@
+from clang.unitset import TranslationUnitSet
+from .util import get_units
+
+def extract_spelling(tu):
+    if tu.spelling == 'bad.c':
+        raise ValueError('cannot extract')
+    return tu.spelling
+
+def test_extract_errors():
+    sources = [('bad.c', 'int x;\n'), ('good.c', 'int y;\n')]
+    for workers in (0, 2):
+        units = TranslationUnitSet()
+        # A failing extraction does not lose the other units.
+        assert units._update(get_units(sources, ''), extract_spelling,
+                             workers=workers) == 1
+        assert units.units == ['good.c']
+        assert units.errors == {'bad.c' : 'ValueError: cannot extract'}
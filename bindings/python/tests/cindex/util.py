@@ -83,11 +83,21 @@ def get_cursors(source, spelling):
 
     return cursors
 
-    
-    
+def get_units(sources, header, args=None, header_name='shared.h'):
+    """Obtain (name, args, unsaved_files) tuples for parsing many units.
+
+    sources is a list of (name, source) pairs. Each unit is given the
+    contents of a header shared by all units as unsaved file header_name,
+    and the same list of args.
+    """
+    if args is None:
+        args = []
+    return [(name, args, [(name, source), (header_name, header)])
+            for name, source in sources]
 
 __all__ = [
     'get_cursor',
     'get_cursors',
     'get_tu',
+    'get_units',
 ]
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""
+AnalyzerStats - Per translation unit statistics of static analyzer runs.
+
+Statistics are enabled by passing '-internal-stats' option to scan-build
+(or '-analyzer-stats' to the analyzer). Unlike SumTimerInfo.py, which only
+sums them up, this script parses the output into one record per translation
+unit, so that slowdowns can be traced to specific files:
+
+  AnalyzerStats.py [--format text|csv|json] [--top N] log...
+
+The logs are read line by line, so they can be arbitrarily large. A log is
+either the output of scan-build or the output of single analyzer
+invocations (e.g. the stderr logs of SATestBuild).
+
+The output of a translation unit has no marker of its start, so records are
+delimited heuristically: a new record starts with the -analyzer-display-
+progress output ("ANALYZE: file function") of another file, with the
+"warnings generated" line unless only progress output precedes it, or when
+a value which was already seen for the current record shows up again. The
+file name of a record is taken from the progress output if there is one,
+and is the log name followed by the record number otherwise.
+
+The time of a record is the user + system time of the analyzer, as summed
+up by SumTimerInfo.py.
+"""
+
+import re
+import sys
+import math
+import csv
+import json
+
+# The statistics of the analyzer which are recorded, with their field name.
+Statistics = [
+    ('functions', 'The # of functions analysed (as top level).'),
+    ('steps', 'The # of steps executed.'),
+    ('reachable_blocks', 'The % of reachable basic blocks'),
+    ('max_cfg_size', 'The maximum number of basic blocks in a function'),
+    ('reached_max_steps', 'The # of times we reached the max number of steps.'),
+]
+
+# The fields of a record, in output order.
+Fields = ['file', 'time', 'warnings'] + [f for f, _ in Statistics]
+
+StatisticRE = re.compile(r'^\s*([0-9]+) \S+\s+- (.*)$')
+WarningsRE = re.compile(r'^([0-9]+) warnings? generated\.')
+# A timer line gives the user, system, user+system and wall times, with
+# their percentages. The wall time is always printed, the others only when
+# they are not zero.
+TimerRE = re.compile(r'([0-9.]+) \(\s*[0-9.]+%\)')
+ProgressRE = re.compile(r'^ANALYZE[^:]*: (\S+) ')
+
+def parseStats(f, name='<stdin>'):
+    """
+    parseStats - Parse analyzer statistics from the lines of f.
+
+    Yields one dictionary per translation unit, with the keys of Fields.
+    Missing values are None.
+
+    >>> log = ['ANALYZE (Syntax): a.c main',
+    ...        'ANALYZE (Path,  Inline_Regular): a.c main',
+    ...        '1 warning generated.',
+    ...        '      1 AnalysisConsumer - The # of functions analysed'
+    ...        ' (as top level).',
+    ...        '   0.0300 ( 75.0%)   0.0100 ( 25.0%)   0.0400 (100.0%)'
+    ...        '   0.0500 (100.0%)  Analyzer Total Time',
+    ...        'ANALYZE (Syntax): b.c f',
+    ...        '2 warnings generated.',
+    ...        '      3 AnalysisConsumer - The # of functions analysed'
+    ...        ' (as top level).']
+    >>> [(r['file'], r['warnings'], r['functions'], r['time'])
+    ...  for r in parseStats(log)]
+    [('a.c', 1, 1, 0.04), ('b.c', 2, 3, None)]
+    """
+    record = {}
+    count = [0]
+
+    def finish():
+        count[0] += 1
+        result = dict((k, record.get(k)) for k in Fields)
+        if result['file'] is None:
+            result['file'] = '%s:%d' % (name, count[0])
+        return result
+
+    def setField(key, value):
+        # A value seen twice belongs to the next translation unit.
+        if key in record:
+            finished = finish()
+            record.clear()
+            record[key] = value
+            return finished
+        record[key] = value
+        return None
+
+    def hasResults():
+        # Progress lines precede the other output of a translation unit.
+        return [k for k in record if k != 'file']
+
+    for line in f:
+        finished = None
+        m = WarningsRE.match(line)
+        if m:
+            # The first output of a translation unit, after its progress.
+            if hasResults():
+                finished = finish()
+                record.clear()
+            record['warnings'] = int(m.group(1))
+        elif 'Analyzer Total Time' in line:
+            times = TimerRE.findall(line)
+            if times:
+                # The user+system time precedes the wall time, unless it is
+                # zero.
+                time = 0.0
+                if len(times) > 1:
+                    time = float(times[-2])
+                finished = setField('time', time)
+        else:
+            m = ProgressRE.match(line)
+            if m:
+                if hasResults() or record.get('file', m.group(1)) != \
+                        m.group(1):
+                    finished = finish()
+                    record.clear()
+                record['file'] = m.group(1)
+            else:
+                m = StatisticRE.match(line)
+                if m:
+                    for key, description in Statistics:
+                        if m.group(2).startswith(description):
+                            finished = setField(key, int(m.group(1)))
+                            break
+        if finished is not None:
+            yield finished
+
+    if record:
+        yield finish()
+
+def percentile(values, p):
+    """Return the p-th percentile of sorted values (nearest rank).
+
+    >>> percentile([1, 2], 50)
+    1
+    >>> [percentile(range(1, 11), p) for p in (50, 90, 99)]
+    [5, 9, 10]
+    >>> percentile(range(1, 101), 99)
+    99
+    >>> percentile([7], 0)
+    7
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+Percentiles = [50, 90, 99]
+
+def summarize(records, top=10):
+    """Return the totals, the percentiles of the time and steps, and the top
+    slowest translation units of a list of records."""
+    summary = {'count' : len(records)}
+    for key in ['time', 'warnings', 'functions', 'steps', 'reached_max_steps']:
+        summary['total_' + key] = sum(r[key] or 0 for r in records)
+    summary['max_cfg_size'] = max([r['max_cfg_size'] or 0 for r in records]
+                                  or [0])
+    for key in ['time', 'steps']:
+        values = sorted(r[key] for r in records if r[key] is not None)
+        for p in Percentiles:
+            summary['p%d_%s' % (p, key)] = percentile(values, p)
+    timed = [r for r in records if r['time'] is not None]
+    timed.sort(key = lambda r: -r['time'])
+    summary['slowest'] = timed[:top]
+    return summary
+
+def getCSVRow(record):
+    return [record[k] if record[k] is not None else '' for k in Fields]
+
+def writeText(summary, out):
+    print >>out, "TU Count %d" % summary['count']
+    print >>out, "Time %f" % summary['total_time']
+    print >>out, "Warnings %d" % summary['total_warnings']
+    print >>out, "Functions Analyzed %d" % summary['total_functions']
+    print >>out, "Number of Steps %d" % summary['total_steps']
+    print >>out, "Reached Max Steps %d" % summary['total_reached_max_steps']
+    print >>out, "Max CFG Size %d" % summary['max_cfg_size']
+    for key in ['time', 'steps']:
+        print >>out, "%s percentiles: %s" % (key.capitalize(), ", ".join(
+            "p%d %s" % (p, summary['p%d_%s' % (p, key)])
+            for p in Percentiles))
+    print >>out, "Slowest translation units:"
+    for r in summary['slowest']:
+        print >>out, "  %10.3f %10s  %s" % (r['time'], r['steps'], r['file'])
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser("usage: %prog [options] log...")
+    parser.add_option("", "--format", dest="format",
+                      help="Output the summary as text, the records as csv, "
+                           "or both as json [default=%default]",
+                      action="store", type="choice",
+                      choices=["text", "csv", "json"], default="text")
+    parser.add_option("", "--top", dest="top",
+                      help="Number of slowest translation units to report "
+                           "[default=%default]",
+                      action="store", type=int, default=10)
+    parser.add_option("-o", "--output", dest="output",
+                      help="Write to FILE instead of stdout",
+                      action="store", type=str, default=None, metavar="FILE")
+    (opts, args) = parser.parse_args()
+
+    if not args:
+        parser.error("invalid number of arguments")
+
+    if opts.output:
+        out = open(opts.output, "w")
+    else:
+        out = sys.stdout
+
+    records = []
+    if opts.format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(Fields)
+    for path in args:
+        if path == "-":
+            f = sys.stdin
+        else:
+            f = open(path, "r")
+        try:
+            for r in parseStats(f, path):
+                if opts.format == "csv":
+                    # Stream the records out.
+                    writer.writerow(getCSVRow(r))
+                else:
+                    records.append(r)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+    if opts.format == "json":
+        json.dump({'summary' : summarize(records, opts.top),
+                   'records' : records}, out, indent=2, sort_keys=True)
+        out.write("\n")
+    elif opts.format == "text":
+        writeText(summarize(records, opts.top), out)
+
+    if out is not sys.stdout:
+        out.close()
+
+if __name__ == '__main__':
+    main()
@@ -11,10 +11,31 @@ two perspectives:
 
   2. For use by end users who want to integrate regular static analyzer testing
      into a buildbot like environment.
+
+Report files are parsed in parallel, and only the fields of the diagnostics
+needed for the comparison are kept. The parsed form of a results directory
+is cached in an index file in the directory, so that comparing against the
+same (reference) results again only parses the report files which changed.
+Empty report files are detected by a streaming check, without parsing them
+fully, and are deleted by the parsing processes. SATestBuild scans its
+results this way once, and the comparison reuses the index.
+
+In incremental mode, the report files which are identical in both runs are
+not compared. A report file is fingerprinted by its diagnostics and by the
+hashes of its source files when it was indexed, so reports on sources which
+changed are always compared. The output is the same as that of a full
+comparison.
 """
 
 import os
+import re
+import json
+import cPickle
+import difflib
+import hashlib
 import plistlib
+import multiprocessing
+import xml.parsers.expat
 
 #
 
@@ -45,14 +66,19 @@ class multidict:
 #
 
 class CmpOptions:
-    def __init__(self, verboseLog=None, root=""):
+    def __init__(self, verboseLog=None, root="", jobs=None,
+                 incremental=False):
         self.root = root
         self.verboseLog = verboseLog
+        self.jobs = jobs
+        self.incremental = incremental
 
 class AnalysisReport:
-    def __init__(self, run, files):
+    def __init__(self, run, files, fingerprint=None, name=None):
         self.run = run
         self.files = files
+        self.fingerprint = fingerprint
+        self.name = name
 
 class AnalysisDiagnostic:
     def __init__(self, data, report, htmlReport):
@@ -94,43 +120,228 @@ class AnalysisRun:
             return path[len(self.opts.root):]
         return path
 
-def loadResults(path, opts, deleteEmpty=True):
+# The fields of the diagnostics which are kept when loading results: those
+# identifying and describing the issues.
+DiagnosticFields = ('category', 'description', 'type', 'issue_context',
+                    'issue_hash')
+
+# The cache of the parsed report files of a results directory.
+IndexFileName = "CmpRuns.index"
+IndexVersion = 2
+
+# The hashes of the source files, in this process.
+sourceHashes = {}
+
+def getSourceHash(path):
+    if path not in sourceHashes:
+        try:
+            f = open(path, "rb")
+            try:
+                sourceHashes[path] = hashlib.sha1(f.read()).hexdigest()
+            finally:
+                f.close()
+        except IOError:
+            sourceHashes[path] = None
+    return sourceHashes[path]
+
+class StopScanning(Exception):
+    pass
+
+def hasNoReports(path):
+    """
+    hasNoReports - Check whether a report file has an empty files list,
+    reading it only up to that list.
+
+    Returns None if the file has no files list.
+    """
+    # The files list is an array in the top-level dictionary: plist > dict >
+    # array, after a key element.
+    state = {'depth' : 0, 'key' : None, 'text' : [], 'inFiles' : False,
+             'result' : None}
+    def start(name, attrs):
+        state['depth'] += 1
+        if state['inFiles']:
+            state['result'] = False
+            raise StopScanning()
+        if state['depth'] == 3:
+            if name == 'key':
+                state['text'] = []
+            elif state['key'] == 'files' and name == 'array':
+                state['inFiles'] = True
+    def end(name):
+        if state['depth'] == 3:
+            if name == 'key':
+                state['key'] = ''.join(state['text'])
+            elif state['inFiles']:
+                state['result'] = True
+                raise StopScanning()
+            else:
+                state['key'] = None
+        state['depth'] -= 1
+    def characters(data):
+        if state['depth'] == 3:
+            state['text'].append(data)
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = characters
+    f = open(path, "rb")
+    try:
+        while True:
+            data = f.read(16384)
+            parser.Parse(data, not data)
+            if not data:
+                break
+    except StopScanning:
+        pass
+    finally:
+        f.close()
+    return state['result']
+
+def parsePlist(path, deleteEmpty=False):
+    """
+    parsePlist - Parse a report file into a compact record.
+
+    Returns None if the file has no reports (deleting it if deleteEmpty is
+    true), and a triple (files,
+    diagnostics, fingerprint) otherwise, where diagnostics is a list of
+    (data, htmlReport) pairs. The fingerprint hashes the diagnostics (but
+    not the names of their HTML reports, which differ from run to run) and
+    the current contents of the files.
+    """
+    if hasNoReports(path):
+        if deleteEmpty:
+            os.remove(path)
+        return None
+    data = plistlib.readPlist(path)
+    if not data['files']:
+        if deleteEmpty:
+            os.remove(path)
+        return None
+
+    diagnostics = []
+    for d in data['diagnostics']:
+        # FIXME: Why is this named files, when does it have multiple
+        # files?
+        htmlReport = None
+        if 'HTMLDiagnostics_files' in d:
+            assert len(d['HTMLDiagnostics_files']) == 1
+            htmlReport = d['HTMLDiagnostics_files'][0]
+        compact = dict((k, d[k]) for k in DiagnosticFields if k in d)
+        loc = d['location']
+        compact['location'] = {'file' : loc['file'], 'line' : loc['line'],
+                               'col' : loc['col']}
+        diagnostics.append((compact, htmlReport))
+
+    files = list(data['files'])
+    fingerprint = hashlib.sha1(json.dumps(
+        [files, [getSourceHash(f) for f in files],
+         [d for d, h in diagnostics]], sort_keys=True)).hexdigest()
+    return (files, diagnostics, fingerprint)
+
+def parsePlistJob(args):
+    return parsePlist(*args)
+
+def parsePlists(paths, jobs=None, deleteEmpty=False):
+    """Parse report files with parsePlist, in a pool of processes if there
+    are enough of them."""
+    args = [(p, deleteEmpty) for p in paths]
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    # Daemonic processes, like the workers of SATestBuild -j, cannot have
+    # children.
+    if (jobs <= 1 or len(paths) < 2 * jobs or
+        multiprocessing.current_process().daemon):
+        return map(parsePlistJob, args)
+    pool = multiprocessing.Pool(jobs)
+    try:
+        return pool.map(parsePlistJob, args,
+                        max(len(paths) // (4 * jobs), 1))
+    finally:
+        pool.close()
+        pool.join()
+
+def loadIndex(path):
+    """Return the cached records of a results directory, as a dictionary from
+    file names to ((mtime, size), record) pairs."""
+    try:
+        f = open(os.path.join(path, IndexFileName), "rb")
+        try:
+            version, index = cPickle.load(f)
+        finally:
+            f.close()
+    except Exception:
+        return {}
+    if version != IndexVersion:
+        return {}
+    return index
+
+def saveIndex(path, index):
+    indexPath = os.path.join(path, IndexFileName)
+    try:
+        f = open(indexPath + ".tmp", "wb")
+        try:
+            cPickle.dump((IndexVersion, index), f, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(indexPath + ".tmp", indexPath)
+    except (IOError, OSError):
+        # The index is only a cache.
+        pass
+
+def loadResults(path, opts, deleteEmpty=True, prefix='report'):
+    """
+    loadResults - Load the report files of a results directory whose name
+    starts with prefix, parsing only those which are not in the index.
+    """
     run = AnalysisRun(path, opts)
 
-    for f in os.listdir(path):
-        if (not f.startswith('report') or
-            not f.endswith('plist')):
-            continue
+    allNames = set(os.listdir(path))
+    names = sorted(f for f in allNames
+                   if f.startswith(prefix) and f.endswith('plist'))
+
+    # Only parse the files which are not in the index, or changed.
+    index = loadIndex(path)
+    records = {}
+    toParse = []
+    for f in names:
+        st = os.stat(os.path.join(path, f))
+        key = (st.st_mtime, st.st_size)
+        if f in index and index[f][0] == key:
+            records[f] = index[f][1]
+        else:
+            toParse.append((f, key))
+    parsed = parsePlists([os.path.join(path, f) for f, _ in toParse],
+                         opts.jobs, deleteEmpty)
+
+    # Keep the entries of the other existing files.
+    newIndex = dict((f, e) for f, e in index.items() if f in allNames)
+    modified = len(newIndex) != len(index) or len(toParse) > 0
+    for (f, key), record in zip(toParse, parsed):
+        records[f] = record
+        newIndex[f] = (key, record)
 
-        p = os.path.join(path, f)
-        data = plistlib.readPlist(p)
+    for f in names:
+        record = records[f]
 
         # Ignore/delete empty reports.
-        if not data['files']:
+        if record is None:
             if deleteEmpty == True:
-                os.remove(p)
+                if os.path.exists(os.path.join(path, f)):
+                    os.remove(os.path.join(path, f))
+                del newIndex[f]
+                modified = True
             continue
 
-        # Extract the HTML reports, if they exists.
-        if 'HTMLDiagnostics_files' in data['diagnostics'][0]:
-            htmlFiles = []
-            for d in data['diagnostics']:
-                # FIXME: Why is this named files, when does it have multiple
-                # files?
-                assert len(d['HTMLDiagnostics_files']) == 1
-                htmlFiles.append(d.pop('HTMLDiagnostics_files')[0])
-        else:
-            htmlFiles = [None] * len(data['diagnostics'])
-            
-        report = AnalysisReport(run, data.pop('files'))
-        diagnostics = [AnalysisDiagnostic(d, report, h) 
-                       for d,h in zip(data.pop('diagnostics'),
-                                      htmlFiles)]
-
-        assert not data
-
+        files, diagnostics, fingerprint = record
+        report = AnalysisReport(run, files, fingerprint, f)
         run.reports.append(report)
-        run.diagnostics.extend(diagnostics)
+        run.diagnostics.extend(AnalysisDiagnostic(d, report, h) 
+                               for d, h in diagnostics)
+
+    if modified:
+        saveIndex(path, newIndex)
 
     return run
 
@@ -142,6 +353,40 @@ def getIssueIdentifier(d) :
       id += str(d.data['issue_hash'])
     return id
 
+# Diagnostics without an issue identifier are matched on their location and
+# description instead.
+def getMatchKey(d):
+    id = getIssueIdentifier(d)
+    if id:
+        return id
+    loc = d.data['location']
+    return (d.report.files[loc['file']], loc['line'], loc['col'],
+            d.data['category'], d.data['description'])
+
+# The minimum similarity of two diagnostics matched by the fuzzy stage.
+FuzzyMinSimilarity = 0.5
+# The maximum number of pairs compared in a fuzzy matching bin.
+FuzzyMaxPairs = 10000
+
+def getFuzzyBin(d):
+    """Return the normalized structure of a diagnostic, which fuzzily matched
+    diagnostics must share: its file, category and description, with the
+    quoted names and the numbers abstracted away."""
+    loc = d.data['location']
+    description = re.sub(r"'[^']*'", "'_'", d.data['description'])
+    description = re.sub(r"[0-9]+", "0", description)
+    return (d.report.files[loc['file']], d.data['category'], description)
+
+def getSimilarity(a, b):
+    """Return the similarity of two diagnostics from the same fuzzy bin, from
+    0 to 1."""
+    description = difflib.SequenceMatcher(None, a.data['description'],
+                                          b.data['description']).ratio()
+    distance = abs(a.data['location']['line'] - b.data['location']['line'])
+    line = 1.0 / (1 + distance / 10.0)
+    context = float(a.data.get('issue_context') == b.data.get('issue_context'))
+    return (description + line + context) / 3
+
 def compareResults(A, B):
     """
     compareResults - Generate a relation from diagnostics in run A to
@@ -151,44 +396,125 @@ def compareResults(A, B):
     each element {a,b} is None or an element from the respective run, and
     confidence is a measure of the match quality (where 0 indicates equality,
     and None is used if either element is None).
+
+    Diagnostics with the same issue identifier are matched first, as
+    multisets. The remaining ones are binned by their normalized structure
+    (see getFuzzyBin), and matched within their bin by decreasing
+    similarity; the confidence of such a fuzzy match is 1 - similarity, and
+    at least 0.01 so that it never indicates equality.
     """
 
     res = []
 
-    # Quickly eliminate equal elements.
+    # Match the equal elements, bucketed by identifier.
+    bucketsB = multidict((getMatchKey(b), b) for b in B.diagnostics)
     neqA = []
-    neqB = []
-    eltsA = list(A.diagnostics)
-    eltsB = list(B.diagnostics)
-    eltsA.sort(key = getIssueIdentifier)
-    eltsB.sort(key = getIssueIdentifier)
-    while eltsA and eltsB:
-        a = eltsA.pop()
-        b = eltsB.pop()
-        if (getIssueIdentifier(a) == getIssueIdentifier(b)) :
-            res.append((a, b, 0))
-        elif a.data > b.data:
+    for a in A.diagnostics:
+        bucket = bucketsB.get(getMatchKey(a))
+        if not bucket:
             neqA.append(a)
-            eltsB.append(b)
-        else:
-            neqB.append(b)
-            eltsA.append(a)
-    neqA.extend(eltsA)
-    neqB.extend(eltsB)
-
-    # FIXME: Add fuzzy matching. One simple and possible effective idea would be
-    # to bin the diagnostics, print them in a normalized form (based solely on
-    # the structure of the diagnostic), compute the diff, then use that as the
-    # basis for matching. This has the nice property that we don't depend in any
-    # way on the diagnostic format.
+            continue
+        # Prefer an element with the same data, if there are several.
+        match = 0
+        for i, b in enumerate(bucket):
+            if b.data == a.data:
+                match = i
+                break
+        res.append((a, bucket.pop(match), 0))
+    neqB = []
+    for bucket in bucketsB.values():
+        neqB.extend(bucket)
+    # Keep the order of run B.
+    orderB = dict((id(b), i) for i, b in enumerate(B.diagnostics))
+    neqB.sort(key = lambda b: orderB[id(b)])
+
+    # Fuzzy matching of the rest.
+    binsA = multidict((getFuzzyBin(a), a) for a in neqA)
+    binsB = multidict((getFuzzyBin(b), b) for b in neqB)
+    matchedA = set()
+    matchedB = set()
+    for key, eltsA in binsA.items():
+        eltsB = binsB.get(key)
+        if not eltsB or len(eltsA) * len(eltsB) > FuzzyMaxPairs:
+            continue
+        pairs = []
+        for i, a in enumerate(eltsA):
+            for j, b in enumerate(eltsB):
+                similarity = getSimilarity(a, b)
+                if similarity >= FuzzyMinSimilarity:
+                    pairs.append((-similarity, i, j))
+        pairs.sort()
+        for similarity, i, j in pairs:
+            a, b = eltsA[i], eltsB[j]
+            if id(a) in matchedA or id(b) in matchedB:
+                continue
+            matchedA.add(id(a))
+            matchedB.add(id(b))
+            res.append((a, b, max(1 + similarity, 0.01)))
 
     for a in neqA:
-        res.append((a, None, None))
+        if id(a) not in matchedA:
+            res.append((a, None, None))
     for b in neqB:
-        res.append((None, b, None))
+        if id(b) not in matchedB:
+            res.append((None, b, None))
 
     return res
 
+def getChangedResults(A, B):
+    """
+    getChangedResults - Return the subsets of runs A and B which need to be
+    compared, leaving out the report files which are identical in both.
+
+    A report file is left out only if the issues of its diagnostics do not
+    occur in the report files which changed, so that comparing the subsets
+    gives the same result as comparing the whole runs.
+    """
+    reportsA = multidict((r.fingerprint, r) for r in A.reports)
+    reportsB = multidict((r.fingerprint, r) for r in B.reports)
+    diagnostics = multidict()
+    for d in A.diagnostics + B.diagnostics:
+        diagnostics[id(d.report)] = d
+
+    # The keys of the diagnostics of the pairs of identical reports.
+    unchanged = []
+    for fingerprint, eltsA in reportsA.items():
+        eltsB = reportsB.get(fingerprint, [])
+        for a, b in zip(eltsA, eltsB):
+            keys = set(getMatchKey(d)
+                       for d in diagnostics.get(id(a), []) +
+                                diagnostics.get(id(b), []))
+            unchanged.append((a, b, keys))
+    skipped = set()
+    for a, b, keys in unchanged:
+        skipped.add(id(a))
+        skipped.add(id(b))
+
+    # Compare again the pairs sharing issues with the changed reports,
+    # until there are no more of them.
+    changedKeys = set(getMatchKey(d) for d in A.diagnostics + B.diagnostics
+                      if id(d.report) not in skipped)
+    while True:
+        keep = []
+        for a, b, keys in unchanged:
+            if keys & changedKeys:
+                skipped.discard(id(a))
+                skipped.discard(id(b))
+                changedKeys |= keys
+            else:
+                keep.append((a, b, keys))
+        if len(keep) == len(unchanged):
+            break
+        unchanged = keep
+
+    def getSubset(run):
+        subset = AnalysisRun(run.path, run.opts)
+        subset.reports = [r for r in run.reports if id(r) not in skipped]
+        subset.diagnostics = [d for d in run.diagnostics
+                              if id(d.report) not in skipped]
+        return subset
+    return getSubset(A), getSubset(B)
+
 def cmpScanBuildResults(dirA, dirB, opts, deleteEmpty=True):
     # Load the run results.
     resultsA = loadResults(dirA, opts, deleteEmpty)
@@ -200,7 +526,10 @@ def cmpScanBuildResults(dirA, dirB, opts, deleteEmpty=True):
     else:
         auxLog = None
 
-    diff = compareResults(resultsA, resultsB)
+    if getattr(opts, 'incremental', False):
+        diff = compareResults(*getChangedResults(resultsA, resultsB))
+    else:
+        diff = compareResults(resultsA, resultsB)
     foundDiffs = 0
     for res in diff:
         a,b,confidence = res
@@ -248,6 +577,13 @@ def main():
                       help="Write additional information to LOG [default=None]",
                       action="store", type=str, default=None,
                       metavar="LOG")
+    parser.add_option("-j", "--jobs", dest="jobs",
+                      help="Number of processes parsing the reports "
+                           "[default=number of CPUs]",
+                      action="store", type=int, default=None)
+    parser.add_option("", "--incremental", dest="incremental",
+                      help="Only compare the report files which changed",
+                      action="store_true", default=False)
     (opts, args) = parser.parse_args()
 
     if len(args) != 2:
@@ -10,12 +10,13 @@ Repository Directory will contain sources of the projects as well as the
 information on how to build them and the expected output. 
 Repository Directory structure:
    - ProjectMap file
-   - Historical Performance Data
+   - Historical Performance Data (see SATestPerf.py)
    - Project Dir1
      - ReferenceOutput
    - Project Dir2
      - ReferenceOutput
    ..
+   - Reference Results Cache (see below)
 
 To test the build of the analyzer one would:
    - Copy over a copy of the Repository Directory. (TODO: Prefer to ensure that 
@@ -32,20 +33,36 @@ Assumptions (TODO: shouldn't need to assume these.):
    The compiler for scan-build and scan-build are in the PATH.
    export PATH=/Users/zaks/workspace/c2llvm/build/Release+Asserts/bin:$PATH
 
+Reference results are cached in the Repository Directory, by the hash of the
+project sources, the checkers and the analyzer (clang and scan-build). A
+reference build (-r, -rs) whose inputs did not change since a cached build
+restores the cached results instead of building the project again.
+
 For more logging, set the  env variables:
    zaks:TI zaks$ export CCC_ANALYZER_LOG=1
    zaks:TI zaks$ export CCC_ANALYZER_VERBOSE=1
 """
 import CmpRuns
+import SATestPerf
 
 import os
 import csv
 import sys
 import glob
+import errno
+import hashlib
 import shutil
+import signal
 import time
 import plistlib
-from subprocess import check_call, CalledProcessError
+import json
+import resource
+import threading
+import traceback
+import collections
+import multiprocessing
+import multiprocessing.pool
+from subprocess import Popen, check_call, CalledProcessError
 
 # Project map stores info about all the "registered" projects.
 ProjectMapFile = "projectMap.csv"
@@ -65,6 +82,25 @@ NumOfFailuresInSummary = 10
 FailuresSummaryFileName = "failures.txt"
 # Summary of the result diffs.
 DiffsSummaryFileName = "diffs.txt"
+# When projects are tested in parallel, the output of each project's test is
+# written to this file in the project directory.
+ProjectLogName = "SATestBuild.log"
+
+# The per-file wall time and exit status of the analyzes of preprocessed files
+# projects, in JSON, in the scan-build result directory.
+AnalysisSummaryName = "analysis-summary.json"
+
+# The cache of the reference results, in the Repository Directory, and the
+# file recording the cache key of reference results, in their log folder.
+ReferenceCacheDirName = "ReferenceCache"
+ReferenceKeyName = "reference.key"
+UseReferenceCache = True
+
+# Whether the results are compared in the incremental mode of CmpRuns, which
+# skips the report files fingerprinted identical in both runs. Fingerprints
+# hash the sources when a report file is first indexed, and the index only
+# notices report files whose mtime or size changed, so this is opt-in.
+IncrementalCmp = False
 
 # The scan-build result directory.
 SBOutputDirName = "ScanBuildResults"
@@ -76,6 +112,15 @@ Checkers="experimental.security.taint,core,deadcode,cplusplus,security,unix,osx,
 
 Verbose = 1
 
+# The number of preprocessed files analyzed concurrently.
+AnalysisJobs = multiprocessing.cpu_count()
+
+# Limits of each analyzer or scan-build command: the wall time in seconds and
+# the address space in megabytes, or None. A command which runs out of time
+# is killed, along with its children, and reported as a timeout.
+TimeLimit = None
+MemoryLimit = None
+
 # Make sure we flush the output after every print statement.
 class flushfile(object):
     def __init__(self, f):
@@ -83,6 +128,8 @@ class flushfile(object):
     def write(self, x):
         self.f.write(x)
         self.f.flush()
+    def flush(self):
+        self.f.flush()
 
 sys.stdout = flushfile(sys.stdout)
 
@@ -98,6 +145,173 @@ def getProjectMapPath():
 def getProjectDir(ID):
     return os.path.join(os.path.abspath(os.curdir), ID)        
 
+def getPerfDBPath():
+    return os.path.join(os.path.abspath(os.curdir), SATestPerf.PerfDBName)
+
+# Peak RSS of a resource usage, in kilobytes.
+def getPeakRSS(Usage):
+    if sys.platform == "darwin":
+        return Usage.ru_maxrss // 1024
+    return Usage.ru_maxrss
+
+# The result of runCommand. Times are in seconds, and the peak RSS in
+# kilobytes.
+CommandResult = collections.namedtuple('CommandResult',
+    'ExitStatus Time CPUTime PeakRSS TimedOut')
+
+# Run a command within TimeLimit and MemoryLimit, with its output going to
+# LogFile, and measure its resource usage.
+def runCommand(Command, Cwd, LogFile, Shell=False):
+    def setLimits():
+        # Kill the children of the command along with it, on timeouts.
+        if TimeLimit is not None:
+            os.setpgrp()
+        if MemoryLimit is not None:
+            Bytes = MemoryLimit * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (Bytes, Bytes))
+
+    # Running Python code between fork and exec may deadlock when other
+    # threads hold locks (e.g. in analyzePreprocessedFile), so only do it
+    # when there are limits to set.
+    PreExec = None
+    if TimeLimit is not None or MemoryLimit is not None:
+        PreExec = setLimits
+
+    TBegin = time.time()
+    Process = Popen(Command, cwd = Cwd, stderr=LogFile, stdout=LogFile,
+                    shell=Shell, preexec_fn=PreExec)
+    TimedOut = []
+    def kill():
+        TimedOut.append(True)
+        try:
+            os.killpg(Process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    Timer = None
+    if TimeLimit is not None:
+        Timer = threading.Timer(TimeLimit, kill)
+        Timer.start()
+    try:
+        # Wait with wait4, to get the resource usage of this very command.
+        while True:
+            try:
+                (_, Status, Usage) = os.wait4(Process.pid, 0)
+                break
+            except OSError, e:
+                if e.errno != errno.EINTR:
+                    raise
+    finally:
+        if Timer is not None:
+            Timer.cancel()
+
+    if os.WIFSIGNALED(Status):
+        Process.returncode = -os.WTERMSIG(Status)
+    else:
+        Process.returncode = os.WEXITSTATUS(Status)
+    return CommandResult(Process.returncode, time.time() - TBegin,
+                         Usage.ru_utime + Usage.ru_stime, getPeakRSS(Usage),
+                         bool(TimedOut))
+
+def printCommandResult(Result):
+    if Verbose == 1:
+        print "  Time: %.2fs, CPU time: %.2fs, peak RSS: %d KB." % \
+              (Result.Time, Result.CPUTime, Result.PeakRSS)
+
+def getReferenceCacheDir():
+    return os.path.join(os.path.abspath(os.curdir), ReferenceCacheDirName)
+
+def findExecutable(Name):
+    for Dir in os.environ.get("PATH", "").split(os.pathsep):
+        Path = os.path.join(Dir, Name)
+        if os.path.isfile(Path) and os.access(Path, os.X_OK):
+            return os.path.realpath(Path)
+    return None
+
+def hashFile(Hash, Path):
+    F = open(Path, "rb")
+    try:
+        while True:
+            Data = F.read(1 << 20)
+            if not Data:
+                break
+            Hash.update(Data)
+    finally:
+        F.close()
+
+# The version control metadata directories, which are not project sources.
+VCSDirNames = set([".svn", ".git", ".hg", ".bzr", "CVS"])
+
+# Hash of the sources of a project, ignoring the results of its tests.
+def getProjectSourceHash(Dir):
+    Ignored = set([SBOutputDirName, getSBOutputDirName(True),
+                   ProjectLogName])
+    Hash = hashlib.sha1()
+    for (Root, Dirs, Files) in os.walk(Dir):
+        if Root == Dir:
+            Dirs[:] = [D for D in Dirs if D not in Ignored]
+            Files = [F for F in Files if F not in Ignored]
+        Dirs[:] = [D for D in Dirs if D not in VCSDirNames]
+        Dirs.sort()
+        for F in sorted(Files):
+            Path = os.path.join(Root, F)
+            Hash.update(os.path.relpath(Path, Dir) + "\0")
+            if os.path.islink(Path):
+                Hash.update(os.readlink(Path))
+            elif os.path.isfile(Path):
+                hashFile(Hash, Path)
+            Hash.update("\0")
+    return Hash.hexdigest()
+
+# Key of the reference results of a project in the cache.
+def getReferenceKey(Dir):
+    Hash = hashlib.sha1()
+    Hash.update(getProjectSourceHash(Dir) + "\0" + Checkers + "\0")
+    for Name in ("clang", "scan-build"):
+        Path = findExecutable(Name)
+        if Path is not None:
+            hashFile(Hash, Path)
+        Hash.update("\0")
+    return Hash.hexdigest()
+
+def getReferenceKeyPath(SBOutputDir):
+    return os.path.join(SBOutputDir, LogFolderName, ReferenceKeyName)
+
+# Restore the reference results with the given key from the cache. Returns
+# False if they are not cached.
+def restoreReferenceResults(Key, SBOutputDir):
+    KeyPath = getReferenceKeyPath(SBOutputDir)
+    if os.path.exists(KeyPath) and open(KeyPath).read().strip() == Key:
+        return True
+    CachedDir = os.path.join(getReferenceCacheDir(), Key)
+    if not os.path.exists(CachedDir):
+        return False
+    if os.path.exists(SBOutputDir):
+        shutil.rmtree(SBOutputDir)
+    shutil.copytree(CachedDir, SBOutputDir, symlinks=True)
+    return True
+
+# Store reference results in the cache, under the given key.
+def storeReferenceResults(Key, SBOutputDir):
+    KeyFile = open(getReferenceKeyPath(SBOutputDir), "w")
+    try:
+        KeyFile.write(Key + "\n")
+    finally:
+        KeyFile.close()
+    CachedDir = os.path.join(getReferenceCacheDir(), Key)
+    if os.path.exists(CachedDir):
+        return
+    # Copy, then rename, so that projects built in parallel never see
+    # partial results.
+    TmpDir = "%s.%d" % (CachedDir, os.getpid())
+    # The CmpRuns indexes are local caches of the results.
+    shutil.copytree(SBOutputDir, TmpDir, symlinks=True,
+                    ignore=shutil.ignore_patterns(CmpRuns.IndexFileName))
+    try:
+        os.rename(TmpDir, CachedDir)
+    except OSError:
+        # Another process cached the same results.
+        shutil.rmtree(TmpDir)
+
 def getSBOutputDirName(IsReferenceBuild) :
     if IsReferenceBuild == True :
         return SBOutputDirReferencePrefix + SBOutputDirName
@@ -124,7 +338,8 @@ def runCleanupScript(Dir, PBuildLogFile):
             sys.exit(-1)
 
 # Build the project with scan-build by reading in the commands and 
-# prefixing them with the scan-build options.
+# prefixing them with the scan-build options. Returns the CommandResults of
+# the commands.
 def runScanBuild(Dir, SBOutputDir, PBuildLogFile):
     BuildScriptPath = os.path.join(Dir, BuildScript)
     if not os.path.exists(BuildScriptPath):
@@ -132,20 +347,44 @@ def runScanBuild(Dir, SBOutputDir, PBuildLogFile):
         sys.exit(-1)       
     SBOptions = "-plist-html -o " + SBOutputDir + " "
     SBOptions += "-enable-checker " + Checkers + " "  
+    Results = []
     try:
         SBCommandFile = open(BuildScriptPath, "r")
         SBPrefix = "scan-build " + SBOptions + " "
-        for Command in SBCommandFile:
+        for (Idx, Command) in enumerate(SBCommandFile):
             SBCommand = SBPrefix + Command
             if Verbose == 1:        
                 print "  Executing: %s" % (SBCommand,)
-            check_call(SBCommand, cwd = Dir, stderr=PBuildLogFile,
-                                             stdout=PBuildLogFile, 
-                                             shell=True)
+            Result = runCommand(SBCommand, Dir, PBuildLogFile, Shell=True)
+            Results.append(Result)
+            printCommandResult(Result)
+            if Result.TimedOut:
+                # Leave the reporting to checkBuild; the next commands would
+                # fail anyway.
+                writeTimeout(os.path.join(SBOutputDir, LogFolderName,
+                                          "failures",
+                                          "command%d" % (Idx + 1,)),
+                             SBCommand)
+                break
+            if Result.ExitStatus != 0:
+                raise CalledProcessError(Result.ExitStatus, SBCommand)
     except:
         print "Error: scan-build failed. See ",PBuildLogFile.name,\
               " for details."
         raise
+    return Results
+
+# Record that a command timed out, in a timeout log next to the stderr logs
+# of the failures. Name is the log name, without extension.
+def writeTimeout(Name, Command):
+    if not os.path.exists(os.path.dirname(Name)):
+        os.makedirs(os.path.dirname(Name))
+    TimeoutLog = open(Name + ".timeout.txt", "w")
+    try:
+        TimeoutLog.write("Timed out after %d seconds: %s\n" % 
+                         (TimeLimit, Command))
+    finally:
+        TimeoutLog.close()
 
 def hasNoExtension(FileName):
     (Root, Ext) = os.path.splitext(FileName)
@@ -161,23 +400,40 @@ def isValidSingleInputFile(FileName):
         return True
     return False
 
-# Run analysis on a set of preprocessed files.
+# Analyze a single preprocessed file, logging the analyzer output to LogPath.
+# Returns (FileName, CommandResult).
+def analyzePreprocessedFile(Args):
+    (Dir, FileName, PlistPath, LogPath) = Args
+    Command = ["clang", "-cc1", "-analyze", "-analyzer-output=plist", "-w",
+               "-analyzer-checker=" + Checkers, "-fcxx-exceptions", "-fblocks",
+               "-o", os.path.join(PlistPath, FileName) + ".plist",
+               os.path.join(Dir, FileName)]
+    LogFile = open(LogPath, "w+b")
+    try:
+        try:
+            Result = runCommand(Command, Dir, LogFile)
+        except OSError, e:
+            print >> LogFile, "Error: Could not run %s: %s" % (Command[0], e)
+            Result = CommandResult(-1, 0.0, 0.0, 0, False)
+    finally:
+        LogFile.close()
+    return (FileName, Result)
+
+# Run analysis on a set of preprocessed files. Returns the CommandResults of
+# the analyzes.
 def runAnalyzePreprocessed(Dir, SBOutputDir):
     if os.path.exists(os.path.join(Dir, BuildScript)):
         print "Error: The preprocessed files project should not contain %s" % \
                BuildScript
         raise Exception()       
 
-    CmdPrefix = "clang -cc1 -analyze -analyzer-output=plist -w "
-    CmdPrefix += "-analyzer-checker=" + Checkers +" -fcxx-exceptions -fblocks "   
-    
     PlistPath = os.path.join(Dir, SBOutputDir, "date")
     FailPath = os.path.join(PlistPath, "failures");
     os.makedirs(FailPath);
  
-    for FullFileName in glob.glob(Dir + "/*"):
+    Jobs = []
+    for FullFileName in sorted(glob.glob(Dir + "/*")):
         FileName = os.path.basename(FullFileName)
-        Failed = False
         
         # Only run the analyzes on supported files.
         if (hasNoExtension(FileName)):
@@ -186,28 +442,50 @@ def runAnalyzePreprocessed(Dir, SBOutputDir):
             print "Error: Invalid single input file %s." % (FullFileName,)
             raise Exception()
         
-        # Build and call the analyzer command.
-        OutputOption = "-o " + os.path.join(PlistPath, FileName) + ".plist "
-        Command = CmdPrefix + OutputOption + os.path.join(Dir, FileName)
-        LogFile = open(os.path.join(FailPath, FileName + ".stderr.txt"), "w+b")
-        try:
-            if Verbose == 1:        
-                print "  Executing: %s" % (Command,)
-            check_call(Command, cwd = Dir, stderr=LogFile,
-                                           stdout=LogFile, 
-                                           shell=True)
-        except CalledProcessError, e:
+        LogPath = os.path.join(FailPath, FileName + ".stderr.txt")
+        Jobs.append((Dir, FileName, PlistPath, LogPath))
+
+    # The analyzes run in subprocesses, so threads are enough to keep them
+    # busy. Threads also work when the project itself is being tested in a
+    # worker process.
+    if Verbose == 1:
+        print "  Analyzing %d files, %d at a time." % (len(Jobs), AnalysisJobs)
+    Pool = multiprocessing.pool.ThreadPool(max(min(AnalysisJobs, len(Jobs)), 1))
+    try:
+        Results = Pool.map(analyzePreprocessedFile, Jobs, 1)
+    finally:
+        Pool.close()
+        Pool.join()
+
+    Summary = []
+    for ((_, FileName, _, LogPath), (_, Result)) in zip(Jobs, Results):
+        Summary.append({"file": FileName, "exit_status": Result.ExitStatus,
+                        "time": Result.Time, "cpu_time": Result.CPUTime,
+                        "peak_rss": Result.PeakRSS,
+                        "timed_out": Result.TimedOut})
+        if Result.TimedOut:
+            print "Error: Analyzes of %s timed out after %d seconds." % \
+                   (os.path.join(Dir, FileName), TimeLimit)
+            # Timeouts are reported separately from the failures.
+            os.remove(LogPath)
+            writeTimeout(os.path.join(FailPath, FileName),
+                         os.path.join(Dir, FileName))
+        elif Result.ExitStatus != 0:
             print "Error: Analyzes of %s failed. See %s for details." \
                   "Error code %d." % \
-                   (FullFileName, LogFile.name, e.returncode)
-            Failed = True       
-        finally:
-            LogFile.close()            
-        
-        # If command did not fail, erase the log file.
-        if Failed == False:
-            os.remove(LogFile.name);
+                   (os.path.join(Dir, FileName), LogPath, Result.ExitStatus)
+        else:
+            # If command did not fail, erase the log file.
+            os.remove(LogPath);
 
+    SummaryFile = open(os.path.join(Dir, SBOutputDir, AnalysisSummaryName), "w")
+    try:
+        json.dump(Summary, SummaryFile, indent=2)
+    finally:
+        SummaryFile.close()
+    return [Result for (_, Result) in Results]
+
+# Returns the CommandResults of the scan-build or analyzer commands.
 def buildProject(Dir, SBOutputDir, IsScanBuild, IsReferenceBuild):
     TBegin = time.time() 
 
@@ -239,9 +517,9 @@ def buildProject(Dir, SBOutputDir, IsScanBuild, IsReferenceBuild):
         runCleanupScript(Dir, PBuildLogFile)
         
         if IsScanBuild:
-            runScanBuild(Dir, SBOutputDir, PBuildLogFile)
+            Results = runScanBuild(Dir, SBOutputDir, PBuildLogFile)
         else:
-            runAnalyzePreprocessed(Dir, SBOutputDir)
+            Results = runAnalyzePreprocessed(Dir, SBOutputDir)
         
         if IsReferenceBuild :
             runCleanupScript(Dir, PBuildLogFile)
@@ -251,32 +529,47 @@ def buildProject(Dir, SBOutputDir, IsScanBuild, IsReferenceBuild):
         
     print "Build complete (time: %.2f). See the log for more details: %s" % \
            ((time.time()-TBegin), BuildLogPath) 
+    return Results
        
 # A plist file is created for each call to the analyzer(each source file).
 # We are only interested on the once that have bug reports, so delete the rest.        
+# Returns a dictionary from the remaining plist files to their number of
+# reports.
+# The plist files are scanned once, in parallel, and indexed for the
+# comparison of the results.
 def CleanUpEmptyPlists(SBOutputDir):
-    for F in glob.glob(SBOutputDir + "/*/*.plist"):
-        P = os.path.join(SBOutputDir, F)
-        
-        Data = plistlib.readPlist(P)
-        # Delete empty reports.
-        if not Data['files']:
-            os.remove(P)
+    Reports = {}
+    Opts = CmpRuns.CmpOptions()
+    for Dir in glob.glob(SBOutputDir + "/*"):
+        if not os.path.isdir(Dir):
             continue
+        Run = CmpRuns.loadResults(Dir, Opts, deleteEmpty=True, prefix="")
+        for Report in Run.reports:
+            Reports[os.path.join(Dir, Report.name)] = 0
+        for D in Run.diagnostics:
+            Reports[os.path.join(Dir, D.report.name)] += 1
+    return Reports
+
+# The logs of the commands which timed out, which are reported separately
+# from the failures.
+def getTimeouts(SBOutputDir):
+    return glob.glob(SBOutputDir + "/*/failures/*.timeout.txt")
 
 # Given the scan-build output directory, checks if the build failed 
 # (by searching for the failures directories). If there are failures, it 
-# creates a summary file in the output directory.         
+# creates a summary file in the output directory. Otherwise, returns the
+# number of reports of each non empty plist file.
 def checkBuild(SBOutputDir):
     # Check if there are failures.
     Failures = glob.glob(SBOutputDir + "/*/failures/*.stderr.txt")
     TotalFailed = len(Failures);
-    if TotalFailed == 0:
-        CleanUpEmptyPlists(SBOutputDir)
-        Plists = glob.glob(SBOutputDir + "/*/*.plist")
+    Timeouts = getTimeouts(SBOutputDir)
+    TotalTimedOut = len(Timeouts)
+    if TotalFailed == 0 and TotalTimedOut == 0:
+        Reports = CleanUpEmptyPlists(SBOutputDir)
         print "Number of bug reports (non empty plist files) produced: %d" %\
-           len(Plists)
-        return;
+           len(Reports)
+        return Reports
     
     # Create summary file to display when the build fails.
     SummaryPath = os.path.join(SBOutputDir, LogFolderName, FailuresSummaryFileName)
@@ -286,6 +579,9 @@ def checkBuild(SBOutputDir):
     SummaryLog = open(SummaryPath, "w+")
     try:
         SummaryLog.write("Total of %d failures discovered.\n" % (TotalFailed,))
+        if TotalTimedOut > 0:
+            SummaryLog.write("Total of %d timeouts discovered.\n" %
+                             (TotalTimedOut,))
         if TotalFailed > NumOfFailuresInSummary:
             SummaryLog.write("See the first %d below.\n" 
                                                    % (NumOfFailuresInSummary,))
@@ -303,6 +599,17 @@ def checkBuild(SBOutputDir):
                 shutil.copyfileobj(FailLogI, SummaryLog);
             finally:
                 FailLogI.close()
+
+        # The timeout logs are short: list them all.
+        Idx = 0
+        for TimeoutLogPathI in Timeouts:
+            Idx += 1
+            SummaryLog.write("\n-- Timeout #%d -----------\n" % (Idx,));
+            TimeoutLogI = open(TimeoutLogPathI, "r");
+            try: 
+                shutil.copyfileobj(TimeoutLogI, SummaryLog);
+            finally:
+                TimeoutLogI.close()
     finally:
         SummaryLog.close()
     
@@ -341,7 +648,7 @@ def runCmpResults(Dir):
         NewList.sort()
     
     # Iterate and find the differences.
-    NumDiffs = 0
+    TotalDiffs = 0
     PairList = zip(RefList, NewList)    
     for P in PairList:    
         RefDir = P[0] 
@@ -352,7 +659,7 @@ def runCmpResults(Dir):
             print "  Comparing Results: %s %s" % (RefDir, NewDir)
     
         DiffsPath = os.path.join(NewDir, DiffsSummaryFileName)
-        Opts = CmpRuns.CmpOptions(DiffsPath)
+        Opts = CmpRuns.CmpOptions(DiffsPath, incremental=IncrementalCmp)
         # Discard everything coming out of stdout (CmpRun produces a lot of them).
         OLD_STDOUT = sys.stdout
         sys.stdout = Discarder()
@@ -362,10 +669,28 @@ def runCmpResults(Dir):
         if (NumDiffs > 0) :
             print "Warning: %r differences in diagnostics. See %s" % \
                   (NumDiffs, DiffsPath,)
+        TotalDiffs += NumDiffs
                     
     print "Diagnostic comparison complete (time: %.2f)." % (time.time()-TBegin) 
-    return (NumDiffs > 0)
+    return (TotalDiffs > 0)
     
+# Keep the CmpRuns indexes of the result directories of a newly added
+# reference results directory, which are local caches, out of SVN.
+def ignoreIndexFiles(SBOutputDir):
+    for Dir in glob.glob(os.path.join(SBOutputDir, "*")):
+        if not os.path.isdir(Dir) or os.path.basename(Dir) == LogFolderName:
+            continue
+        Commands = ["svn propset svn:ignore %s %s" % (CmpRuns.IndexFileName,
+                                                      Dir)]
+        IndexPath = os.path.join(Dir, CmpRuns.IndexFileName)
+        if os.path.exists(IndexPath):
+            # Unschedule the addition, keeping the file.
+            Commands.insert(0, "svn revert %s" % (IndexPath,))
+        for Command in Commands:
+            if Verbose == 1:
+                print "  Executing: %s" % (Command,)
+            check_call(Command, shell=True)
+
 def updateSVN(Mode, ProjectsMap):
     try:
         ProjectsMap.seek(0)    
@@ -381,6 +706,8 @@ def updateSVN(Mode, ProjectsMap):
             if Verbose == 1:        
                 print "  Executing: %s" % (Command,)
             check_call(Command, shell=True)    
+            if Mode != "delete":
+                ignoreIndexFiles(Path)
     
         if Mode == "delete":
             CommitCommand = "svn commit -m \"[analyzer tests] Remove " \
@@ -395,7 +722,35 @@ def updateSVN(Mode, ProjectsMap):
         print "Error: SVN update failed."
         sys.exit(-1)
         
-def testProject(ID, IsScanBuild, IsReferenceBuild=False, Dir=None):
+# Record the performance of a project build in the performance database.
+# Usage is the resource usage of the build's subprocesses, and Reports the
+# result of checkBuild.
+def recordPerformance(RunID, ID, SBOutputDir, Time, Usage, Reports, Status):
+    Files = []
+    SummaryPath = os.path.join(SBOutputDir, AnalysisSummaryName)
+    if os.path.exists(SummaryPath):
+        ReportsPerFile = {}
+        for (P, N) in Reports.items():
+            ReportsPerFile[os.path.basename(P)] = N
+        SummaryFile = open(SummaryPath)
+        try:
+            for F in json.load(SummaryFile):
+                Files.append((F["file"], F["time"], F["cpu_time"],
+                              F["peak_rss"],
+                              ReportsPerFile.get(F["file"] + ".plist", 0),
+                              F["exit_status"]))
+        finally:
+            SummaryFile.close()
+
+    DB = SATestPerf.PerfDB(getPerfDBPath())
+    try:
+        DB.addProject(RunID, ID, Time, Usage[0], Usage[1],
+                      sum(Reports.values()), Status, Files)
+    finally:
+        DB.close()
+
+def testProject(ID, IsScanBuild, IsReferenceBuild=False, Dir=None,
+                RunID=None):
     print " \n\n--- Building project %s" % (ID,)
 
     TBegin = time.time() 
@@ -408,18 +763,184 @@ def testProject(ID, IsScanBuild, IsReferenceBuild=False, Dir=None):
     # Set the build results directory.
     RelOutputDir = getSBOutputDirName(IsReferenceBuild)
     SBOutputDir = os.path.join(Dir, RelOutputDir)
+
+    # Skip the reference builds whose inputs did not change.
+    if IsReferenceBuild and UseReferenceCache:
+        Key = getReferenceKey(Dir)
+        if restoreReferenceResults(Key, SBOutputDir):
+            print "Reference results are up to date (cache key %s)." % (Key,)
+            print "Completed tests for project %s (time: %.2f)." % \
+                  (ID, (time.time()-TBegin))
+            return False
                 
-    buildProject(Dir, SBOutputDir, IsScanBuild, IsReferenceBuild)
+    UsageBefore = resource.getrusage(resource.RUSAGE_CHILDREN)
+    TBuild = time.time()
+    Results = buildProject(Dir, SBOutputDir, IsScanBuild, IsReferenceBuild)
+    BuildTime = time.time() - TBuild
+    UsageAfter = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # The peak RSS of the children is not a delta, so it is taken from the
+    # commands of the project.
+    Usage = (UsageAfter.ru_utime + UsageAfter.ru_stime -
+             UsageBefore.ru_utime - UsageBefore.ru_stime,
+             max([R.PeakRSS for R in Results] or [0]))
+
+    Reports = {}
+    Status = "FAIL"
+    try:
+        Reports = checkBuild(SBOutputDir)
+        Status = "PASS"
+    finally:
+        if RunID is not None:
+            recordPerformance(RunID, ID, SBOutputDir, BuildTime, Usage,
+                              Reports, Status)
 
-    checkBuild(SBOutputDir)
+    if IsReferenceBuild and UseReferenceCache:
+        storeReferenceResults(Key, SBOutputDir)
     
+    HasDiffs = False
     if IsReferenceBuild == False:
-        runCmpResults(Dir)
+        HasDiffs = runCmpResults(Dir)
         
     print "Completed tests for project %s (time: %.2f)." % \
           (ID, (time.time()-TBegin))
-    
-def testAll(IsReferenceBuild = False, UpdateSVN = False):
+    return HasDiffs
+
+# The queue on which the worker processes announce the project they test, as
+# (ID, PID) pairs.
+WorkerStarted = None
+
+def initWorker(Started):
+    global WorkerStarted
+    WorkerStarted = Started
+
+def isProcessAlive(PID):
+    try:
+        os.kill(PID, 0)
+    except OSError:
+        return False
+    return True
+
+# Test a project in a worker process, with the output going to the project's
+# log file. Returns (ID, Status, Time, LogPath), where Status is "PASS",
+# "DIFF", "FAIL" or "TIMEOUT".
+def testProjectInWorker(Args):
+    (ID, IsScanBuild, IsReferenceBuild, RunID) = Args
+    TBegin = time.time()
+    if WorkerStarted is not None:
+        WorkerStarted.put((ID, os.getpid()))
+    LogPath = os.path.join(getProjectDir(ID), ProjectLogName)
+    LogFile = open(LogPath, "w")
+    OldStdout = sys.stdout
+    sys.stdout = flushfile(LogFile)
+    try:
+        try:
+            if testProject(ID, IsScanBuild, IsReferenceBuild,
+                           RunID=RunID):
+                Status = "DIFF"
+            else:
+                Status = "PASS"
+        # Failures are reported by exiting.
+        except (SystemExit, Exception):
+            traceback.print_exc(file=sys.stdout)
+            Status = "FAIL"
+            if getTimeouts(os.path.join(getProjectDir(ID),
+                                        getSBOutputDirName(IsReferenceBuild))):
+                Status = "TIMEOUT"
+    finally:
+        sys.stdout = OldStdout
+        LogFile.close()
+    return (ID, Status, time.time() - TBegin, LogPath)
+
+# Test the projects in a pool of Jobs processes. If FailFast is set, no new
+# project is started after the first failure. Returns the list of results of
+# testProjectInWorker, sorted by project ID. A project whose worker process
+# died is reported as "FAIL".
+def testProjectsInParallel(Projects, IsReferenceBuild, RunID, Jobs, FailFast):
+    import Queue
+    Results = []
+    Started = multiprocessing.Queue()
+    Pool = multiprocessing.Pool(Jobs, initWorker, (Started,),
+                                maxtasksperchild=1)
+    # Maps the ID of a running project to its AsyncResult and start time.
+    Running = {}
+    # Maps the ID of a running project to the PID of its worker process.
+    PIDs = {}
+    # The running projects whose worker process was found dead once.
+    Dead = set()
+    Lost = False
+    try:
+        Pending = list(Projects)
+        Failed = False
+        while Pending or Running:
+            while Pending and len(Running) < Jobs and \
+                  not (FailFast and Failed):
+                (ID, IsScanBuild) = Pending.pop(0)
+                Running[ID] = (Pool.apply_async(testProjectInWorker,
+                                                ((ID, IsScanBuild,
+                                                  IsReferenceBuild, RunID),)),
+                               time.time())
+            if not Running:
+                break
+            # Poll, so that the wait can be interrupted and dead workers are
+            # noticed.
+            time.sleep(1)
+            while True:
+                try:
+                    (ID, PID) = Started.get_nowait()
+                except Queue.Empty:
+                    break
+                PIDs[ID] = PID
+            for ID, (Async, TBegin) in sorted(Running.items()):
+                LogPath = os.path.join(getProjectDir(ID), ProjectLogName)
+                if Async.ready():
+                    try:
+                        Result = Async.get()
+                    except Exception, E:
+                        print "  %s: error in worker: %s" % (ID, E)
+                        Result = (ID, "FAIL", time.time() - TBegin, LogPath)
+                elif ID in PIDs and not isProcessAlive(PIDs[ID]):
+                    # The result of a worker may still be on its way.
+                    if ID not in Dead:
+                        Dead.add(ID)
+                        continue
+                    print "  %s: worker process %d died" % (ID, PIDs[ID])
+                    Lost = True
+                    Result = (ID, "FAIL", time.time() - TBegin, LogPath)
+                else:
+                    continue
+                del Running[ID]
+                Results.append(Result)
+                print "  %s: %s (time: %.2f)" % Result[:3]
+                if Result[1] in ("FAIL", "TIMEOUT"):
+                    Failed = True
+    finally:
+        # The tasks of dead workers never complete, so the pool cannot be
+        # joined once one of them died.
+        if Running or Lost:
+            Pool.terminate()
+        else:
+            Pool.close()
+        Pool.join()
+
+    Results.sort()
+    return Results
+
+def printProjectsSummary(Results, NumProjects):
+    print "\n--- Summary"
+    for (ID, Status, Time, LogPath) in Results:
+        print "%-30s %-4s (time: %.2f) log: %s" % (ID, Status, Time, LogPath)
+    Counts = {}
+    for Result in Results:
+        Counts[Result[1]] = Counts.get(Result[1], 0) + 1
+    print "%d passed, %d with differences, %d failed, %d timed out, " \
+          "%d not run." % \
+          (Counts.get("PASS", 0), Counts.get("DIFF", 0),
+           Counts.get("FAIL", 0), Counts.get("TIMEOUT", 0),
+           NumProjects - len(Results))
+
+def testAll(IsReferenceBuild = False, UpdateSVN = False, Jobs = 1,
+            FailFast = False):
+    global AnalysisJobs
     PMapFile = open(getProjectMapPath(), "rb")
     try:        
         # Validate the input.
@@ -437,10 +958,28 @@ def testAll(IsReferenceBuild = False, UpdateSVN = False):
             assert(IsReferenceBuild == True);
             updateSVN("delete",  PMapFile);
             
+        # Record the run in the performance database.
+        DB = SATestPerf.PerfDB(getPerfDBPath())
+        try:
+            RunID = DB.startRun(IsReferenceBuild, Checkers)
+        finally:
+            DB.close()
+
         # Test the projects.
         PMapFile.seek(0)    
-        for I in csv.reader(PMapFile):
-            testProject(I[0], int(I[1]), IsReferenceBuild)
+        if Jobs > 1:
+            Projects = [(I[0], int(I[1])) for I in csv.reader(PMapFile)]
+            # Share the cores between the projects.
+            AnalysisJobs = max(AnalysisJobs // Jobs, 1)
+            Results = testProjectsInParallel(Projects, IsReferenceBuild,
+                                             RunID, Jobs, FailFast)
+            printProjectsSummary(Results, len(Projects))
+            if len(Results) != len(Projects) or \
+               [R for R in Results if R[1] in ("FAIL", "TIMEOUT")]:
+                sys.exit(-1)
+        else:
+            for I in csv.reader(PMapFile):
+                testProject(I[0], int(I[1]), IsReferenceBuild, RunID=RunID)
 
         # Add reference results to SVN.
         if UpdateSVN == True:
@@ -455,16 +994,51 @@ def testAll(IsReferenceBuild = False, UpdateSVN = False):
 if __name__ == '__main__':
     IsReference = False
     UpdateSVN = False
-    if len(sys.argv) >= 2:
-        if sys.argv[1] == "-r":
+    Jobs = 1
+    FailFast = False
+    Args = sys.argv[1:]
+    while Args:
+        Arg = Args.pop(0)
+        if Arg == "-r":
             IsReference = True
-        elif sys.argv[1] == "-rs":
+        elif Arg == "-rs":
             IsReference = True
             UpdateSVN = True
+        elif Arg == "-j" and Args and Args[0].isdigit():
+            Jobs = int(Args.pop(0))
+        elif Arg.startswith("-j") and Arg[2:].isdigit():
+            Jobs = int(Arg[2:])
+        elif Arg == "--fail-fast":
+            FailFast = True
+        elif Arg == "--timeout" and Args and Args[0].isdigit():
+            TimeLimit = int(Args.pop(0))
+        elif Arg == "--memory-limit" and Args and Args[0].isdigit():
+            MemoryLimit = int(Args.pop(0))
+        elif Arg == "--no-reference-cache":
+            UseReferenceCache = False
+        elif Arg == "--incremental-cmp":
+            IncrementalCmp = True
         else:     
           print >> sys.stderr, 'Usage: ', sys.argv[0],\
-                             '[-r|-rs]' \
-                             'Use -r to regenerate reference output' \
-                             'Use -rs to regenerate reference output and update svn'
+                             '[-r|-rs] [-j N] [--fail-fast] ' \
+                             '[--timeout SECONDS] [--memory-limit MB] ' \
+                             '[--no-reference-cache] ' \
+                             '[--incremental-cmp]\n' \
+                             'Use -r to regenerate reference output\n' \
+                             'Use -rs to regenerate reference output and ' \
+                             'update svn\n' \
+                             'Use -j N to test (or build the reference ' \
+                             'output of) N projects in parallel, ' \
+                             'each logging to %s in its directory\n' \
+                             'Use --fail-fast to start no new project ' \
+                             'after a failure\n' \
+                             'Use --timeout and --memory-limit to limit ' \
+                             'each analyzer or scan-build command\n' \
+                             'Use --no-reference-cache to rebuild all the ' \
+                             'reference output, ignoring %s\n' \
+                             'Use --incremental-cmp to only compare the ' \
+                             'report files which changed' % \
+                             (ProjectLogName, ReferenceCacheDirName)
+          sys.exit(-1)
 
-    testAll(IsReference, UpdateSVN)
+    testAll(IsReference, UpdateSVN, max(Jobs, 1), FailFast)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+"""
+SATestPerf - Historical performance data of the static analyzer tests.
+
+SATestBuild records every test run into a SQLite database in the Repository
+Directory. For each project it stores the wall time, CPU time and peak RSS of
+the build, and the number of bug reports produced. For preprocessed files
+projects, the same measurements are also stored per analyzed file.
+
+The database can be queried to find slowdowns:
+
+  SATestPerf.py list
+  SATestPerf.py compare [--run N] [--reference N]
+
+By default, the last run is compared to the last reference run (a run of
+SATestBuild.py -r) which precedes it. Runs without measurements are skipped.
+Reference results restored from the cache are not measured, so a project
+which is not in the reference run is compared to its last measured
+reference run instead. A project or file is reported as slower
+when its time grew by more than the threshold and the growth is significant:
+ - it is larger than three standard deviations of the times of the recent
+   reference runs, if there are several of them;
+ - for preprocessed files projects, more files got slower than faster, with a
+   one sided sign test over the files below the significance level.
+compare exits with 1 if a slowdown was found.
+"""
+
+import os
+import sys
+import math
+import time
+import sqlite3
+
+# The database file, in the Repository Directory.
+PerfDBName = "performance.sqlite"
+
+# The number of most recent reference runs used to estimate the noise of the
+# measurements.
+NumOfReferenceRuns = 10
+
+Schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL,
+    reference INTEGER,
+    checkers TEXT
+);
+CREATE TABLE IF NOT EXISTS projects (
+    run INTEGER,
+    project TEXT,
+    wall_time REAL,
+    cpu_time REAL,
+    peak_rss INTEGER,
+    reports INTEGER,
+    status TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    run INTEGER,
+    project TEXT,
+    file TEXT,
+    wall_time REAL,
+    cpu_time REAL,
+    peak_rss INTEGER,
+    reports INTEGER,
+    exit_status INTEGER
+);
+CREATE INDEX IF NOT EXISTS projects_run ON projects (run, project);
+CREATE INDEX IF NOT EXISTS files_run ON files (run, project);
+"""
+
+class PerfDB:
+    def __init__(self, path):
+        # Projects tested in parallel write to the database concurrently.
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.executescript(Schema)
+
+    def close(self):
+        self.connection.close()
+
+    def startRun(self, isReference, checkers=None):
+        """Record a new run, and return its ID."""
+        cursor = self.connection.execute(
+            "INSERT INTO runs (started, reference, checkers) VALUES (?, ?, ?)",
+            (time.time(), int(bool(isReference)), checkers))
+        self.connection.commit()
+        return cursor.lastrowid
+
+    def addProject(self, run, project, wallTime, cpuTime, peakRSS, reports,
+                   status, files=()):
+        """Record the measurements of a project, and optionally of its files,
+        given as (file, wall time, CPU time, peak RSS, reports, exit status)
+        tuples. Times are in seconds and RSS in kilobytes."""
+        self.connection.execute(
+            "INSERT INTO projects VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run, project, wallTime, cpuTime, peakRSS, reports, status))
+        self.connection.executemany(
+            "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(run, project) + tuple(f) for f in files])
+        self.connection.commit()
+
+    def getRuns(self):
+        """Return the (id, started, reference, checkers) tuples of all runs."""
+        return self.connection.execute(
+            "SELECT id, started, reference, checkers FROM runs "
+            "ORDER BY id").fetchall()
+
+    def getLastRun(self, isReference=None, before=None, project=None):
+        """Return the ID of the last run with measurements, optionally of the
+        given kind, before a given run and measuring a given project, or
+        None."""
+        query = ("SELECT MAX(id) FROM runs WHERE EXISTS (SELECT 1 FROM "
+                 "projects p WHERE p.run = runs.id")
+        args = []
+        if project is not None:
+            query += " AND p.project = ?"
+            args.append(project)
+        query += ")"
+        if isReference is not None:
+            query += " AND reference = ?"
+            args.append(int(bool(isReference)))
+        if before is not None:
+            query += " AND id < ?"
+            args.append(before)
+        return self.connection.execute(query, args).fetchone()[0]
+
+    def getProjects(self, run):
+        """Return a dict from the projects of a run to their (wall time,
+        CPU time, peak RSS, reports, status) tuples."""
+        rows = self.connection.execute(
+            "SELECT project, wall_time, cpu_time, peak_rss, reports, status "
+            "FROM projects WHERE run = ?", (run,))
+        return dict((r[0], r[1:]) for r in rows)
+
+    def getFiles(self, run, project):
+        """Return a dict from the files of a project in a run to their (wall
+        time, CPU time, peak RSS, reports, exit status) tuples."""
+        rows = self.connection.execute(
+            "SELECT file, wall_time, cpu_time, peak_rss, reports, exit_status "
+            "FROM files WHERE run = ? AND project = ?", (run, project))
+        return dict((r[0], r[1:]) for r in rows)
+
+    def getReferenceTimes(self, project, file=None, before=None,
+                          limit=NumOfReferenceRuns):
+        """Return the wall times of a project (or of one of its files) in the
+        most recent successful reference runs."""
+        if file is None:
+            query = ("SELECT p.wall_time FROM projects p JOIN runs r "
+                     "ON p.run = r.id WHERE r.reference = 1 AND "
+                     "p.project = ? AND p.status = 'PASS'")
+            args = [project]
+        else:
+            query = ("SELECT f.wall_time FROM files f JOIN runs r "
+                     "ON f.run = r.id WHERE r.reference = 1 AND "
+                     "f.project = ? AND f.file = ? AND f.exit_status = 0")
+            args = [project, file]
+        if before is not None:
+            query += " AND r.id < ?"
+            args.append(before)
+        query += " ORDER BY r.id DESC LIMIT ?"
+        args.append(limit)
+        return [r[0] for r in self.connection.execute(query, args)]
+
+def mean(samples):
+    return sum(samples) / float(len(samples))
+
+def stddev(samples):
+    if len(samples) < 2:
+        return 0.0
+    m = mean(samples)
+    return math.sqrt(sum((s - m) ** 2 for s in samples) / (len(samples) - 1))
+
+def isSlower(new, history, threshold):
+    """Return whether a time is slower than the reference times by more than
+    the threshold (relative) and by more than the noise of the references."""
+    if not history:
+        return False
+    m = mean(history)
+    return new > m * (1 + threshold) and new - m > 3 * stddev(history)
+
+def signTest(slower, faster):
+    """Return the one sided p-value of getting at least 'slower' slowdowns
+    out of slower + faster changes, if both were equally likely."""
+    n = slower + faster
+    if n == 0:
+        return 1.0
+    p = 0.0
+    for k in range(slower, n + 1):
+        p += math.exp(math.lgamma(n + 1) - math.lgamma(k + 1) -
+                      math.lgamma(n - k + 1) - n * math.log(2))
+    return min(p, 1.0)
+
+def compareRuns(db, run, refRun, threshold=0.1, alpha=0.05):
+    """
+    compareRuns - Compare the times of a run to those of a reference run.
+
+    Returns a list of (project, file, reference time, new time, slower)
+    tuples, where file is None for the project as a whole, and slower
+    indicates a significant slowdown. Files are only listed for the projects
+    which got slower. The projects which are not in the reference run are
+    compared to the last reference run before it which measured them.
+    """
+    res = []
+    refProjects = db.getProjects(refRun)
+    for project, values in sorted(db.getProjects(run).items()):
+        if values[4] != 'PASS':
+            continue
+        projectRefRun = refRun
+        if project not in refProjects:
+            projectRefRun = db.getLastRun(True, refRun, project)
+            if projectRefRun is None:
+                continue
+        refTime = db.getProjects(projectRefRun)[project][0]
+        newTime = values[0]
+        history = db.getReferenceTimes(project, before=projectRefRun + 1)
+        slower = isSlower(newTime, history or [refTime], threshold)
+
+        # Preprocessed files projects also need most of their files to get
+        # slower: a single file is too noisy.
+        refFiles = db.getFiles(projectRefRun, project)
+        newFiles = db.getFiles(run, project)
+        common = [f for f in sorted(newFiles) if f in refFiles]
+        if common:
+            numSlower = len([f for f in common
+                             if newFiles[f][0] > refFiles[f][0]])
+            numFaster = len([f for f in common
+                             if newFiles[f][0] < refFiles[f][0]])
+            slower = slower and signTest(numSlower, numFaster) < alpha
+
+        res.append((project, None, refTime, newTime, slower))
+        if not slower:
+            continue
+        for f in common:
+            fileHistory = db.getReferenceTimes(project, f,
+                                               before=projectRefRun + 1)
+            res.append((project, f, refFiles[f][0], newFiles[f][0],
+                        isSlower(newFiles[f][0], fileHistory or
+                                 [refFiles[f][0]], threshold)))
+    return res
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser("usage: %prog [options] list|compare")
+    parser.add_option("", "--db", dest="db",
+                      help="The performance database [default=%default]",
+                      action="store", type=str, default=PerfDBName)
+    parser.add_option("", "--run", dest="run",
+                      help="The run to compare [default=the last run]",
+                      action="store", type=int, default=None)
+    parser.add_option("", "--reference", dest="reference",
+                      help="The run to compare to [default=the last "
+                           "reference run before RUN]",
+                      action="store", type=int, default=None)
+    parser.add_option("", "--threshold", dest="threshold",
+                      help="Relative slowdown to report [default=%default]",
+                      action="store", type=float, default=0.1)
+    parser.add_option("", "--alpha", dest="alpha",
+                      help="Significance level of the per file sign test "
+                           "[default=%default]",
+                      action="store", type=float, default=0.05)
+    (opts, args) = parser.parse_args()
+
+    if len(args) != 1 or args[0] not in ("list", "compare"):
+        parser.error("invalid command")
+    if not os.path.exists(opts.db):
+        parser.error("cannot find the performance database %s" % opts.db)
+
+    db = PerfDB(opts.db)
+    if args[0] == "list":
+        for id, started, reference, checkers in db.getRuns():
+            kind = "reference" if reference else "test"
+            print "%5d %s %-9s %d projects" % (
+                id, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started)),
+                kind, len(db.getProjects(id)))
+        return
+
+    run = opts.run
+    if run is None:
+        run = db.getLastRun()
+    refRun = opts.reference
+    if refRun is None and run is not None:
+        refRun = db.getLastRun(isReference=True, before=run)
+    if run is None or refRun is None:
+        parser.error("no runs to compare")
+
+    print "Comparing run %d to reference run %d" % (run, refRun)
+    numSlower = 0
+    for project, file, refTime, newTime, slower in compareRuns(
+            db, run, refRun, opts.threshold, opts.alpha):
+        name = project
+        if file is not None:
+            name = "  " + file
+        flag = ""
+        if slower:
+            flag = "  SLOWER"
+            if file is None:
+                numSlower += 1
+        ratio = float("inf")
+        if refTime > 0:
+            ratio = newTime / refTime
+        print "%-40s %10.2f %10.2f %8.3f%s" % (name, refTime, newTime,
+                                               ratio, flag)
+    if numSlower:
+        print "%d projects got slower." % numSlower
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
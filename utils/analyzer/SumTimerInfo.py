@@ -6,6 +6,7 @@ Script to Summarize statistics in the scan-build output.
 Statistics are enabled by passing '-internal-stats' option to scan-build 
 (or '-analyzer-stats' to the analyzer).
 
+See AnalyzerStats.py for statistics per translation unit.
 """
 
 import string